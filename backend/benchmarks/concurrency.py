@@ -0,0 +1,125 @@
+"""
+Compares request latency under concurrency when database calls block the event loop
+against when they are offloaded through `database.Session`.
+
+Each simulated request runs one `SELECT SLEEP(...)` query, standing in for a slow
+round-trip. While the requests are in flight, a probe coroutine measures how late
+the event loop wakes it up, which is the delay every other request on the worker
+would see.
+
+Usage (from `backend/`, with the `database` service from `docker-compose.yaml` up):
+
+    python benchmarks/concurrency.py --requests 200 --concurrency 50 --query-time 0.02
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "segmentation_fault"))
+
+from database import pool, session  # noqa: E402
+
+PROBE_INTERVAL = 0.005
+""" The number of seconds between event loop lag probes. """
+
+
+async def blocking_request(query_time: float) -> None:
+    # The behaviour before offloading: the driver runs directly on the event loop.
+    with pool.connection() as connection:
+        with connection.dict_cursor() as cursor:
+            cursor.execute("SELECT SLEEP(%s)", (query_time,))
+            cursor.fetchone()
+
+
+async def offloaded_request(query_time: float) -> None:
+    async with session() as db:
+        await db.fetch_one("SELECT SLEEP(%s)", (query_time,))
+
+
+async def probe(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run(request, requests: int, concurrency: int, query_time: float) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    lags: list[float] = []
+
+    async def timed() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await request(query_time)
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(timed() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+
+    return {
+        "throughput": requests / elapsed,
+        "latency": percentiles(latencies),
+        "loop_lag": percentiles(lags or [0.0]),
+    }
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    quantiles = (
+        statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    )
+    return {
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "max": max(samples),
+    }
+
+
+def report(name: str, result: dict) -> None:
+    latency, lag = result["latency"], result["loop_lag"]
+    print(
+        f"{name:<10} {result['throughput']:>8.1f} req/s"
+        f"  latency p50 {latency['p50'] * 1000:>7.1f}ms p95 {latency['p95'] * 1000:>7.1f}ms"
+        f" p99 {latency['p99'] * 1000:>7.1f}ms"
+        f"  loop lag p99 {lag['p99'] * 1000:>7.1f}ms max {lag['max'] * 1000:>7.1f}ms"
+    )
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--query-time", type=float, default=0.02)
+    args = parser.parse_args()
+
+    pool.open()
+    try:
+        for name, request in (
+            ("blocking", blocking_request),
+            ("offloaded", offloaded_request),
+        ):
+            report(
+                name,
+                await run(request, args.requests, args.concurrency, args.query_time),
+            )
+    finally:
+        pool.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,583 @@
+"""
+An end-to-end load benchmark: seeds the database with a dataset of a given size,
+serves the API against it, and drives a mix of logins, feed reads, post pages, votes
+and comments through it over HTTP, reporting the throughput and p50, p95 and p99
+latency of each route.
+
+Seeding writes IDs, paths and counters directly, so it needs empty tables; pass
+`--reset` to empty them first, which deletes every user, post, comment and vote. It
+is skipped if the tables already hold a dataset of the requested size, so repeated
+runs reuse it. The same `--seed` seeds the same dataset.
+
+The API is served by `uvicorn` with `--workers` processes and the environment of
+`.env`, unless `--url` points at one already running. Comments enqueue notifications
+for post authors, so point `MAILGUN_API_BASE_URL` at the stand-in of
+`benchmarks/mailgun.py` to keep them local.
+
+Results are saved as JSON with the commit they were run at, so runs of different
+commits can be compared with `--compare`.
+
+Usage (from `backend/`, with the `database` service from `docker-compose.yaml` up):
+
+    python benchmarks/load.py --reset --users 1000 --posts 5000 --comments 20000
+    python benchmarks/load.py --duration 60 --concurrency 64 --output before.json
+    python benchmarks/load.py --compare before.json --output after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from itertools import accumulate
+from pathlib import Path
+
+import aiohttp
+import bcrypt
+from dotenv import load_dotenv
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+load_dotenv(BACKEND / ".env")
+sys.path.insert(0, str(BACKEND / "segmentation_fault"))
+
+from commands.migrate import migrate  # noqa: E402
+from controllers.comments import COMMENT_MAX_DEPTH, COMMENT_PATH_WIDTH  # noqa: E402
+from database import pool  # noqa: E402
+from passwords import BCRYPT_ROUNDS  # noqa: E402
+
+PASSWORD = "load-benchmark"
+""" The password of every seeded user. """
+
+TABLES = (
+    "LiveEvents",
+    "Notifications",
+    "Votes",
+    "Comments",
+    "Posts",
+    "Tokens",
+    "Users",
+    "Images",
+)
+""" The tables emptied by `--reset`, dependents first. """
+
+INSERT_BATCH_SIZE = 1000
+""" The number of rows seeded per statement. """
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua segmentation fault core dumped pointer stack heap kernel thread mutex".split()
+""" The words seeded posts and comments are made of. """
+
+MIX = "login=2,feed=30,post=40,vote=20,comment=8"
+""" The default weights of each action driven. """
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+
+def popularity(count: int) -> list[float]:
+    # Zipf-like, so a few posts draw most of the reads, votes and comments.
+    return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+def seed(args) -> dict[str, int]:
+    """Seeds the dataset, unless it is already seeded, and returns its size."""
+    migrate(dry_run=False)
+
+    with pool.connection() as connection:
+        with connection.dict_cursor() as cursor:
+            if args.reset:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+                for table in TABLES:
+                    cursor.execute(f"TRUNCATE TABLE {table}")
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+            cursor.execute(
+                "SELECT (SELECT COUNT(*) FROM Users) AS users, (SELECT COUNT(*) FROM Posts) AS posts, (SELECT COUNT(*) FROM Comments) AS comments, (SELECT COUNT(*) FROM Votes) AS votes"
+            )
+            counts = cursor.fetchone()
+            requested = {
+                "users": args.users,
+                "posts": args.posts,
+                "comments": args.comments,
+                "votes": args.votes,
+            }
+            if counts == requested:
+                print("dataset already seeded")
+                return requested
+            if any(counts.values()):
+                raise SystemExit(
+                    f"The database holds another dataset ({counts}), pass --reset to empty it"
+                )
+
+            started = time.perf_counter()
+            for table, columns, rows in dataset(args):
+                for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                    cursor.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                        rows[start : start + INSERT_BATCH_SIZE],
+                    )
+            connection.commit()
+            print(f"seeded {requested} in {time.perf_counter() - started:.1f}s")
+
+    return requested
+
+
+def dataset(args) -> list[tuple[str, tuple[str, ...], list[tuple]]]:
+    """Returns the rows of each table of the dataset, with consistent counters."""
+    rng = random.Random(args.seed)
+    now = datetime.now().replace(microsecond=0)
+    password = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(BCRYPT_ROUNDS))
+
+    def created() -> datetime:
+        return now - timedelta(seconds=rng.randrange(args.days * 86400))
+
+    users = [
+        (
+            id,
+            created(),
+            f"load{id}",
+            f"load{id}@example.com",
+            password,
+            "Load",
+            f"User {id}",
+            1,
+        )
+        for id in range(1, args.users + 1)
+    ]
+
+    posts = {
+        id: {
+            "id": id,
+            "created": created(),
+            "author": rng.randint(1, args.users),
+            "title": text(rng, rng.randint(3, 10))[:100],
+            "content": text(rng, rng.randint(20, 120))[:1000],
+            "upvotes": 0,
+            "downvotes": 0,
+            "comment_count": 0,
+        }
+        for id in range(1, args.posts + 1)
+    }
+    weights = popularity(args.posts)
+
+    comments: dict[int, dict] = {}
+    threads: dict[int, list[int]] = {}
+    for id in range(1, args.comments + 1):
+        post = rng.choices(range(1, args.posts + 1), cum_weights=weights)[0]
+        thread = threads.setdefault(post, [])
+        parent = rng.choice(thread) if thread and rng.random() < 0.5 else None
+        if parent is not None and comments[parent]["depth"] + 1 >= COMMENT_MAX_DEPTH:
+            parent = None
+
+        ancestor = comments[parent] if parent is not None else None
+        comments[id] = {
+            "id": id,
+            "created": max(created(), posts[post]["created"]),
+            "author": rng.randint(1, args.users),
+            "post": post,
+            "content": text(rng, rng.randint(5, 60)),
+            "parent": parent,
+            "depth": ancestor["depth"] + 1 if ancestor else 0,
+            "path": (ancestor["path"] if ancestor else "")
+            + f"{id:0{COMMENT_PATH_WIDTH}X}",
+            "upvotes": 0,
+            "downvotes": 0,
+            "reply_count": 0,
+        }
+        thread.append(id)
+        posts[post]["comment_count"] += 1
+        if ancestor:
+            ancestor["reply_count"] += 1
+
+    votes, voted = [], set()
+    while len(votes) < min(args.votes, args.users * (args.posts + args.comments)):
+        user = rng.randint(1, args.users)
+        if args.comments and rng.random() < 0.5:
+            parent, kind = comments[rng.randint(1, args.comments)], "comment"
+        else:
+            post = rng.choices(range(1, args.posts + 1), cum_weights=weights)[0]
+            parent, kind = posts[post], "post"
+        if (kind, parent["id"], user) in voted:
+            continue
+
+        voted.add((kind, parent["id"], user))
+        up = rng.random() < 0.75
+        parent["upvotes" if up else "downvotes"] += 1
+        votes.append(
+            (
+                user,
+                "true" if up else "false",
+                parent["id"] if kind == "comment" else None,
+                parent["id"] if kind == "post" else None,
+            )
+        )
+
+    post_columns = (
+        "id",
+        "created",
+        "author",
+        "title",
+        "content",
+        "upvotes",
+        "downvotes",
+        "comment_count",
+    )
+    comment_columns = (
+        "id",
+        "created",
+        "author",
+        "post",
+        "content",
+        "parent",
+        "depth",
+        "path",
+        "upvotes",
+        "downvotes",
+        "reply_count",
+    )
+    return [
+        (
+            "Users",
+            (
+                "id",
+                "created",
+                "username",
+                "email",
+                "password",
+                "first_name",
+                "last_name",
+                "verified",
+            ),
+            users,
+        ),
+        (
+            "Posts",
+            (*post_columns, "score"),
+            [
+                (
+                    *(post[column] for column in post_columns),
+                    post["upvotes"] - post["downvotes"],
+                )
+                for post in posts.values()
+            ],
+        ),
+        (
+            "Comments",
+            (*comment_columns, "score"),
+            [
+                (
+                    *(comment[column] for column in comment_columns),
+                    comment["upvotes"] - comment["downvotes"],
+                )
+                for comment in comments.values()
+            ],
+        ),
+        ("Votes", ("user", "type", "parent_comment", "parent_post"), votes),
+    ]
+
+
+class Load:
+    """Drives a mix of actions against the API as a number of concurrent users."""
+
+    def __init__(self, args, client: aiohttp.ClientSession):
+        self.args = args
+        self.client = client
+        self.rng = random.Random(args.seed)
+        self.mix = {
+            name: float(weight)
+            for name, weight in (entry.split("=") for entry in args.mix.split(","))
+        }
+        self.weights = popularity(args.posts)
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.measuring = False
+
+    async def run(self) -> float:
+        """Runs the warm-up and the measured duration, and returns the latter."""
+        users = [asyncio.create_task(self.user()) for _ in range(self.args.concurrency)]
+        await asyncio.sleep(self.args.warmup)
+
+        self.measuring = True
+        started = time.perf_counter()
+        await asyncio.sleep(self.args.duration)
+        self.measuring = False
+        measured = time.perf_counter() - started
+
+        for user in users:
+            user.cancel()
+        await asyncio.gather(*users, return_exceptions=True)
+        return measured
+
+    async def user(self) -> None:
+        token = await self.login()
+        actions = list(self.mix)
+        weights = list(self.mix.values())
+        while True:
+            action = self.rng.choices(actions, weights)[0]
+            if action == "login":
+                token = await self.login() or token
+            elif token is not None:
+                await getattr(self, action)({"Authorization": f"Bearer {token}"})
+            else:
+                token = await self.login()
+
+    async def login(self) -> str | None:
+        user = self.rng.randint(1, self.args.users)
+        response = await self.request(
+            "POST /auth/login",
+            "POST",
+            "/auth/login",
+            data={"username": f"load{user}", "password": PASSWORD},
+        )
+        return response["access_token"] if response else None
+
+    async def feed(self, headers: dict) -> None:
+        sort = self.rng.choice(["hot", "top", "new"])
+        await self.request(
+            f"GET /posts/feed?sort={sort}",
+            "GET",
+            "/posts/feed",
+            headers=headers,
+            params={"sort": sort},
+        )
+
+    async def post(self, headers: dict) -> None:
+        post = self.popular_post()
+        await self.request("GET /posts/{id}", "GET", f"/posts/{post}", headers=headers)
+        await self.request(
+            "GET /posts/{id}/thread", "GET", f"/posts/{post}/thread", headers=headers
+        )
+
+    async def vote(self, headers: dict) -> None:
+        await self.request(
+            "POST /posts/{id}/vote",
+            "POST",
+            f"/posts/{self.popular_post()}/vote",
+            headers=headers,
+            params={"type": self.rng.choice(["true", "true", "true", "false", "null"])},
+        )
+
+    async def comment(self, headers: dict) -> None:
+        await self.request(
+            "POST /comments/",
+            "POST",
+            "/comments/",
+            headers=headers,
+            json={
+                "post": self.popular_post(),
+                "content": text(self.rng, self.rng.randint(5, 30)),
+            },
+        )
+
+    def popular_post(self) -> int:
+        return self.rng.choices(
+            range(1, self.args.posts + 1), cum_weights=self.weights
+        )[0]
+
+    async def request(self, route: str, method: str, path: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with self.client.request(method, path, **kwargs) as response:
+                body = await response.read()
+                ok = response.status < 400
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            body, ok = b"", False
+        latency = time.perf_counter() - started
+
+        if self.measuring:
+            self.latencies.setdefault(route, []).append(latency)
+            self.errors[route] = self.errors.get(route, 0) + (not ok)
+        return json.loads(body) if ok and body else None
+
+    def results(self, duration: float) -> dict:
+        """Returns the throughput and latency of each route, and of all of them."""
+
+        def summary(latencies: list[float], errors: int) -> dict:
+            latencies = sorted(latencies)
+            return {
+                "requests": len(latencies),
+                "errors": errors,
+                "throughput": len(latencies) / duration,
+                "mean": statistics.mean(latencies) * 1e3 if latencies else 0.0,
+                **{
+                    f"p{percent}": percentile(latencies, percent) * 1e3
+                    for percent in (50, 95, 99)
+                },
+            }
+
+        return {
+            "routes": {
+                route: summary(latencies, self.errors[route])
+                for route, latencies in sorted(self.latencies.items())
+            },
+            "total": summary(
+                [
+                    latency
+                    for latencies in self.latencies.values()
+                    for latency in latencies
+                ],
+                sum(self.errors.values()),
+            ),
+        }
+
+
+def percentile(latencies: list[float], percent: int) -> float:
+    if not latencies:
+        return 0.0
+    return latencies[min(len(latencies) - 1, len(latencies) * percent // 100)]
+
+
+async def drive(args, url: str) -> dict:
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(
+        url, connector=connector, timeout=aiohttp.ClientTimeout(total=30)
+    ) as client:
+        load = Load(args, client)
+        duration = await load.run()
+    return {"duration": duration, **load.results(duration)}
+
+
+def serve(args) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app:app",
+            "--port",
+            str(args.port),
+            "--workers",
+            str(args.workers),
+            "--env-file",
+            str(BACKEND / ".env"),
+            "--no-access-log",
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND / "segmentation_fault",
+        env=os.environ | {"MIGRATE_ON_STARTUP": "False"},
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"The server exited with status {server.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/docs")
+            return server
+        except OSError:
+            time.sleep(0.5)
+
+    server.terminate()
+    raise SystemExit("The server did not start within 30 seconds")
+
+
+def commit() -> str:
+    try:
+        sha = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "diff", "--quiet", "HEAD"], cwd=BACKEND
+        ).returncode
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{sha}-dirty" if dirty else sha
+
+
+def report(results: dict, previous: dict | None) -> None:
+    print(
+        f"{'route':<28} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    rows = {**results["routes"], "total": results["total"]}
+    before = {**previous["routes"], "total": previous["total"]} if previous else {}
+    for route, stats in rows.items():
+        print(
+            f"{route:<28} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput']:>9.1f}"
+            f" {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f}"
+        )
+        if (old := before.get(route)) is not None:
+            print(
+                f"{'  vs ' + previous['commit']:<28} {'':>9} {'':>7}"
+                + "".join(
+                    f" {change(old[key], stats[key]):>9}"
+                    for key in ("throughput", "p50", "p95", "p99")
+                )
+            )
+
+
+def change(old: float, new: float) -> str:
+    return f"{(new - old) / old * 100:+.0f}%" if old else "-"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--votes", type=int, default=50000)
+    parser.add_argument(
+        "--days", type=int, default=30, help="how far back content is dated"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reset", action="store_true", help="empty the tables first")
+    parser.add_argument(
+        "--mix", default=MIX, help="weights of login, feed, post, vote and comment"
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent users")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--url", help="an API already running, rather than serving one")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="where to save the results as JSON")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    dataset = seed(args)
+    pool.close()
+
+    server = None if args.url else serve(args)
+    try:
+        results = asyncio.run(drive(args, args.url or f"http://127.0.0.1:{args.port}"))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = {
+        "commit": commit(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "arguments": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "reset")
+        },
+        "dataset": dataset,
+        **results,
+    }
+
+    previous = None
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text())
+    report(results, previous)
+
+    output = Path(args.output or f"load-{results['commit']}.json")
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"saved {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+A local stand-in for the Mailgun API, and a benchmark of sending emails through it
+with `communications.Mailer`'s pooled connections against a new connection per
+email, as `requests.post` did.
+
+The stand-in answers every `POST .../messages` after `--latency` seconds, plus
+`--handshake` seconds on the first request of each connection to stand in for TLS
+setup, and fails `--failure-rate` of them with a 503 so that retries can be
+observed.
+
+Usage (from `backend/`):
+
+    python benchmarks/mailgun.py --emails 500 --latency 0.02
+
+To run only the stand-in, and point the API's outbox at it with
+`MAILGUN_API_BASE_URL = "http://localhost:8025/"`:
+
+    python benchmarks/mailgun.py --serve --port 8025
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "segmentation_fault"))
+
+from controllers.communications import DeliveryError, Email, Mailer  # noqa: E402
+
+DOMAIN = "example.com"
+""" The domain the benchmark sends emails from. """
+
+
+def stand_in(latency: float, handshake: float, failure_rate: float) -> web.Application:
+    received: list[dict] = []
+    connections: set[int] = set()
+
+    async def messages(request: web.Request) -> web.Response:
+        received.append(dict(await request.post()))
+        if (connection := id(request.transport)) not in connections:
+            connections.add(connection)
+            await asyncio.sleep(handshake)
+        await asyncio.sleep(latency)
+        if random.random() < failure_rate:
+            return web.json_response({"message": "Try again"}, status=503)
+        return web.json_response({"id": f"<{len(received)}@{DOMAIN}>"})
+
+    app = web.Application()
+    app["received"] = received
+    app["connections"] = connections
+    app.router.add_post("/{domain}/messages", messages)
+    return app
+
+
+async def send_all(mailer_factory, emails: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    failures = 0
+
+    async def send(mailer: Mailer, index: int) -> None:
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await mailer.send(
+                    Email(f"user{index}@{DOMAIN}", "Benchmark", "Hello, world!")
+                )
+            except DeliveryError:
+                failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(mailer_factory(), index) for index in range(emails)))
+    elapsed = time.perf_counter() - started
+    await mailer_factory.close()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "throughput": emails / elapsed,
+        "p50": quantiles[49],
+        "p99": quantiles[98],
+        "failures": failures,
+    }
+
+
+class Pooled:
+    """One mailer, whose connections are reused for every email."""
+
+    def __init__(self, base_url: str, connections: int):
+        self.mailer = Mailer(base_url, DOMAIN, "key", connections, 10)
+
+    def __call__(self) -> Mailer:
+        return self.mailer
+
+    async def close(self) -> None:
+        await self.mailer.close()
+
+
+class Unpooled:
+    """A new mailer, and so a new connection, for every email."""
+
+    def __init__(self, base_url: str, connections: int):
+        self.base_url = base_url
+        self.mailers: list[Mailer] = []
+
+    def __call__(self) -> Mailer:
+        self.mailers.append(Mailer(self.base_url, DOMAIN, "key", 1, 10))
+        return self.mailers[-1]
+
+    async def close(self) -> None:
+        await asyncio.gather(*(mailer.close() for mailer in self.mailers))
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--handshake", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--serve", action="store_true")
+    args = parser.parse_args()
+
+    app = stand_in(args.latency, args.handshake, args.failure_rate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "localhost", args.port).start()
+    base_url = f"http://localhost:{args.port}/"
+
+    try:
+        if args.serve:
+            print(f"Mailgun stand-in listening on {base_url}")
+            await asyncio.Event().wait()
+
+        for name, factory in (("unpooled", Unpooled), ("pooled", Pooled)):
+            result = await send_all(
+                factory(base_url, args.connections), args.emails, args.concurrency
+            )
+            print(
+                f"{name:<10} {result['throughput']:>8.1f} emails/s"
+                f"  latency p50 {result['p50'] * 1000:>7.1f}ms"
+                f" p99 {result['p99'] * 1000:>7.1f}ms"
+                f"  failures {result['failures']}"
+            )
+    finally:
+        await runner.cleanup()
+
+    print(
+        f"stand-in received {len(app['received'])} emails"
+        f" over {len(app['connections'])} connections"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,209 @@
+"""
+Checks `response_cache.ResponseCache` against each of its backends, and compares
+serving a cached response with producing one.
+
+The memcached backend is run against a memcached server if `--url` is given, and
+otherwise against a minimal stand-in speaking the commands it uses, started in this
+process. The stand-in can also be run on its own with `--serve`.
+
+Produced responses are a page of `--rows` posts, built and serialised as the routes
+do, so the comparison is of the work a hit saves other than the query.
+
+Usage (from `backend/`):
+
+    python benchmarks/memcached.py --iterations 5000
+    python benchmarks/memcached.py --url memcached://localhost:11211
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "segmentation_fault"))
+
+from response_cache import LocalBackend, MemcachedBackend, ResponseCache  # noqa: E402
+from schemas.posts import Post  # noqa: E402
+
+
+class StandIn:
+    """An in-memory server speaking the memcached commands the cache uses."""
+
+    def __init__(self):
+        self.values: dict[bytes, tuple[bytes, float]] = {}
+
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, host, port)
+
+    def _get(self, key: bytes) -> bytes | None:
+        value, expires = self.values.get(key, (None, 0))
+        if value is not None and expires and expires < time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    async def _handle(self, reader, writer) -> None:
+        try:
+            while line := await reader.readline():
+                command, *args = line.split()
+                if command == b"get":
+                    for key in args:
+                        if (value := self._get(key)) is not None:
+                            writer.write(
+                                b"VALUE %s 0 %d\r\n%s\r\n" % (key, len(value), value)
+                            )
+                    writer.write(b"END\r\n")
+                elif command in (b"set", b"add"):
+                    key, _, ttl, size = args
+                    value = (await reader.readexactly(int(size) + 2))[:-2]
+                    if command == b"add" and self._get(key) is not None:
+                        writer.write(b"NOT_STORED\r\n")
+                    else:
+                        expires = time.monotonic() + int(ttl) if int(ttl) else 0
+                        self.values[key] = (value, expires)
+                        writer.write(b"STORED\r\n")
+                elif command == b"incr":
+                    key, amount = args
+                    if (value := self._get(key)) is None:
+                        writer.write(b"NOT_FOUND\r\n")
+                    else:
+                        value = b"%d" % (int(value) + int(amount))
+                        self.values[key] = (value, self.values[key][1])
+                        writer.write(value + b"\r\n")
+                else:
+                    writer.write(b"ERROR\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def page(rows: int) -> list[Post]:
+    now = datetime.now().replace(microsecond=0)
+    return [
+        Post(
+            id=id,
+            created=now,
+            updated=None,
+            author=1,
+            title=f"Post {id}",
+            content="Lorem ipsum dolor sit amet " * 20,
+        )
+        for id in range(rows)
+    ]
+
+
+async def check(cache: ResponseCache) -> None:
+    produced = 0
+
+    async def produce():
+        nonlocal produced
+        produced += 1
+        return page(2)
+
+    async def get():
+        return (await cache.respond("check route", "1 2", ["post:1"], produce)).body
+
+    # The first lookup starts the generation, the second caches and the third hits.
+    first = await get()
+    assert await get() == first and produced == 2
+    assert await get() == first and produced == 2, "response was not served cached"
+    await cache.invalidate("post:1")
+    assert await get() == first and produced == 3, "invalidation was not seen"
+    assert await get() == first and produced == 3
+
+
+async def measure(cache: ResponseCache, rows: int, iterations: int) -> dict:
+    posts = page(rows)
+
+    async def produce():
+        return posts
+
+    async def cached():
+        await cache.respond("measure", str(rows), ["posts"], produce)
+
+    async def uncached():
+        await cache.invalidate("posts")
+        await cache.respond("measure", str(rows), ["posts"], produce)
+
+    results = {}
+    for name, respond in (("cached", cached), ("produced", uncached)):
+        for _ in range(3):
+            await respond()
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await respond()
+            latencies.append(time.perf_counter() - started)
+        results[name] = sorted(latencies)
+    return results
+
+
+async def run(args) -> int:
+    server = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 11211
+    else:
+        server = await StandIn().serve("127.0.0.1", 0)
+        host, port = server.sockets[0].getsockname()[:2]
+
+    backends = {
+        "local": LocalBackend(4096, 60),
+        "memcached": MemcachedBackend(host, port, 10, 1, 60),
+    }
+    for name, backend in backends.items():
+        cache = ResponseCache(backend)
+        await check(cache)
+
+        print(name)
+        results = await measure(cache, args.rows, args.iterations)
+        for kind, latencies in results.items():
+            print(
+                f"  {kind:<9} mean {statistics.mean(latencies) * 1e6:>8.1f}us"
+                f"  p50 {latencies[len(latencies) // 2] * 1e6:>8.1f}us"
+                f"  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:>8.1f}us"
+            )
+        print(
+            f"  speedup   {statistics.mean(results['produced']) / statistics.mean(results['cached']):.2f}x"
+        )
+        await cache.close()
+
+    if server is not None:
+        # Let the stand-in see the connections closed before stopping it.
+        await asyncio.sleep(0.1)
+        server.close()
+        await server.wait_closed()
+    return 0
+
+
+async def serve(port: int) -> None:
+    server = await StandIn().serve("0.0.0.0", port)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="a memcached:// server to use")
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument(
+        "--serve", type=int, metavar="PORT", help="only run the stand-in"
+    )
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.serve))
+        return 0
+
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
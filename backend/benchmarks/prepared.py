@@ -0,0 +1,125 @@
+"""
+Compares executing the hottest controller statements as text, as every statement
+was before, against executing them by handle through `database.PreparedStatements`.
+
+Each statement is executed `--iterations` times on one connection with each
+protocol, against rows already in the database, so run it against a seeded database
+such as one left by the load benchmark. Both protocols read every row, so the
+difference is parsing, planning and the round trips the driver makes per statement.
+
+Usage (from `backend/`, with the `database` service from `docker-compose.yaml` up):
+
+    python benchmarks/prepared.py --iterations 5000
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "segmentation_fault"))
+
+from controllers.comments import COMMENTS  # noqa: E402
+from controllers.posts import POSTS  # noqa: E402
+from controllers.users import USER_COLUMNS  # noqa: E402
+from database import PreparedStatements, pool  # noqa: E402
+from repository import select_statement  # noqa: E402
+
+
+def statements(connection) -> dict[str, tuple[str, tuple]]:
+    with connection.dict_cursor() as cursor:
+        cursor.execute("SELECT id, username FROM Users ORDER BY id LIMIT 1")
+        user = cursor.fetchone()
+        cursor.execute("SELECT id FROM Posts ORDER BY id LIMIT 1")
+        post = cursor.fetchone()
+        cursor.execute("SELECT id FROM Comments ORDER BY id LIMIT 1")
+        comment = cursor.fetchone()
+
+    if not (user and post and comment):
+        raise SystemExit("The database needs a user, a post and a comment")
+
+    return {
+        "user by username": (
+            f"SELECT {USER_COLUMNS} FROM Users WHERE username = %s",
+            (user["username"],),
+        ),
+        "post": (
+            select_statement("Posts", POSTS.columns, "id", False),
+            (post["id"],),
+        ),
+        "comment": (
+            select_statement("Comments", COMMENTS.columns, "id", False),
+            (comment["id"],),
+        ),
+        "post votes": ("SELECT score FROM Posts WHERE id = %s", (post["id"],)),
+        "post vote": (
+            "SELECT type FROM Votes WHERE parent_post = %s AND user = %s",
+            (post["id"], user["id"]),
+        ),
+    }
+
+
+def text(connection, query: str, params: tuple) -> None:
+    with connection.dict_cursor() as cursor:
+        cursor.execute(query, params)
+        cursor.fetchall()
+
+
+def prepared(registry: PreparedStatements, query: str, params: tuple) -> None:
+    registry.execute(query, params).fetchall()
+
+
+def measure(execute, iterations: int) -> list[float]:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        execute()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    with pool.connection() as connection:
+        registry = PreparedStatements(connection, 100)
+
+        for name, (query, params) in statements(connection).items():
+            # Statements are prepared the second time they are executed.
+            for _ in range(2):
+                if (cursor := registry.execute(query, params)) is not None:
+                    cursor.fetchall()
+
+            results = {
+                "text": measure(
+                    lambda: text(connection, query, params), args.iterations
+                ),
+                "prepared": measure(
+                    lambda: prepared(registry, query, params), args.iterations
+                ),
+            }
+
+            print(name)
+            for protocol, latencies in results.items():
+                latencies.sort()
+                print(
+                    f"  {protocol:<9} mean {statistics.mean(latencies) * 1e6:>8.1f}us"
+                    f"  p50 {latencies[len(latencies) // 2] * 1e6:>8.1f}us"
+                    f"  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:>8.1f}us"
+                )
+            print(
+                f"  speedup   {statistics.mean(results['text']) / statistics.mean(results['prepared']):.2f}x"
+            )
+
+    pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
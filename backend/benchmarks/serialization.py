@@ -0,0 +1,126 @@
+"""
+Compares serialising a page of rows as list endpoints did before, validating models
+built from the rows and then the route's response model and encoding them with
+`jsonable_encoder` and `json`, against building them with `repository.from_row` and
+rendering them with `responses.ModelJSONResponse`.
+
+Rows are generated as the database driver returns them, `--rows` of them per page,
+for the models of each list endpoint. Both paths are checked to produce the same
+JSON before they are timed.
+
+Usage (from `backend/`):
+
+    python benchmarks/serialization.py --rows 10000 --iterations 20
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "segmentation_fault"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from repository import from_row  # noqa: E402
+from responses import ModelJSONResponse  # noqa: E402
+from schemas.comments import Comment, ThreadComment  # noqa: E402
+from schemas.posts import FeedPost, Post  # noqa: E402
+from schemas.users import User  # noqa: E402
+
+VOTES = ("true", "false", "null")
+
+
+def rows(model: type, count: int) -> list[dict[str, Any]]:
+    created = datetime(2023, 1, 1)
+    generated = []
+    for id in range(1, count + 1):
+        row = {
+            "id": id,
+            "created": created + timedelta(seconds=id),
+            "updated": None if id % 3 else created + timedelta(seconds=2 * id),
+            "author": id % 97 + 1,
+            "title": f"Post {id}",
+            "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+            "post": id % 211 + 1,
+            "parent": None,
+            "depth": 0,
+            "upvotes": id % 13,
+            "downvotes": id % 5,
+            "score": id % 13 - id % 5,
+            "comments": id % 7,
+            "reply_count": id % 3,
+            "vote": VOTES[id % 3],
+            "username": f"user{id}",
+            "email": f"user{id}@example.com",
+            "super": int(id == 1),
+            "first_name": "First",
+            "last_name": "Last",
+            "verified": id % 2,
+        }
+        generated.append({key: row[key] for key in row if key in model.__fields__})
+    return generated
+
+
+def before(model: type, page: list[dict[str, Any]], field) -> bytes:
+    content = [model(**row) for row in page]
+    encoded = asyncio.run(serialize_response(field=field, response_content=content))
+    return JSONResponse(encoded).body
+
+
+def after(model: type, page: list[dict[str, Any]]) -> bytes:
+    return ModelJSONResponse([from_row(model, row) for row in page]).body
+
+
+def measure(run, iterations: int) -> list[float]:
+    run()
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    for model in (Post, FeedPost, Comment, ThreadComment, User):
+        page = rows(model, args.rows)
+        field = create_response_field(
+            name=f"Response_{model.__name__}", type_=list[model]
+        )
+        assert json.loads(before(model, page, field)) == json.loads(
+            after(model, page)
+        ), f"{model.__name__} serialised differently"
+
+        results = {
+            "before": measure(lambda: before(model, page, field), args.iterations),
+            "after": measure(lambda: after(model, page), args.iterations),
+        }
+
+        print(f"{model.__name__} ({args.rows} rows)")
+        for path, latencies in results.items():
+            print(
+                f"  {path:<7} mean {statistics.mean(latencies) * 1e3:>8.1f}ms"
+                f"  p50 {latencies[len(latencies) // 2] * 1e3:>8.1f}ms"
+                f"  p99 {latencies[int(len(latencies) * 0.99)] * 1e3:>8.1f}ms"
+            )
+        print(
+            f"  speedup {statistics.mean(results['before']) / statistics.mean(results['after']):.2f}x"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
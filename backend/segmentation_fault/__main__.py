@@ -1,5 +1,8 @@
+import argparse
+import asyncio
+import shutil
 import sys
-from os import getenv
+from os import getenv, makedirs
 
 import uvicorn
 from dotenv import load_dotenv
@@ -8,6 +11,61 @@ load_dotenv()
 
 
 def main() -> int:
+    parser = argparse.ArgumentParser(prog="segmentation_fault")
+    commands = parser.add_subparsers(dest="command")
+
+    reconcile_parser = commands.add_parser(
+        "reconcile", help="recompute post and comment counters and report drift"
+    )
+    reconcile_parser.add_argument("--batch-size", type=int, default=1000)
+    reconcile_parser.add_argument(
+        "--dry-run", action="store_true", help="report drift without correcting it"
+    )
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="apply pending schema migrations, before starting the server"
+    )
+    migrate_parser.add_argument(
+        "--dry-run", action="store_true", help="list pending migrations only"
+    )
+
+    commands.add_parser(
+        "explain", help="report statements whose query plans scan a whole table"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "reconcile":
+        from commands.reconcile import reconcile
+
+        return asyncio.run(reconcile(args.batch_size, args.dry_run))
+
+    if args.command == "migrate":
+        from commands.migrate import migrate
+
+        return migrate(args.dry_run)
+
+    if args.command == "explain":
+        from commands.explain import explain
+
+        return asyncio.run(explain())
+
+    return serve()
+
+
+def serve() -> int:
+    # Deployments run `migrate` once before starting servers, rather than every
+    # server migrating as it starts.
+    if getenv("MIGRATE_ON_STARTUP", "False") == "True":
+        from commands.migrate import migrate
+
+        migrate(dry_run=False)
+
+    # Start the workers' metrics from zero, before any worker writes them.
+    if metrics_dir := getenv("PROMETHEUS_MULTIPROC_DIR"):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        makedirs(metrics_dir)
+
     config = uvicorn.Config(
         access_log=True,
         app="app:app",
@@ -1,10 +1,30 @@
 from os import getenv
 
-from fastapi import FastAPI
+from cache import CACHES
+from controllers.communications import MAILER
+from database import PoolTimeout, pool
+from dependencies.monitoring import monitoring_token
+from fastapi import APIRouter, Depends, FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from routes import auth, comments, posts, users
+from live import LIVE_BROKER
+from metrics import STATS_EXPORTER, MetricsMiddleware, mark_worker_stopped, render
+from notifications import NOTIFICATION_WORKER
+from pagination import NEXT_CURSOR_HEADER
+from prometheus_client import CONTENT_TYPE_LATEST
+from response_cache import RESPONSE_CACHE
+from responses import ModelJSONResponse
+from routes import auth, batch, comments, live, posts, users
+from schemas.cache import CacheStats, ResponseCacheStats
+from schemas.database import PoolStats
+from schemas.live import LiveStats
+from schemas.notifications import NotificationStats
+from schemas.votes import VoteBufferStats
+from schemas.workers import WorkerPoolStats
+from votes import VOTE_BUFFER
+from workers import WORKER_POOLS, WorkerPoolFull
 
 TITLE: str = "Segmentation Fault API"
 """ Title of the API. """
@@ -22,6 +42,7 @@ app = FastAPI(
     docs_url=None,
     redoc_url=None,
     debug=getenv("DEBUG") == "True",
+    default_response_class=ModelJSONResponse,
 )
 """ The API application. """
 
@@ -31,8 +52,98 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+app.add_middleware(MetricsMiddleware)
+
+monitoring = APIRouter(dependencies=[Depends(monitoring_token)])
+""" The routes serving metrics and health statistics, to monitoring only. """
+
+
+@app.on_event("startup")
+def open_database_pool():
+    pool.open()
+
+
+@app.on_event("startup")
+async def start_notification_worker():
+    NOTIFICATION_WORKER.start()
+
+
+@app.on_event("startup")
+async def start_vote_buffer():
+    VOTE_BUFFER.start()
+
+
+@app.on_event("startup")
+async def start_live_broker():
+    LIVE_BROKER.start()
+
+
+@app.on_event("startup")
+async def start_stats_exporter():
+    STATS_EXPORTER.start(
+        pool.stats,
+        lambda: {name: cache.stats() for name, cache in CACHES.items()},
+        RESPONSE_CACHE.stats,
+    )
+
+
+@app.on_event("shutdown")
+async def stop_notification_worker():
+    await NOTIFICATION_WORKER.stop()
+    await MAILER.close()
+
+
+@app.on_event("shutdown")
+async def stop_vote_buffer():
+    await VOTE_BUFFER.stop()
+
+
+@app.on_event("shutdown")
+async def stop_live_broker():
+    await LIVE_BROKER.stop()
+
+
+@app.on_event("shutdown")
+async def close_response_cache():
+    await RESPONSE_CACHE.close()
+
+
+@app.on_event("shutdown")
+def close_database_pool():
+    pool.close()
+
+
+@app.on_event("shutdown")
+def close_worker_pools():
+    for worker_pool in WORKER_POOLS.values():
+        worker_pool.close()
+
+
+@app.on_event("shutdown")
+async def stop_stats_exporter():
+    await STATS_EXPORTER.stop()
+    mark_worker_stopped()
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database unavailable, please try again"},
+    )
+
+
+@app.exception_handler(WorkerPoolFull)
+async def worker_pool_full_handler(request: Request, exc: WorkerPoolFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please try again"},
+    )
+
+
 app.mount("/static", StaticFiles(directory="segmentation_fault/static"), name="static")
 
 
@@ -45,7 +156,66 @@ async def custom_swagger_ui_html_cdn():
     )
 
 
+@monitoring.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@monitoring.get("/health/pool", response_model=PoolStats, include_in_schema=False)
+async def get_pool_stats():
+    return pool.stats()
+
+
+@monitoring.get(
+    "/health/caches", response_model=dict[str, CacheStats], include_in_schema=False
+)
+async def get_cache_stats():
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+@monitoring.get(
+    "/health/responses",
+    response_model=dict[str, ResponseCacheStats],
+    include_in_schema=False,
+)
+async def get_response_cache_stats():
+    return RESPONSE_CACHE.stats()
+
+
+@monitoring.get(
+    "/health/workers",
+    response_model=dict[str, WorkerPoolStats],
+    include_in_schema=False,
+)
+async def get_worker_pool_stats():
+    return {name: worker_pool.stats() for name, worker_pool in WORKER_POOLS.items()}
+
+
+@monitoring.get(
+    "/health/notifications",
+    response_model=NotificationStats,
+    include_in_schema=False,
+)
+async def get_notification_stats():
+    return NOTIFICATION_WORKER.stats()
+
+
+@monitoring.get(
+    "/health/votes", response_model=VoteBufferStats, include_in_schema=False
+)
+async def get_vote_buffer_stats():
+    return VOTE_BUFFER.stats()
+
+
+@monitoring.get("/health/live", response_model=LiveStats, include_in_schema=False)
+async def get_live_stats():
+    return LIVE_BROKER.stats()
+
+
+app.include_router(monitoring)
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
+app.include_router(batch.router, prefix="/batch", tags=["Batch"])
 app.include_router(comments.router, prefix="/comments", tags=["Comments"])
+app.include_router(live.router, prefix="/live", tags=["Live"])
 app.include_router(posts.router, prefix="/posts", tags=["Posts"])
 app.include_router(users.router, prefix="/users", tags=["Users"])
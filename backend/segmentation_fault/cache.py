@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+from schemas.cache import CacheStats
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+CACHES: dict[str, "LRUCache"] = {}
+""" Every cache in this worker, by name. """
+
+
+class LRUCache(Generic[K, V]):
+    """
+    An in-process cache which evicts the least recently used entry once full, and
+    expires entries `ttl` seconds after they are set.
+
+    Each uvicorn worker holds its own copy, so entries invalidated in one worker may
+    be served by another until they expire. It is not thread-safe, and must only be
+    used from the event loop.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        """
+        Parameters
+        ----------
+            `name` (`str`): the name to report the cache's statistics under
+            `max_size` (`int`): the maximum number of entries
+            `ttl` (`float`): the number of seconds after which an entry expires
+        """
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries: OrderedDict[K, tuple[V, float]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        CACHES[name] = self
+
+    def get(self, key: K) -> V | None:
+        """
+        Returns the value cached under a key, if it has not expired.
+
+        Parameters
+        ----------
+            `key` (`K`): the key
+
+        Returns
+        -------
+            `V | None`: the value, or `None` on a miss
+        """
+        if (entry := self._entries.get(key)) is None:
+            self._misses += 1
+            return None
+
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        """
+        Caches a value under a key, evicting the least recently used entry if full.
+
+        Parameters
+        ----------
+            `key` (`K`): the key
+            `value` (`V`): the value
+        """
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def delete(self, key: K) -> V | None:
+        """
+        Removes the value cached under a key, if any.
+
+        Parameters
+        ----------
+            `key` (`K`): the key
+
+        Returns
+        -------
+            `V | None`: the removed value, if any
+        """
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry is not None else None
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        """
+        Returns a snapshot of the cache's effectiveness.
+
+        Returns
+        -------
+            `CacheStats`: the cache's statistics
+        """
+        lookups = self._hits + self._misses
+        return CacheStats(
+            size=len(self._entries),
+            max_size=self.max_size,
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            hit_ratio=self._hits / lookups if lookups else 0.0,
+        )
@@ -0,0 +1,327 @@
+from datetime import datetime
+from secrets import token_hex
+from typing import Any
+
+import controllers.auth as auth
+import controllers.comments as comments
+import controllers.posts as posts
+import controllers.tokens as tokens
+import controllers.users as users
+from database import ExecuteResult, Session, session
+from fastapi import HTTPException, Response
+from notifications import NOTIFICATION_WORKER, group
+from pagination import (
+    PAGE_SIZE,
+    Pagination,
+    PostOrder,
+    RankedPagination,
+    encode_cursor,
+    encode_ranked_cursor,
+)
+from passwords import PASSWORD_POOL
+from schemas.auth import ForgotPassword, LoginForm, ResetPassword
+from schemas.comments import CommentCreate, CommentUpdate
+from schemas.posts import PostCreate, PostSort, PostUpdate, TopWindow
+from schemas.tokens import TokenType
+from schemas.users import UserCreate, UserUpdate
+from schemas.votes import VoteType
+from votes import VOTE_BUFFER
+
+EXPLAINED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+""" The kinds of statement whose plans are checked. """
+
+PASSWORD = "Explain-1234"
+""" The password of the users created while exercising the controllers. """
+
+
+class RecordingSession(Session):
+    """A session which records every distinct statement it executes."""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.statements: dict[str, Any] = {}
+
+    async def fetch_one(self, query: str, params: Any = ()) -> dict | None:
+        self.statements.setdefault(query, params)
+        return await super().fetch_one(query, params)
+
+    async def fetch_all(self, query: str, params: Any = ()) -> list[dict]:
+        self.statements.setdefault(query, params)
+        return await super().fetch_all(query, params)
+
+    async def execute(self, query: str, params: Any = ()) -> ExecuteResult:
+        self.statements.setdefault(query, params)
+        return await super().execute(query, params)
+
+
+class Rollback(Exception):
+    """Raised to roll back everything done while exercising the controllers."""
+
+
+async def explain() -> int:
+    """
+    Run every controller against the database, `EXPLAIN` every statement they
+    execute, and report those which scan a whole table.
+
+    Plans depend on the data, so run it against a database holding a realistic
+    amount, such as one seeded by the load benchmark.
+
+    Returns
+    -------
+        `int`: the exit status, 1 if any statement scans a whole table and 0 otherwise
+    """
+    try:
+        plans = await explain_statements()
+    finally:
+        PASSWORD_POOL.close()
+
+    scans = 0
+    for statement, plan in plans:
+        scanned = full_scans(plan)
+        scans += bool(scanned)
+
+        print(
+            f"{'SCAN' if scanned else 'ok':<5}"
+            + ", ".join(f"{row['table']}:{row['type']}:{row['key']}" for row in plan)
+            + f"\n     {' '.join(statement.split())}"
+        )
+
+    print(f"{len(plans)} statements, {scans} scanning a whole table")
+    return 1 if scans else 0
+
+
+async def explain_statements() -> list[tuple[str, list[dict]]]:
+    """
+    Run every controller against the database and `EXPLAIN` every statement of an
+    `EXPLAINED_STATEMENTS` kind they execute.
+
+    Everything is done in one transaction which is rolled back, so the database is
+    left as it was.
+
+    Returns
+    -------
+        `list[tuple[str, list[dict]]]`: each statement, with the rows of its plan
+    """
+    plans = []
+
+    async with session() as plain:
+        db = RecordingSession(plain.connection)
+        try:
+            async with db.transaction():
+                await exercise(db)
+
+                # The EXPLAIN statements are recorded too, so iterate over a copy.
+                for statement, params in list(db.statements.items()):
+                    if statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+                        plans.append(
+                            (
+                                statement,
+                                await db.fetch_all(f"EXPLAIN {statement}", params),
+                            )
+                        )
+
+                raise Rollback()
+        except Rollback:
+            pass
+
+    return plans
+
+
+def full_scans(plan: list[dict]) -> list[str]:
+    """
+    Returns the tables a plan reads every row of.
+
+    Parameters
+    ----------
+        `plan` (`list[dict]`): the rows of the plan
+
+    Returns
+    -------
+        `list[str]`: the tables, excluding derived tables and unions, which are
+        scanned as they are built in memory
+    """
+    return [
+        row["table"]
+        for row in plan
+        if row["type"] == "ALL" and not row["table"].startswith("<")
+    ]
+
+
+async def exercise(db: Session) -> None:
+    """
+    Call every controller which queries the database, in an order which lets each
+    find the rows it needs.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+    """
+    suffix = token_hex(4)
+
+    author = await auth.sign_up(
+        db,
+        UserCreate(
+            username=f"author{suffix}",
+            email=f"author{suffix}@example.com",
+            password=PASSWORD,
+            first_name="Explain",
+            last_name="Author",
+        ),
+    )
+    reader = await users.create_user(
+        db,
+        UserCreate(
+            username=f"reader{suffix}",
+            email=f"reader{suffix}@example.com",
+            password=PASSWORD,
+            first_name="Explain",
+            last_name="Reader",
+        ),
+    )
+
+    await auth.login(db, LoginForm(author.username, PASSWORD))
+    users.USER_CACHE.clear()
+    await users.get_user(db, reader.id)
+    users.USER_CACHE.clear()
+    await users.get_user_by_username(db, reader.username)
+    await users.update_user(db, reader.id, UserUpdate(first_name="Explained"))
+    try:
+        await users.get_user_image(db, reader.id)
+    except HTTPException:
+        pass  # The user has no image, which is found out by the same query.
+
+    verification = await db.fetch_one(
+        "SELECT token FROM Tokens WHERE user = %s AND type = %s",
+        (author.id, TokenType.EMAIL_VERIFICATION.value),
+    )
+    await tokens.get_token(db, verification["token"])
+    await auth.verify_email(db, verification["token"])
+
+    await auth.forgot_password(db, ForgotPassword(email=reader.email))
+    reset = await db.fetch_one(
+        "SELECT token FROM Tokens WHERE user = %s AND type = %s",
+        (reader.id, TokenType.PASSWORD_RESET.value),
+    )
+    await auth.reset_password(
+        db, ResetPassword(token=reset["token"], password=PASSWORD)
+    )
+
+    post = await posts.create_post(
+        db, PostCreate(title="Explain", content="Explain"), author.id
+    )
+    await posts.update_post(
+        db, post.id, PostUpdate(title="Explained", content="Explained")
+    )
+    comment = await comments.create_comment(
+        db, CommentCreate(content="Explain", post=post.id), reader.id
+    )
+    await comments.update_comment(db, comment.id, CommentUpdate(content="Explained"))
+    await comments.create_comment(
+        db, CommentCreate(content="Explain", post=post.id, parent=comment.id), author.id
+    )
+
+    await posts.create_post_vote(db, post.id, VoteType.UP, reader.id)
+    await posts.create_post_vote(db, post.id, VoteType.DOWN, reader.id)
+    await comments.create_comment_vote(db, comment.id, VoteType.UP, author.id)
+    await VOTE_BUFFER.flush(db)
+
+    for order in post_orders():
+        await posts.get_posts(db, order)
+        await posts.get_feed(db, order, reader.id)
+
+    for pagination in pages():
+        await users.get_users(db, pagination)
+        await posts.get_post_comments(db, post.id, pagination)
+        await comments.get_comments(db, pagination)
+
+    for pagination in ranked_pages():
+        await posts.search_posts(db, "explained", pagination)
+
+    await posts.get_post(db, post.id)
+    await posts.get_post_votes(db, post.id)
+    await posts.get_post_vote(db, post.id, reader.id)
+    await comments.get_comment(db, comment.id)
+    await comments.get_comment_votes(db, comment.id)
+    await comments.get_post_thread(db, post.id, reader.id)
+    await comments.get_comment_thread(db, comment.id, reader.id, 1)
+    await comments.get_comment_vote(db, comment.id, author.id)
+
+    # The outbox is read by the notification worker on its own sessions, so its
+    # steps are run here directly to see the notifications added above.
+    if notifications := await NOTIFICATION_WORKER._claim(db):
+        await NOTIFICATION_WORKER._render(db, group(notifications))
+
+    # Votes, comments and posts keep their parents from being deleted, so delete a
+    # post, comment and user nothing depends on.
+    post = await posts.create_post(
+        db, PostCreate(title="Explain", content="Explain"), author.id
+    )
+    comment = await comments.create_comment(
+        db, CommentCreate(content="Explain", post=post.id), author.id
+    )
+    await comments.delete_comment(db, comment.id)
+    await posts.delete_post(db, post.id)
+
+    leaver = await users.create_user(
+        db,
+        UserCreate(
+            username=f"leaver{suffix}",
+            email=f"leaver{suffix}@example.com",
+            password=PASSWORD,
+            first_name="Explain",
+            last_name="Leaver",
+        ),
+    )
+    await users.delete_user(db, leaver.id)
+
+
+def pages() -> list[Pagination]:
+    """
+    Returns a first page and a later page, whose queries differ.
+
+    Returns
+    -------
+        `list[Pagination]`: the pages
+    """
+    return [
+        Pagination(Response(), None, PAGE_SIZE),
+        Pagination(Response(), encode_cursor(datetime.now(), 2**31 - 1), PAGE_SIZE),
+    ]
+
+
+def ranked_pages() -> list[RankedPagination]:
+    """
+    Returns a first page and a later page of ranked results, whose queries differ.
+
+    Returns
+    -------
+        `list[RankedPagination]`: the pages
+    """
+    return [
+        RankedPagination(Response(), None, PAGE_SIZE),
+        RankedPagination(Response(), encode_ranked_cursor(1.0, 2**31 - 1), PAGE_SIZE),
+    ]
+
+
+def post_orders() -> list[PostOrder]:
+    """
+    Returns a first page and a later page of each order of posts, whose queries
+    differ.
+
+    Returns
+    -------
+        `list[PostOrder]`: the orders and pages
+    """
+    orders = [(PostSort.NEW, TopWindow.ALL, encode_cursor(datetime.now(), 2**31 - 1))]
+    for sort, window in (
+        (PostSort.HOT, TopWindow.ALL),
+        (PostSort.TOP, TopWindow.ALL),
+        (PostSort.TOP, TopWindow.WEEK),
+    ):
+        orders.append((sort, window, encode_ranked_cursor(2**31 - 1, 2**31 - 1)))
+
+    return [
+        PostOrder(Response(), sort, window, cursor, PAGE_SIZE)
+        for sort, window, later in orders
+        for cursor in (None, later)
+    ]
@@ -0,0 +1,34 @@
+from database import pool
+from migrations import migrate as apply_pending
+from migrations import pending
+
+
+def migrate(dry_run: bool) -> int:
+    """
+    Apply every pending migration to the database.
+
+    Parameters
+    ----------
+        `dry_run` (`bool`): whether to only list pending migrations without applying them
+
+    Returns
+    -------
+        `int`: the exit status, always 0 as failures are raised
+    """
+    try:
+        with pool.connection() as connection:
+            if dry_run:
+                migrations = pending(connection)
+            else:
+                migrations = apply_pending(connection)
+    finally:
+        pool.close()
+
+    for migration in migrations:
+        print(
+            f"{'pending' if dry_run else 'applied'} "
+            f"{migration.version:04d}_{migration.name}"
+        )
+    print(f"{len(migrations)} {'pending' if dry_run else 'applied'}")
+
+    return 0
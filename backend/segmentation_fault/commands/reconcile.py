@@ -0,0 +1,143 @@
+from database import Session, placeholders, session
+
+COUNTERS = {
+    "Posts": ("upvotes", "downvotes", "score", "comment_count"),
+    "Comments": ("upvotes", "downvotes", "score"),
+}
+""" The denormalised counters of each table. """
+
+VOTE_COLUMNS = {"Posts": "parent_post", "Comments": "parent_comment"}
+""" The `Votes` column referencing each table. """
+
+
+async def reconcile(batch_size: int, dry_run: bool) -> int:
+    """
+    Recompute the vote and comment counters of every post and comment, and report drift.
+
+    Rows are processed in batches of `batch_size` in primary key order. Each batch
+    locks its rows and recounts under `READ COMMITTED`, so concurrent votes and
+    comments either land before the recount or wait and apply their increment on
+    top of it.
+
+    Parameters
+    ----------
+        `batch_size` (`int`): the number of rows to recompute per transaction
+        `dry_run` (`bool`): whether to only report drift without correcting it
+
+    Returns
+    -------
+        `int`: the exit status, 1 if any drift was found and 0 otherwise
+    """
+    drifted = 0
+
+    async with session() as db:
+        for table in COUNTERS:
+            checked, table_drifted, drift = await reconcile_table(
+                db, table, batch_size, dry_run
+            )
+            drifted += table_drifted
+
+            print(
+                f"{table}: {checked} checked, {table_drifted} drifted"
+                + "".join(f", {counter} {total:+d}" for counter, total in drift.items())
+            )
+
+    return 1 if drifted else 0
+
+
+async def reconcile_table(
+    db: Session, table: str, batch_size: int, dry_run: bool
+) -> tuple[int, int, dict[str, int]]:
+    """
+    Recompute the counters of every row of a table.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `table` (`str`): the table, a key of `COUNTERS`
+        `batch_size` (`int`): the number of rows to recompute per transaction
+        `dry_run` (`bool`): whether to only report drift without correcting it
+
+    Returns
+    -------
+        `tuple[int, int, dict[str, int]]`: the number of rows checked and drifted,
+        and the total drift of each counter
+    """
+    counters = COUNTERS[table]
+    checked = drifted = 0
+    drift = {counter: 0 for counter in counters}
+    last_id = 0
+
+    while True:
+        await db.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        async with db.transaction():
+            rows = await db.fetch_all(
+                f"SELECT id, {', '.join(counters)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s FOR UPDATE",
+                (last_id, batch_size),
+            )
+            if not rows:
+                break
+
+            actual = await count(db, table, [row["id"] for row in rows])
+
+            for row in rows:
+                checked += 1
+                expected = actual.get(row["id"], dict.fromkeys(counters, 0))
+                if all(row[counter] == expected[counter] for counter in counters):
+                    continue
+
+                drifted += 1
+                for counter in counters:
+                    drift[counter] += row[counter] - expected[counter]
+
+                if not dry_run:
+                    await db.execute(
+                        f"UPDATE {table} SET {', '.join(f'{counter} = %({counter})s' for counter in counters)} WHERE id = %(id)s",
+                        expected | {"id": row["id"]},
+                    )
+
+            last_id = rows[-1]["id"]
+
+    return checked, drifted, drift
+
+
+async def count(db: Session, table: str, ids: list[int]) -> dict[int, dict[str, int]]:
+    """
+    Count the votes, and for posts the comments, of the given rows.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `table` (`str`): the table, a key of `COUNTERS`
+        `ids` (`list[int]`): the IDs of the rows
+
+    Returns
+    -------
+        `dict[int, dict[str, int]]`: the counters of each row with any votes or comments
+    """
+    column = VOTE_COLUMNS[table]
+    counts: dict[int, dict[str, int]] = {}
+
+    for row in await db.fetch_all(
+        f"SELECT {column} AS id, SUM(type = 'true') AS upvotes, SUM(type = 'false') AS downvotes FROM Votes WHERE {column} IN ({placeholders(ids)}) GROUP BY {column}",
+        ids,
+    ):
+        upvotes, downvotes = int(row["upvotes"]), int(row["downvotes"])
+        counts[row["id"]] = {
+            "upvotes": upvotes,
+            "downvotes": downvotes,
+            "score": upvotes - downvotes,
+        }
+
+    if "comment_count" in COUNTERS[table]:
+        for id in ids:
+            counts.setdefault(id, {"upvotes": 0, "downvotes": 0, "score": 0})
+            counts[id]["comment_count"] = 0
+
+        for row in await db.fetch_all(
+            f"SELECT post AS id, COUNT(*) AS comment_count FROM Comments WHERE post IN ({placeholders(ids)}) GROUP BY post",
+            ids,
+        ):
+            counts[row["id"]]["comment_count"] = row["comment_count"]
+
+    return counts
@@ -3,15 +3,22 @@ import re
 import string
 from os import getenv
 
-import bcrypt
-from controllers.communications import send_password_reset_email, send_welcome_email
 from controllers.tokens import create_token
-from controllers.users import create_user
-from database import db
-from fastapi import BackgroundTasks, Depends, HTTPException, status
+from controllers.users import (
+    USER_COLUMNS,
+    create_user,
+    get_user_by_username,
+    invalidate_user,
+)
+from database import Session, get_db
+from fastapi import BackgroundTasks, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
+from notifications import enqueue_notification
+from passwords import hash_password, needs_rehash, verify_password
+from repository import from_row
 from schemas.auth import AuthToken, ForgotPassword, LoginForm, ResetPassword
+from schemas.notifications import NotificationType
 from schemas.tokens import Token, TokenType
 from schemas.users import User, UserCreate
 
@@ -30,13 +37,17 @@ ACCESS_TOKEN_TTL = int(getenv("ACCESS_TOKEN_TTL", 0))
 BACKGROUND_TASKS = BackgroundTasks()
 """ Background tasks. """
 
+AUTHENTICATED_USER = "segmentation_fault.user"
+""" The key of the user in the scope of a request made on their behalf by the server. """
 
-async def login(credentials: LoginForm) -> AuthToken:
+
+async def login(db: Session, credentials: LoginForm) -> AuthToken:
     """
     Authenticates a user.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `credentials` (`LoginForm`): the user's credentials
 
     Raises
@@ -47,23 +58,31 @@ async def login(credentials: LoginForm) -> AuthToken:
     -------
         `Token`: access token
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM Users WHERE username = %s", (credentials.username,)
+    if not (
+        user := await db.fetch_one(
+            "SELECT id, username, password FROM Users WHERE username = %s",
+            (credentials.username,),
+        )
+    ) or not await verify_password(
+        credentials.password, hashed := bytes(user["password"]).decode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
         )
-        if (
-            not (user := cursor.fetchone())
-            or not (user := User(**user))
-            or not bcrypt.checkpw(credentials.password.encode(), user.password.encode())
-        ):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
+
+    if needs_rehash(hashed):
+        async with db.transaction():
+            await db.execute(
+                "UPDATE Users SET password = %s WHERE id = %s",
+                (await hash_password(credentials.password), user["id"]),
             )
 
+        invalidate_user(user["id"])
+
     access_token = jwt.encode(
         {
-            "sub": user.username,
+            "sub": user["username"],
             "exp": datetime.datetime.utcnow()
             + datetime.timedelta(minutes=ACCESS_TOKEN_TTL),
         },
@@ -73,14 +92,14 @@ async def login(credentials: LoginForm) -> AuthToken:
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-async def sign_up(user: UserCreate, background_tasks: BackgroundTasks) -> User:
+async def sign_up(db: Session, user: UserCreate) -> User:
     """
     Registers a new user.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user` (`UserCreate`): the user's details
-        `background_tasks` (`BackgroundTasks`): background tasks
 
     Raises
     ------
@@ -96,135 +115,172 @@ async def sign_up(user: UserCreate, background_tasks: BackgroundTasks) -> User:
             detail="Invalid password",
         )
 
-    created_user = await create_user(user)
-
-    token = await create_token(created_user.id, TokenType.EMAIL_VERIFICATION)
-
-    background_tasks.add_task(send_welcome_email, created_user, token.token)
+    async with db.transaction():
+        created_user = await create_user(db, user)
+        token = await create_token(db, created_user.id, TokenType.EMAIL_VERIFICATION)
+        await enqueue_notification(
+            db, NotificationType.WELCOME, created_user.id, {"token": token.token}
+        )
 
     return created_user
 
 
-async def verify_email(token: str):
+async def verify_email(db: Session, token: str):
     """
     Verifies a user's email.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user` (`User`): the user
         `token` (`str`): the verification token
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
+    if not (
+        token := await db.fetch_one(
             "SELECT * FROM Tokens WHERE token = %s AND type = %s",
             (token, TokenType.EMAIL_VERIFICATION.value),
         )
-        if not (token := cursor.fetchone()):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid token",
-            )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid token",
+        )
 
-        token = Token(**token)
+    token = Token(**token)
 
-        cursor.execute(
+    async with db.transaction():
+        await db.execute(
             "UPDATE Users SET verified = 1 WHERE id = %s",
             (token.user,),
         )
-        cursor.execute("DELETE FROM Tokens WHERE token = %s", (token.token,))
-        db.commit()
+        await db.execute("DELETE FROM Tokens WHERE token = %s", (token.token,))
+
+    invalidate_user(token.user)
 
 
-async def forgot_password(
-    form_data: ForgotPassword, background_tasks: BackgroundTasks
-) -> None:
+async def forgot_password(db: Session, form_data: ForgotPassword) -> None:
     """
     Generates a password reset token and sends it to the user's email.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `form_data` (`ForgotPassword`): the user's email
-        `background_tasks` (`BackgroundTasks`): background tasks
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM Users WHERE email = %s",
+    if not (
+        user := await db.fetch_one(
+            f"SELECT {USER_COLUMNS} FROM Users WHERE email = %s",
             (form_data.email,),
         )
-        if not (user := cursor.fetchone()):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="There is no user with this email",
-            )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="There is no user with this email",
+        )
 
-        user = User(**user)
+    user = from_row(User, user)
 
-        cursor.execute(
+    async with db.transaction():
+        await db.execute(
             "DELETE FROM Tokens WHERE user = %s AND type = %s",
-            (user.id, TokenType.PASSWORD_RESET),
+            (user.id, TokenType.PASSWORD_RESET.value),
+        )
+        token = await create_token(db, user.id, TokenType.PASSWORD_RESET)
+        await enqueue_notification(
+            db, NotificationType.PASSWORD_RESET, user.id, {"token": token.token}
         )
-        db.commit()
-
-    token = await create_token(user.id, TokenType.PASSWORD_RESET)
-
-    background_tasks.add_task(send_password_reset_email, user, token.token)
 
 
-async def reset_password(form_data: ResetPassword) -> None:
+async def reset_password(db: Session, form_data: ResetPassword) -> None:
     """
     Resets a user's password.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `form_data` (`ResetPassword`): the reset token and the new password
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
+    if not (
+        token := await db.fetch_one(
             "SELECT * FROM Tokens WHERE token = %s AND type = %s",
-            (form_data.token, TokenType.PASSWORD_RESET),
+            (form_data.token, TokenType.PASSWORD_RESET.value),
+        )
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid token",
         )
-        if not cursor.fetchone():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid token",
-            )
 
-        if not validate_password(form_data.password):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid password",
-            )
+    if not validate_password(form_data.password):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid password",
+        )
 
-        cursor.execute(
-            "UPDATE Users SET password = %s WHERE email = %s",
+    async with db.transaction():
+        await db.execute(
+            "UPDATE Users SET password = %s WHERE id = %s",
             (
-                bcrypt.hashpw(form_data.password.encode(), bcrypt.gensalt()).decode(),
-                form_data.email,
+                await hash_password(form_data.password),
+                token["user"],
             ),
         )
-        cursor.execute("DELETE FROM Tokens WHERE token = %s", (form_data.token,))
-        db.commit()
+        await db.execute("DELETE FROM Tokens WHERE token = %s", (form_data.token,))
 
+    invalidate_user(token["user"])
 
-async def get_current_user(token: str = Depends(OAUTH2_SCHEME)) -> User:
+
+async def get_current_user(
+    request: Request,
+    token: str = Depends(OAUTH2_SCHEME),
+    db: Session = Depends(get_db),
+) -> User:
     """
-    Returns the current user.
+    Returns the current user, who is already known for requests in a batch.
+
+    Parameters
+    ----------
+        `request` (`Request`): the request
+        `token` (`str`): the user's access token
+        `db` (`Session`): the database session
 
     Returns
     -------
         `User`: the current user
     """
+    if (user := request.scope.get(AUTHENTICATED_USER)) is not None:
+        return user
+
+    return await authenticate(db, token)
+
+
+async def authenticate(db: Session, token: str) -> User:
+    """
+    Returns the user an access token was issued to.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `token` (`str`): the access token
+
+    Raises
+    ------
+        `JWTError`: if the token is invalid or expired
+        `HTTPException`: if the user no longer exists
+
+    Returns
+    -------
+        `User`: the user
+    """
     decoded_token = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     username = decoded_token.get("sub")
 
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Users WHERE username = %s", (username,))
-        if not (user := cursor.fetchone()):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-            )
+    if not (user := await get_user_by_username(db, username)):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+        )
 
-    return User(**user)
+    return user
 
 
 def validate_password(password: str) -> bool:
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+from os import getenv
+from urllib.parse import urlsplit
+
+from controllers.auth import AUTHENTICATED_USER
+from fastapi import HTTPException, status
+from pagination import NEXT_CURSOR_HEADER
+from schemas.batch import BatchItem, BatchMethod, BatchResult
+from schemas.users import User
+from starlette.types import ASGIApp, Message, Scope
+
+LOGGER = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(getenv("BATCH_MAX_SIZE", 50))
+""" The maximum number of requests in a batch. """
+
+BATCH_CONCURRENCY = int(getenv("BATCH_CONCURRENCY", 4))
+""" The maximum number of requests in a batch run at once, each holding a database connection. """
+
+BATCH_HEADERS = (NEXT_CURSOR_HEADER,)
+""" The response headers returned with the results of requests in a batch. """
+
+FORWARDED_HEADERS = (b"authorization", b"accept", b"accept-language", b"user-agent")
+""" The headers of a batch which are passed on to each of its requests. """
+
+
+async def run_batch(
+    app: ASGIApp, scope: Scope, items: list[BatchItem], user: User
+) -> list[BatchResult]:
+    """
+    Runs requests against the application on behalf of a user, and returns their
+    results in the same order.
+
+    Each request is dispatched to the application in process, so it is routed,
+    validated and handled exactly as if it were sent alone, but the user is
+    authenticated once for the whole batch. Consecutive `GET` requests run
+    concurrently, up to `BATCH_CONCURRENCY` at once, and every other request runs
+    alone after those before it finish, so a batch's writes are seen by the
+    requests after them.
+
+    Parameters
+    ----------
+        `app` (`ASGIApp`): the application
+        `scope` (`Scope`): the scope of the batch request
+        `items` (`list[BatchItem]`): the requests
+        `user` (`User`): the authenticated user
+
+    Raises
+    ------
+        `HTTPException`: if there are too many requests, or one is a batch
+
+    Returns
+    -------
+        `list[BatchResult]`: the result of each request
+    """
+    if len(items) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch may hold at most {BATCH_MAX_SIZE} requests",
+        )
+    if any(urlsplit(item.path).path.rstrip("/") == "/batch" for item in items):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, detail="A batch may not hold another batch"
+        )
+
+    headers = [
+        (name, value) for name, value in scope["headers"] if name in FORWARDED_HEADERS
+    ]
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(item: BatchItem) -> BatchResult:
+        async with slots:
+            return await dispatch(app, scope, headers, item, user)
+
+    results: list[BatchResult] = []
+    reads: list[BatchItem] = []
+    for item in [*items, None]:
+        if item is not None and item.method == BatchMethod.GET:
+            reads.append(item)
+            continue
+
+        results += await asyncio.gather(*map(run, reads))
+        reads = []
+        if item is not None:
+            results.append(await run(item))
+
+    return results
+
+
+async def dispatch(
+    app: ASGIApp,
+    scope: Scope,
+    headers: list[tuple[bytes, bytes]],
+    item: BatchItem,
+    user: User,
+) -> BatchResult:
+    """
+    Dispatches a request to the application in process, and returns its result.
+
+    Parameters
+    ----------
+        `app` (`ASGIApp`): the application
+        `scope` (`Scope`): the scope of the batch request
+        `headers` (`list[tuple[bytes, bytes]]`): the headers to send
+        `item` (`BatchItem`): the request
+        `user` (`User`): the authenticated user
+
+    Returns
+    -------
+        `BatchResult`: the result of the request
+    """
+    url = urlsplit(item.path)
+    body = b"" if item.body is None else json.dumps(item.body).encode()
+    request_scope = {
+        "type": "http",
+        "asgi": scope.get("asgi", {"version": "3.0"}),
+        "http_version": scope.get("http_version", "1.1"),
+        "method": item.method.value,
+        "scheme": scope.get("scheme", "http"),
+        "server": scope.get("server"),
+        "client": scope.get("client"),
+        "root_path": scope.get("root_path", ""),
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": headers
+        + [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        AUTHENTICATED_USER: user,
+    }
+
+    complete = asyncio.Event()
+    requested = False
+    start: Message = {}
+    chunks: list[bytes] = []
+
+    async def receive() -> Message:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        nonlocal start
+        if message["type"] == "http.response.start":
+            start = message
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                complete.set()
+
+    try:
+        await app(request_scope, receive, send)
+    except Exception:
+        # The error response, if any, was sent before the error was raised again.
+        LOGGER.exception("Failed to run %s %s in a batch", item.method.value, item.path)
+        if not start:
+            return BatchResult(status=500, headers={}, body=None)
+    finally:
+        complete.set()
+
+    response_headers = {
+        name.decode().lower(): value.decode() for name, value in start["headers"]
+    }
+    content = b"".join(chunks)
+    if not content:
+        result = None
+    elif response_headers.get("content-type", "").startswith("application/json"):
+        result = json.loads(content)
+    else:
+        result = content.decode(errors="replace")
+
+    return BatchResult(
+        status=start["status"],
+        headers={
+            header: response_headers[header.lower()]
+            for header in BATCH_HEADERS
+            if header.lower() in response_headers
+        },
+        body=result,
+    )
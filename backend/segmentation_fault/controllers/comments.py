@@ -1,148 +1,351 @@
-from controllers.communications import send_comment_notification
-from controllers.posts import get_post
-from database import db
-from fastapi import BackgroundTasks, HTTPException, status
-from schemas.comments import Comment, CommentCreate, CommentUpdate
+from controllers.votes import get_vote, set_vote
+from database import Session, placeholders
+from fastapi import HTTPException, status
+from live import publish
+from notifications import enqueue_notification
+from pagination import Pagination
+from repository import Repository, from_row
+from response_cache import RESPONSE_CACHE
+from schemas.comments import Comment, CommentCreate, CommentUpdate, ThreadComment
+from schemas.notifications import NotificationType
 from schemas.votes import VoteType
+from votes import VOTE_BUFFER
 
+COMMENTS = Repository("Comments", Comment)
+""" The `Comments` table. """
 
-async def get_comments() -> list[Comment]:
+COMMENT_PATH_WIDTH = 8
+""" The number of hex digits of each comment ID in a path. """
+
+COMMENT_MAX_DEPTH = 32
+""" The number of levels of replies a thread may hold, which its path must fit. """
+
+THREAD_COLUMNS = "Comments.id, Comments.created, Comments.updated, Comments.author, Comments.content, Comments.post, Comments.parent, Comments.depth, Comments.upvotes, Comments.downvotes, Comments.score, Comments.reply_count, Votes.type AS vote"
+""" The columns of a comment in a thread, with the user's vote joined in. """
+
+
+async def get_comments(db: Session, pagination: Pagination) -> list[Comment]:
     """
-    Get all comments.
+    Get a page of comments, newest first.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `pagination` (`Pagination`): the page to get
 
     Returns
     -------
-        `list[Comment]`: all comments
+        `list[Comment]`: the page of comments
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Comments")
-        return [Comment(**comment) for comment in cursor.fetchall()]
+    comments = await db.fetch_all(
+        f"SELECT * FROM Comments WHERE {pagination.condition('Comments')} ORDER BY {pagination.order('Comments')} LIMIT {pagination.fetch}",
+        pagination.params,
+    )
+    return [from_row(Comment, comment) for comment in pagination.page(comments)]
 
 
-async def get_comment(comment_id: int) -> Comment:
+async def get_comment(db: Session, comment_id: int) -> Comment:
     """
     Get the comment specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         comment_id (`int`): the ID of the comment
 
     Returns
     -------
         `Comment`: the comment
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Comments WHERE id = %s", (comment_id,))
+    if (comment := await COMMENTS.get(db, comment_id)) is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Comment not found")
 
-        if not (comment := cursor.fetchone()):
-            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Comment not found")
+    return comment
 
-        return Comment(**comment)
 
+async def get_post_thread(
+    db: Session, post_id: int, user_id: int, depth: int | None = None
+) -> list[ThreadComment]:
+    """
+    Get the comments on the post specified by the given ID as a thread, each with
+    its vote totals, the user's vote and its replies nested within it.
 
-async def create_comment(
-    comment: CommentCreate, background_tasks: BackgroundTasks, user_id: int
-) -> Comment:
+    The thread is read in one query, in the order of the comments' paths, which is
+    every comment followed by its replies, oldest first at each level. Votes the
+    user made which are still buffered take the place of those joined in.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `post_id` (`int`): the ID of the post
+        `user_id` (`int`): the ID of the user
+        `depth` (`int | None`): the number of levels to get, or `None` for all of
+            them; comments with replies below the last level have a `reply_count`
+            but no `replies`
+
+    Returns
+    -------
+        `list[ThreadComment]`: the top-level comments on the post
+    """
+    rows = await db.fetch_all(
+        f"SELECT {THREAD_COLUMNS} FROM Comments LEFT JOIN Votes ON Votes.parent_comment = Comments.id AND Votes.user = %s WHERE Comments.post = %s AND Comments.depth < %s ORDER BY Comments.path",
+        (user_id, post_id, COMMENT_MAX_DEPTH if depth is None else depth),
+    )
+    return nest(rows, user_id)
+
+
+async def get_comment_thread(
+    db: Session, comment_id: int, user_id: int, depth: int | None = None
+) -> list[ThreadComment]:
     """
-    Create a new comment.
+    Get the replies to the comment specified by the given ID as a thread, like
+    `get_post_thread`, such as to continue a thread read to a limited depth.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
+        `comment_id` (`int`): the ID of the comment
+        `user_id` (`int`): the ID of the user
+        `depth` (`int | None`): the number of levels of replies to get, or `None`
+            for all of them
+
+    Raises
+    ------
+        `HTTPException`: if the comment does not exist
+
+    Returns
+    -------
+        `list[ThreadComment]`: the direct replies to the comment
+    """
+    rows = await db.fetch_all(
+        f"SELECT {THREAD_COLUMNS} FROM Comments AS root JOIN Comments ON Comments.post = root.post AND Comments.path > root.path AND Comments.path < CONCAT(root.path, 'G') AND Comments.depth <= root.depth + %s LEFT JOIN Votes ON Votes.parent_comment = Comments.id AND Votes.user = %s WHERE root.id = %s ORDER BY Comments.path",
+        (COMMENT_MAX_DEPTH if depth is None else depth, user_id, comment_id),
+    )
+
+    # A comment without replies reads no rows, so only then is it looked for.
+    if not rows and not await db.fetch_one(
+        "SELECT id FROM Comments WHERE id = %s", (comment_id,)
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Comment not found")
+
+    return nest(rows, user_id)
+
+
+async def create_comment(db: Session, comment: CommentCreate, user_id: int) -> Comment:
+    """
+    Create a new comment, or a reply to one if it has a parent.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
         `comment` (`CommentCreate`): the comment to create
-        `background_tasks` (`BackgroundTasks`): the background tasks
         `user_id` (`int`): the ID of the user
 
+    Raises
+    ------
+        `HTTPException`: if the post or parent comment does not exist, or the parent
+            is on another post or nested `COMMENT_MAX_DEPTH` levels deep
+
     Returns
     -------
         `Comment`: the newly created comment
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            f"INSERT INTO Comments (author, content, post) VALUES (%(author)s, %(content)s, %(post)s)",
-            comment.dict() | {"author": user_id},
+    async with db.transaction():
+        # Locked first, as its comment count is updated below.
+        if not (
+            post := await db.fetch_one(
+                "SELECT author FROM Posts WHERE id = %s FOR UPDATE", (comment.post,)
+            )
+        ):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Post not found")
+
+        path, depth = "", 0
+        if comment.parent is not None:
+            # Locked so that it is not deleted before its reply is inserted.
+            if not (
+                parent := await db.fetch_one(
+                    "SELECT post, depth, path FROM Comments WHERE id = %s FOR UPDATE",
+                    (comment.parent,),
+                )
+            ):
+                raise HTTPException(
+                    status.HTTP_404_NOT_FOUND, detail="Parent comment not found"
+                )
+            if parent["post"] != comment.post:
+                raise HTTPException(
+                    status.HTTP_400_BAD_REQUEST,
+                    detail="Parent comment is on another post",
+                )
+            if parent["depth"] + 1 >= COMMENT_MAX_DEPTH:
+                raise HTTPException(
+                    status.HTTP_400_BAD_REQUEST, detail="Replies are nested too deeply"
+                )
+            path, depth = parent["path"], parent["depth"] + 1
+
+        created = await COMMENTS.insert(
+            db, comment.dict() | {"author": user_id, "depth": depth}
         )
-        db.commit()
-
-        cursor.execute("SELECT * FROM Comments WHERE id = %s", (cursor.lastrowid,))
-
-        background_tasks.add_task(
-            send_comment_notification, await get_post(comment.post), user_id
+        await db.execute(
+            "UPDATE Comments SET path = %s WHERE id = %s",
+            (path + f"{created.id:0{COMMENT_PATH_WIDTH}X}", created.id),
         )
+        if comment.parent is not None:
+            await db.execute(
+                "UPDATE Comments SET reply_count = reply_count + 1 WHERE id = %s",
+                (comment.parent,),
+            )
+        await db.execute(
+            "UPDATE Posts SET comment_count = comment_count + 1 WHERE id = %s",
+            (comment.post,),
+        )
+        await enqueue_notification(
+            db,
+            NotificationType.COMMENT,
+            post["author"],
+            {"post": comment.post, "author": user_id},
+        )
+        await publish(
+            db,
+            ["feed", f"post:{comment.post}"],
+            {"event": "comment.created", "comment": created},
+        )
+
+    await RESPONSE_CACHE.invalidate("comments", f"post:{comment.post}:comments")
 
-        return Comment(**cursor.fetchone())
+    return created
 
 
-async def update_comment(comment_id: int, comment: CommentUpdate) -> Comment:
+async def update_comment(
+    db: Session, comment_id: int, comment: CommentUpdate
+) -> Comment:
     """
     Update the comment specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `comment_id` (`int`): the ID of the comment
         `comment` (`CommentUpdate`): the comment to update to
 
+    Raises
+    ------
+        `HTTPException`: if the comment does not exist
+
     Returns
     -------
         `Comment`: the updated comment
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "UPDATE Comments SET content = %s WHERE id = %s",
-            (comment.content, comment_id),
-        )
-        db.commit()
+    if (updated := await COMMENTS.update(db, comment_id, comment.dict())) is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Comment not found")
 
-        cursor.execute("SELECT * FROM Comments WHERE id = %s", (comment_id,))
-        return Comment(**cursor.fetchone())
+    await RESPONSE_CACHE.invalidate(
+        "comments", f"comment:{comment_id}", f"post:{updated.post}:comments"
+    )
 
+    return updated
 
-async def delete_comment(comment_id: int) -> None:
+
+async def delete_comment(db: Session, comment_id: int) -> None:
     """
-    Delete the comment specified by the given ID.
+    Delete the comment specified by the given ID, its replies and their votes.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `comment_id` (`int`): the ID of the comment
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("DELETE FROM Comments WHERE id = %s", (comment_id,))
-        db.commit()
+    async with db.transaction():
+        if not (
+            comment := await db.fetch_one(
+                "SELECT post FROM Comments WHERE id = %s", (comment_id,)
+            )
+        ):
+            return
+
+        # The post is locked before the comment, as when replying, so that the two
+        # cannot deadlock.
+        await db.fetch_one(
+            "SELECT id FROM Posts WHERE id = %s FOR UPDATE", (comment["post"],)
+        )
+        if not (
+            comment := await db.fetch_one(
+                "SELECT post, parent, path FROM Comments WHERE id = %s FOR UPDATE",
+                (comment_id,),
+            )
+        ):
+            return
+
+        # Paths are hex digits, so those of the comment and its replies are the ones
+        # from its own up to its own followed by the digit after "F".
+        subtree = (comment["post"], comment["path"], comment["path"] + "G")
+        ids = [
+            row["id"]
+            for row in await db.fetch_all(
+                "SELECT id FROM Comments WHERE post = %s AND path >= %s AND path < %s FOR UPDATE",
+                subtree,
+            )
+        ]
+        await db.execute(
+            f"DELETE FROM Votes WHERE parent_comment IN ({placeholders(ids)})",
+            tuple(ids),
+        )
+        # Replies are deleted before the comments they reply to, so that none is
+        # left without its parent.
+        await db.execute(
+            "DELETE FROM Comments WHERE post = %s AND path >= %s AND path < %s ORDER BY path DESC",
+            subtree,
+        )
+        if comment["parent"] is not None:
+            await db.execute(
+                "UPDATE Comments SET reply_count = reply_count - 1 WHERE id = %s",
+                (comment["parent"],),
+            )
+        await db.execute(
+            "UPDATE Posts SET comment_count = comment_count - %s WHERE id = %s",
+            (len(ids), comment["post"]),
+        )
+
+    await RESPONSE_CACHE.invalidate(
+        "comments",
+        f"post:{comment['post']}:comments",
+        *(
+            namespace
+            for id in ids
+            for namespace in (f"comment:{id}", f"comment:{id}:votes")
+        ),
+    )
 
 
-async def get_comment_votes(comment_id: int) -> int:
+async def get_comment_votes(db: Session, comment_id: int) -> int:
     """
     Get the aggregate vote count of the comment specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         comment_id (`int`): the ID of the comment
 
     Returns
     -------
         `int`: the aggregate vote count of the comment
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT COUNT(*) FROM Votes WHERE parent_comment = %s AND type = 1",
-            (comment_id,),
+    if not (
+        comment := await db.fetch_one(
+            "SELECT score FROM Comments WHERE id = %s", (comment_id,)
         )
-        upvotes = cursor.fetchone()["COUNT(*)"]
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Comment not found")
 
-        cursor.execute(
-            "SELECT COUNT(*) FROM Votes WHERE parent_comment = %s AND type = 0",
-            (comment_id,),
-        )
-        downvotes = cursor.fetchone()["COUNT(*)"]
-
-        return upvotes - downvotes
+    return comment["score"]
 
 
-async def get_comment_vote(comment_id: int, user_id: int) -> VoteType:
+async def get_comment_vote(db: Session, comment_id: int, user_id: int) -> VoteType:
     """
     Get the vote on the comment specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `comment_id` (`int`): the ID of the comment
         `user_id` (`int`): the ID of the user
 
@@ -150,38 +353,54 @@ async def get_comment_vote(comment_id: int, user_id: int) -> VoteType:
     -------
         `VoteType`: the vote on the comment
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT type FROM Votes WHERE parent_comment = %s AND user = %s",
-            (comment_id, user_id),
-        )
-
-        if not (vote := cursor.fetchone()):
-            return VoteType.NULL
-
-        return VoteType.UP if vote["type"] else VoteType.DOWN
+    return await get_vote(db, "comment", comment_id, user_id)
 
 
-async def create_comment_vote(comment_id: int, type: VoteType, user_id: int):
+async def create_comment_vote(
+    db: Session, comment_id: int, type: VoteType, user_id: int
+):
     """
     Create a new vote on the comment specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `comment_id` (`int`): the ID of the comment
         `type` (`VoteType`): the type of vote to create
         `user_id` (`int`): the ID of the user
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "DELETE FROM Votes WHERE parent_comment = %s AND user = %s",
-            (comment_id, user_id),
-        )
+    await set_vote(db, "comment", comment_id, type, user_id)
 
-        if type != VoteType.NULL:
-            cursor.execute(
-                "INSERT INTO Votes (parent_comment, user, type) VALUES (%s, %s, %s)",
-                (comment_id, user_id, 1 if type == VoteType.UP else 0),
-            )
 
-        db.commit()
+def nest(rows: list[dict], user_id: int) -> list[ThreadComment]:
+    """
+    Nests comments within the comments they reply to.
+
+    Parameters
+    ----------
+        `rows` (`list[dict]`): the comments, each after the one it replies to, with
+            the user's vote
+        `user_id` (`int`): the ID of the user
+
+    Returns
+    -------
+        `list[ThreadComment]`: the comments whose parents are not among the rows
+    """
+    comments: dict[int, ThreadComment] = {}
+    roots = []
+    for row in rows:
+        comment = from_row(
+            ThreadComment,
+            row
+            | {
+                "vote": VOTE_BUFFER.get("comment", row["id"], user_id)
+                or VoteType(row["vote"] or VoteType.NULL)
+            },
+        )
+        comments[comment.id] = comment
+        if comment.parent in comments:
+            comments[comment.parent].replies.append(comment)
+        else:
+            roots.append(comment)
+
+    return roots
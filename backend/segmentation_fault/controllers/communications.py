@@ -1,59 +1,232 @@
+import asyncio
 from os import getenv
+from typing import NamedTuple
 
+import aiohttp
 import requests
-from controllers.users import get_user
-from schemas.posts import Post
 from schemas.users import User
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 
+COMMUNICATION_TIMEOUT = float(getenv("COMMUNICATION_TIMEOUT", 10))
+""" The number of seconds after which sending a message is abandoned. """
+
+MAILGUN_CONNECTIONS = int(getenv("MAILGUN_CONNECTIONS", 10))
+""" The maximum number of connections each worker keeps open to Mailgun. """
+
 TWILIO_CLIENT = Client(
-    username=getenv("TWILIO_ACCOUNT_SID"), password=getenv("TWILIO_AUTH_TOKEN")
+    username=getenv("TWILIO_ACCOUNT_SID"),
+    password=getenv("TWILIO_AUTH_TOKEN"),
+    http_client=TwilioHttpClient(timeout=COMMUNICATION_TIMEOUT),
 )
 
 
-def send_email(recipient: str, subject: str, body: str):
-    return requests.post(
-        f"{getenv('MAILGUN_API_BASE_URL')}{getenv('MAILGUN_DOMAIN_NAME')}/messages",
-        auth=("api", getenv("MAILGUN_API_KEY")),
-        data={
-            "from": f"Segmentation Fault <mailgun@{getenv('MAILGUN_DOMAIN_NAME')}>",
-            "to": [recipient],
-            "subject": subject,
-            "text": body,
-        },
-    )
+class Email(NamedTuple):
+    recipient: str
+    subject: str
+    body: str
 
 
-def send_text_message(recipient: str, body: str):
-    return TWILIO_CLIENT.messages.create(
-        to=recipient,
-        body=body,
-        messaging_service_sid=getenv("TWILIO_MESSAGING_SERVICE_SID"),
-    )
+class TextMessage(NamedTuple):
+    recipient: str
+    body: str
+
+
+class DeliveryError(Exception):
+    """Raised when a message could not be sent."""
+
+    def __init__(self, message: str, retry: bool):
+        """
+        Parameters
+        ----------
+            `message` (`str`): the reason the message could not be sent
+            `retry` (`bool`): whether sending the message again may succeed
+        """
+        super().__init__(message)
+        self.retry = retry
+
+
+class Mailer:
+    """
+    Sends emails through Mailgun, reusing a pool of kept-alive connections.
+
+    The connections are opened on first use, as they belong to the running event
+    loop.
+    """
+
+    def __init__(
+        self, base_url: str, domain: str, api_key: str, connections: int, timeout: float
+    ):
+        """
+        Parameters
+        ----------
+            `base_url` (`str`): the base URL of the Mailgun API
+            `domain` (`str`): the domain emails are sent from
+            `api_key` (`str`): the Mailgun API key
+            `connections` (`int`): the maximum number of open connections
+            `timeout` (`float`): the number of seconds after which a send is abandoned
+        """
+        self.url = f"{base_url}{domain}/messages"
+        self.sender = f"Segmentation Fault <mailgun@{domain}>"
+        self.auth = aiohttp.BasicAuth("api", api_key or "")
+        self.connections = connections
+        self.timeout = timeout
+
+        self._session: aiohttp.ClientSession | None = None
+
+    async def send(self, email: Email) -> None:
+        """
+        Sends an email.
+
+        Parameters
+        ----------
+            `email` (`Email`): the email
+
+        Raises
+        ------
+            `DeliveryError`: if Mailgun did not accept the email
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                auth=self.auth,
+            )
+
+        data = {
+            "from": self.sender,
+            "to": email.recipient,
+            "subject": email.subject,
+            "text": email.body,
+        }
+        try:
+            async with self._session.post(self.url, data=data) as response:
+                if response.status >= 400:
+                    raise DeliveryError(
+                        f"Mailgun responded {response.status}: {await response.text()}",
+                        retry=response.status == 429 or response.status >= 500,
+                    )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            raise DeliveryError(f"Mailgun unreachable: {error!r}", retry=True)
+
+    async def close(self) -> None:
+        """Closes the open connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+MAILER = Mailer(
+    getenv("MAILGUN_API_BASE_URL", ""),
+    getenv("MAILGUN_DOMAIN_NAME", ""),
+    getenv("MAILGUN_API_KEY", ""),
+    MAILGUN_CONNECTIONS,
+    COMMUNICATION_TIMEOUT,
+)
+""" The mailer emails are sent with. """
 
 
-def send_welcome_email(user: User, token: str):
-    return send_email(
+async def send_email(email: Email) -> None:
+    """
+    Sends an email.
+
+    Parameters
+    ----------
+        `email` (`Email`): the email
+
+    Raises
+    ------
+        `DeliveryError`: if the email could not be sent
+    """
+    await MAILER.send(email)
+
+
+async def send_text_message(message: TextMessage) -> None:
+    """
+    Sends a text message. `TWILIO_CLIENT` is blocking, so this runs on a thread,
+    reusing the client's kept-alive connections.
+
+    Parameters
+    ----------
+        `message` (`TextMessage`): the text message
+
+    Raises
+    ------
+        `DeliveryError`: if the text message could not be sent
+    """
+    try:
+        await asyncio.to_thread(
+            TWILIO_CLIENT.messages.create,
+            to=message.recipient,
+            body=message.body,
+            messaging_service_sid=getenv("TWILIO_MESSAGING_SERVICE_SID"),
+        )
+    except TwilioRestException as error:
+        raise DeliveryError(
+            f"Twilio responded {error.status}: {error.msg}",
+            retry=error.status == 429 or error.status >= 500,
+        )
+    except requests.RequestException as error:
+        raise DeliveryError(f"Twilio unreachable: {error!r}", retry=True)
+
+
+def welcome_email(user: User, token: str) -> Email:
+    return Email(
         user.email,
         "Welcome to Segmentation Fault!",
         f"Hello {user.first_name},\n\nClick the link below to verify your email for Segmentation Fault:\n\n{getenv('FRONTEND_URL')}/verify-email?token={token}",
     )
 
 
-def send_password_reset_email(user: User, token: str):
-    return send_email(
+def password_reset_email(user: User, token: str) -> Email:
+    return Email(
         user.email,
         "Password Reset Requested",
         f"Hello {user.first_name},\n\nClick the link below to reset your password for Segmentation Fault:\n\n{getenv('FRONTEND_URL')}/reset-password?token={token}",
     )
 
 
-async def send_comment_notification(post: Post, comment_author_id: int):
-    post_author = await get_user(post.author)
-    comment_author = await get_user(comment_author_id)
-
-    return send_email(
+def comment_email(post_author: User, comment_author: User, post: dict) -> Email:
+    return Email(
         post_author.email,
         "Segmentation Fault: New comment on your post",
-        f"Hello {post_author.first_name},\n\n{comment_author.first_name} {comment_author.last_name} commented on your post:\n{post.title}\n\n{getenv('FRONTEND_URL')}/posts/{post.id}",
+        f"Hello {post_author.first_name},\n\n{comment_author.first_name} {comment_author.last_name} commented on your post:\n{post['title']}\n\n{getenv('FRONTEND_URL')}/posts/{post['id']}",
+    )
+
+
+def comment_digest_email(post_author: User, comments: list[tuple[User, dict]]) -> Email:
+    commenters: dict[int, tuple[dict, dict[int, User]]] = {}
+    for comment_author, post in comments:
+        _, authors = commenters.setdefault(post["id"], (post, {}))
+        authors[comment_author.id] = comment_author
+
+    sections = "\n\n".join(
+        f"{list_names(list(authors.values()))} commented on your post:\n{post['title']}\n{getenv('FRONTEND_URL')}/posts/{post['id']}"
+        for post, authors in commenters.values()
+    )
+    return Email(
+        post_author.email,
+        f"Segmentation Fault: {len(comments)} new comments on your posts",
+        f"Hello {post_author.first_name},\n\n{sections}",
     )
+
+
+def list_names(users: list[User], limit: int = 3) -> str:
+    """
+    Returns the full names of users as an English list, summarising any past `limit`.
+
+    Parameters
+    ----------
+        `users` (`list[User]`): the users
+        `limit` (`int`): the maximum number of names to list
+
+    Returns
+    -------
+        `str`: the list, e.g. "Ada Lovelace, Alan Turing and 2 others"
+    """
+    names = [f"{user.first_name} {user.last_name}" for user in users]
+    if len(names) > limit:
+        names = names[: limit - 1] + [f"{len(names) - limit + 1} others"]
+
+    return names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
@@ -1,69 +1,188 @@
-from database import db
+from controllers.votes import get_vote, set_vote
+from database import Session, placeholders
 from fastapi import HTTPException, status
+from live import publish
+from pagination import Pagination, PostOrder, RankedPagination
+from repository import Repository, from_row
+from response_cache import RESPONSE_CACHE
 from schemas.comments import Comment
-from schemas.posts import Post, PostCreate, PostUpdate
+from schemas.posts import FeedPost, Post, PostCreate, PostUpdate, SearchResult
 from schemas.votes import VoteType
+from search import SEARCH_COMMENT_WEIGHT, against, excerpt, snippet
+from votes import VOTE_BUFFER
 
+POSTS = Repository("Posts", Post)
+""" The `Posts` table. """
 
-async def get_posts() -> list[Post]:
+
+async def get_posts(db: Session, order: PostOrder) -> list[Post]:
     """
-    Get all posts.
+    Get a page of posts, in the given order.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `order` (`PostOrder`): the order and page to get
 
     Returns
     -------
-        `list[Post]`: all posts
+        `list[Post]`: the page of posts
+    """
+    posts = await db.fetch_all(
+        f"SELECT * FROM Posts WHERE {order.condition()} ORDER BY {order.order()} LIMIT {order.fetch}",
+        order.params,
+    )
+    return [from_row(Post, post) for post in order.page(posts)]
+
+
+async def get_feed(db: Session, order: PostOrder, user_id: int) -> list[FeedPost]:
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Posts ORDER BY created DESC")
-        return [Post(**post) for post in cursor.fetchall()]
+    Get a page of posts, in the given order, each with its vote totals, comment
+    count and the user's vote.
 
+    The totals are read from each post's counters and the user's votes are joined
+    in, so the feed is a single query regardless of how many posts it holds. Votes
+    the user made which are still buffered take the place of those joined in.
 
-async def get_post(post_id: int) -> Post:
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `order` (`PostOrder`): the order and page to get
+        `user_id` (`int`): the ID of the user
+
+    Returns
+    -------
+        `list[FeedPost]`: the page of posts with their totals
+    """
+    posts = await db.fetch_all(
+        f"SELECT Posts.*, Posts.comment_count AS comments, Votes.type AS vote FROM Posts LEFT JOIN Votes ON Votes.parent_post = Posts.id AND Votes.user = %s WHERE {order.condition()} ORDER BY {order.order()} LIMIT {order.fetch}",
+        (user_id, *order.params),
+    )
+    return [
+        from_row(
+            FeedPost,
+            post
+            | {
+                "vote": VOTE_BUFFER.get("post", post["id"], user_id)
+                or VoteType(post["vote"] or VoteType.NULL)
+            },
+        )
+        for post in order.page(posts)
+    ]
+
+
+async def get_post(db: Session, post_id: int) -> Post:
     """
     Get the post specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         post_id (`int`): the ID of the post
 
     Returns
     -------
         `Post`: the post
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Posts WHERE id = %s", (post_id,))
-
-        if not (post := cursor.fetchone()):
-            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Post not found")
+    if (post := await POSTS.get(db, post_id)) is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Post not found")
 
-        return Post(**post)
+    return post
 
 
-async def get_post_comments(post_id: int) -> list[Comment]:
+async def get_post_comments(
+    db: Session, post_id: int, pagination: Pagination
+) -> list[Comment]:
     """
-    Get the top-level comments on the post specified by the given ID.
+    Get a page of the top-level comments on the post specified by the given ID,
+    newest first. Use `controllers.comments.get_post_thread` for their replies.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         post_id (`int`): the ID of the post
+        `pagination` (`Pagination`): the page to get
 
     Returns
     -------
-        `list[Comment]`: the top-level comments on the post
+        `list[Comment]`: the page of top-level comments on the post
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT * FROM Comments WHERE post = %s ORDER BY created DESC", (post_id,)
+    comments = await db.fetch_all(
+        f"SELECT * FROM Comments WHERE post = %s AND depth = 0 AND {pagination.condition('Comments')} ORDER BY {pagination.order('Comments')} LIMIT {pagination.fetch}",
+        (post_id, *pagination.params),
+    )
+    return [from_row(Comment, comment) for comment in pagination.page(comments)]
+
+
+async def search_posts(
+    db: Session, query: str, pagination: RankedPagination
+) -> list[SearchResult]:
+    """
+    Get a page of the posts matching a search query, most relevant first, each with
+    a snippet of where it matches.
+
+    A post matches if its title, content or any of its comments hold a term of the
+    query, and its relevance is that of its title and content plus that of its best
+    matching comment, weighted by `SEARCH_COMMENT_WEIGHT`. Matches are found through
+    the `FULLTEXT` indexes of both tables, so only matching rows are read. Snippets
+    are taken from the content if it holds a term, else from the best matching
+    comment, else from the start of the content.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `query` (`str`): the search query, in natural language
+        `pagination` (`RankedPagination`): the page to get
+
+    Returns
+    -------
+        `list[SearchResult]`: the page of matching posts
+    """
+    posts = pagination.page(
+        await db.fetch_all(
+            f"SELECT Posts.*, matches.relevance FROM (SELECT post AS id, SUM(relevance) AS relevance FROM (SELECT id AS post, {against('title, content')} AS relevance FROM Posts WHERE {against('title, content')} UNION ALL SELECT post, MAX({against('content')}) * %s FROM Comments WHERE {against('content')} GROUP BY post) AS found GROUP BY post) AS matches JOIN Posts ON Posts.id = matches.id WHERE {pagination.condition('matches.relevance', 'matches.id')} ORDER BY {pagination.order('matches.relevance', 'matches.id')} LIMIT {pagination.fetch}",
+            (query, query, query, SEARCH_COMMENT_WEIGHT, query, *pagination.params),
         )
-        return [Comment(**comment) for comment in cursor.fetchall()]
+    )
+
+    snippets = {post["id"]: snippet(post["content"], query) for post in posts}
+    comments = {}
+    if unmatched := [id for id, found in snippets.items() if found is None]:
+        for comment in await db.fetch_all(
+            f"SELECT id, post, content FROM Comments WHERE post IN ({placeholders(unmatched)}) AND {against('content')} ORDER BY {against('content')} DESC",
+            (*unmatched, query, query),
+        ):
+            if comment["post"] not in comments and (
+                found := snippet(comment["content"], query)
+            ):
+                comments[comment["post"]] = comment["id"]
+                snippets[comment["post"]] = found
+
+    results = []
+    for post in posts:
+        text, highlights = snippets[post["id"]] or (excerpt(post["content"]), [])
+        results.append(
+            from_row(
+                SearchResult,
+                post
+                | {
+                    "snippet": text,
+                    "highlights": highlights,
+                    "comment": comments.get(post["id"]),
+                },
+            )
+        )
+
+    return results
 
 
-async def create_post(post: PostCreate, user_id: int) -> Post:
+async def create_post(db: Session, post: PostCreate, user_id: int) -> Post:
     """
     Create a new post.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `post` (`PostCreate`): the post to create
         `user_id` (`int`): the ID of the user
 
@@ -71,94 +190,87 @@ async def create_post(post: PostCreate, user_id: int) -> Post:
     -------
         `Post`: the newly created post
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "INSERT INTO Posts (content, title, author) VALUES (%s, %s, %s)",
-            (post.content, post.title, user_id),
-        )
-        db.commit()
+    async with db.transaction():
+        created = await POSTS.insert(db, post.dict() | {"author": user_id})
+        await publish(db, ["feed"], {"event": "post.created", "post": created})
+
+    await RESPONSE_CACHE.invalidate("posts")
 
-        cursor.execute("SELECT * FROM Posts WHERE id = %s", (cursor.lastrowid,))
-        return Post(**cursor.fetchone())
+    return created
 
 
-async def update_post(post_id: int, post: PostUpdate) -> Post:
+async def update_post(db: Session, post_id: int, post: PostUpdate) -> Post:
     """
     Update the post specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `post_id` (`int`): the ID of the post
+        `post` (`PostUpdate`): the post to update to
+
+    Raises
+    ------
+        `HTTPException`: if the post does not exist
 
     Returns
     -------
         `Post`: the updated post
     """
-    query = "UPDATE Posts SET "
-    query += ", ".join(
-        [
-            f"{key} = %({key})s"
-            for key, value in post.dict().items()
-            if value is not None
-        ]
-    )
-    query += " WHERE id = %(id)s"
+    values = {key: value for key, value in post.dict().items() if value is not None}
+    if (updated := await POSTS.update(db, post_id, values)) is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Post not found")
 
-    with db.dict_cursor() as cursor:
-        cursor.execute(query, post.dict() | {"id": post_id})
-        db.commit()
+    await RESPONSE_CACHE.invalidate("posts", f"post:{post_id}")
 
-        cursor.execute("SELECT * FROM Posts WHERE id = %s", (post_id,))
-        return Post(**cursor.fetchone())
+    return updated
 
 
-async def delete_post(post_id: int) -> None:
+async def delete_post(db: Session, post_id: int) -> None:
     """
     Delete the post specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `post_id` (`int`): the ID of the post
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("DELETE FROM Posts WHERE id = %s", (post_id,))
-        db.commit()
+    async with db.transaction():
+        await db.execute("DELETE FROM Posts WHERE id = %s", (post_id,))
+
+    await RESPONSE_CACHE.invalidate(
+        "posts", f"post:{post_id}", f"post:{post_id}:comments", f"post:{post_id}:votes"
+    )
 
 
-async def get_post_votes(post_id: int) -> int:
+async def get_post_votes(db: Session, post_id: int) -> int:
     """
     Get the aggregate vote count of the post specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         post_id (`int`): the ID of the post
 
     Returns
     -------
         `int`: the aggregate vote count of the post
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT COUNT(*) FROM Votes WHERE parent_post = %s AND type = 1",
-            (post_id,),
-        )
-        upvotes = cursor.fetchone()["COUNT(*)"]
+    if not (
+        post := await db.fetch_one("SELECT score FROM Posts WHERE id = %s", (post_id,))
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Post not found")
 
-        cursor.execute(
-            "SELECT COUNT(*) FROM Votes WHERE parent_post = %s AND type = 0",
-            (post_id,),
-        )
-        downvotes = cursor.fetchone()["COUNT(*)"]
-
-        return upvotes - downvotes
+    return post["score"]
 
 
-async def get_post_vote(post_id: int, user_id: int) -> VoteType:
+async def get_post_vote(db: Session, post_id: int, user_id: int) -> VoteType:
     """
     Get the vote on the post specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `post_id` (`int`): the ID of the post
         `user_id` (`int`): the ID of the user
 
@@ -166,38 +278,18 @@ async def get_post_vote(post_id: int, user_id: int) -> VoteType:
     -------
         `VoteType`: the vote on the post
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "SELECT type FROM Votes WHERE parent_post = %s AND user = %s",
-            (post_id, user_id),
-        )
+    return await get_vote(db, "post", post_id, user_id)
 
-        if not (vote := cursor.fetchone()):
-            return VoteType.NULL
 
-        return VoteType.UP if vote["type"] else VoteType.DOWN
-
-
-async def create_post_vote(post_id: int, type: VoteType, user_id: int):
+async def create_post_vote(db: Session, post_id: int, type: VoteType, user_id: int):
     """
     Create a new vote on the post specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `post_id` (`int`): the ID of the post
         `type` (`VoteType`): the type of vote to create
         `user_id` (`int`): the ID of the user
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "DELETE FROM Votes WHERE parent_post = %s AND user = %s",
-            (post_id, user_id),
-        )
-
-        if type != VoteType.NULL:
-            cursor.execute(
-                "INSERT INTO Votes (parent_post, user, type) VALUES (%s, %s, %s)",
-                (post_id, user_id, 1 if type == VoteType.UP else 0),
-            )
-
-        db.commit()
+    await set_vote(db, "post", post_id, type, user_id)
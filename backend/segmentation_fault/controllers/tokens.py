@@ -1,16 +1,21 @@
 from secrets import token_urlsafe
 
-from database import db
+from database import Session
 from fastapi import HTTPException, status
+from repository import Repository
 from schemas.tokens import Token, TokenType
 
+TOKENS = Repository("Tokens", Token, key="token", generated=False)
+""" The `Tokens` table. """
 
-async def create_token(user: int, type: TokenType):
+
+async def create_token(db: Session, user: int, type: TokenType):
     """
     Creates a token.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user` (`int`): the ID of the user the token belongs to
         `type` (`TokenType`): the type of the token
 
@@ -18,25 +23,12 @@ async def create_token(user: int, type: TokenType):
     -------
         `Token`: the created token
     """
-    with db.dict_cursor() as cursor:
-        token = token_urlsafe(16)
-        cursor.execute(
-            "INSERT INTO Tokens (token, user, type) VALUES (%s, %s, %s)",
-            (token, user, type.value),
-        )
-        db.commit()
-
-        cursor.execute("SELECT * FROM Tokens WHERE token = %s", (token,))
-        if not (token := cursor.fetchone()):
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Token creation failed",
-            )
-
-        return Token(**token)
+    return await TOKENS.insert(
+        db, {"token": token_urlsafe(16), "user": user, "type": type.value}
+    )
 
 
-async def get_token(token: str):
+async def get_token(db: Session, token: str):
     """
     Gets a token.
 
@@ -46,17 +38,16 @@ async def get_token(token: str):
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `token` (`str`): the token to get
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Tokens WHERE token = %s", (token,))
-        if not (token := cursor.fetchone()):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if (token := await TOKENS.get(db, token)) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-        return Token(**cursor.fetchone())
+    return token
 
 
-async def delete_token(token: str):
+async def delete_token(db: Session, token: str):
     """
     Deletes a token.
 
@@ -66,13 +57,8 @@ async def delete_token(token: str):
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `token` (`str`): the token to delete
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("DELETE FROM Tokens WHERE token = %s", (token,))
-        db.commit()
-
-        if not cursor.lastrowid:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-
-        return Token(**cursor.fetchone())
+    if not await TOKENS.delete(db, token):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
@@ -1,179 +1,357 @@
-import io
-
-import bcrypt
-from database import db
-from fastapi import HTTPException, status
-from fastapi.responses import StreamingResponse
-from PIL import Image
+import hashlib
+from os import getenv
+
+from cache import LRUCache
+from database import Session
+from fastapi import HTTPException, Response, UploadFile, status
+from images import MAX_IMAGE_UPLOAD_SIZE, InvalidImage, process_image
+from mysql.connector import IntegrityError, errorcode
+from pagination import Pagination
+from passwords import hash_password
+from repository import Repository, from_row
 from schemas.users import User, UserCreate, UserUpdate
 
-IMAGE_SIZE = 48
-""" The size for images to be cropped to. """
+IMAGE_MAX_AGE = int(getenv("IMAGE_MAX_AGE", 300))
+""" The number of seconds clients may use an image for before revalidating it. """
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+""" The number of bytes of an upload read at a time. """
+
+USER_COLUMNS = ", ".join(f"Users.{field}" for field in User.__fields__)
+""" The columns selected to build a `User`, leaving out the password hash and image. """
+
+USERS = Repository("Users", User, defaults={"super": False, "verified": False})
+""" The `Users` table. """
+
+USER_CACHE_SIZE = int(getenv("USER_CACHE_SIZE", 1024))
+""" The maximum number of users cached by each worker. """
 
-IMAGE_RADIUS = IMAGE_SIZE // 2
-""" The "radius" to crop images to. """
+USER_CACHE_TTL = float(getenv("USER_CACHE_TTL", 60))
+""" The number of seconds a cached user may be served for, bounding staleness across workers. """
 
+USER_CACHE: LRUCache[int, User] = LRUCache("users", USER_CACHE_SIZE, USER_CACHE_TTL)
+""" Users, by ID. """
 
-async def get_users() -> list[User]:
+USERNAME_CACHE: LRUCache[str, int] = LRUCache(
+    "usernames", USER_CACHE_SIZE, USER_CACHE_TTL
+)
+""" User IDs, by username. """
+
+
+async def get_users(db: Session, pagination: Pagination) -> list[User]:
     """
-    Get all users.
+    Get a page of users, newest first.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `pagination` (`Pagination`): the page to get
 
     Returns
     -------
-        `list[User]`: all users
+        `list[User]`: the page of users
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Users")
-        users = cursor.fetchall()
-        return [User(**user) for user in users]
+    users = await db.fetch_all(
+        f"SELECT {USER_COLUMNS} FROM Users WHERE {pagination.condition('Users')} ORDER BY {pagination.order('Users')} LIMIT {pagination.fetch}",
+        pagination.params,
+    )
+    return [from_row(User, user) for user in pagination.page(users)]
 
 
-async def get_user(user_id: int) -> User:
+async def get_user(db: Session, user_id: int) -> User:
     """
     Get the user specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         user_id (`int`): the ID of the user
 
     Returns
     -------
         `User`: the user
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT * FROM Users WHERE id = %s", (user_id,))
+    if (user := USER_CACHE.get(user_id)) is not None:
+        return user
+
+    if not (
+        user := await db.fetch_one(
+            f"SELECT {USER_COLUMNS} FROM Users WHERE id = %s", (user_id,)
+        )
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    return cache_user(from_row(User, user))
+
+
+async def get_user_by_username(db: Session, username: str) -> User | None:
+    """
+    Get the user with the given username.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `username` (`str`): the username of the user
+
+    Returns
+    -------
+        `User | None`: the user, if one exists
+    """
+    if (
+        (user_id := USERNAME_CACHE.get(username)) is not None
+        and (user := USER_CACHE.get(user_id)) is not None
+        and user.username == username
+    ):
+        return user
+
+    if not (
+        user := await db.fetch_one(
+            f"SELECT {USER_COLUMNS} FROM Users WHERE username = %s", (username,)
+        )
+    ):
+        return None
+
+    return cache_user(from_row(User, user))
+
+
+def cache_user(user: User) -> User:
+    """
+    Cache a user by ID and username.
+
+    Parameters
+    ----------
+        `user` (`User`): the user
+
+    Returns
+    -------
+        `User`: the user
+    """
+    USER_CACHE.set(user.id, user)
+    USERNAME_CACHE.set(user.username, user.id)
+    return user
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Remove the user specified by the given ID from this worker's cache.
 
-        if not (user := cursor.fetchone()):
-            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
+    Must be called after any change to the user's row is committed.
 
-        return User(**user)
+    Parameters
+    ----------
+        `user_id` (`int`): the ID of the user
+    """
+    if (user := USER_CACHE.delete(user_id)) is not None:
+        USERNAME_CACHE.delete(user.username)
 
 
-async def create_user(user: UserCreate) -> User:
+async def create_user(db: Session, user: UserCreate) -> User:
     """
     Create a new user.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user` (`UserCreate`): the user to create
 
     Returns
     -------
         `User`: the newly created user
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "INSERT INTO Users (username, email, password, first_name, last_name) VALUES (%(username)s, %(email)s, %(password)s, %(first_name)s, %(last_name)s)",
-            user.dict()
-            | {
-                "password": bcrypt.hashpw(
-                    user.password.encode(), bcrypt.gensalt()
-                ).decode()
-            },
-        )
-        db.commit()
+    password = await hash_password(user.password)
 
-        cursor.execute("SELECT * FROM Users WHERE id = %s", (cursor.lastrowid,))
-        return User(**cursor.fetchone())
+    try:
+        return await USERS.insert(db, user.dict() | {"password": password})
+    except IntegrityError as error:
+        raise_if_taken(error)
+        raise
 
 
-async def update_user(user_id: int, user: UserUpdate) -> User:
+async def update_user(db: Session, user_id: int, user: UserUpdate) -> User:
     """
     Update the user specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user_id` (`int`): the ID of the user
         `user` (`UserUpdate`): the user to update to
 
+    Raises
+    ------
+        `HTTPException`: if the user does not exist, or the username or email is taken
+
     Returns
     -------
         `User`: the updated user
     """
-    query = "UPDATE Users SET "
-    query += ", ".join(
-        [
-            f"{key} = %({key})s"
-            for key, value in user.dict().items()
-            if value is not None
-        ]
-    )
-    query += " WHERE id = %(id)s"
+    values = {key: value for key, value in user.dict().items() if value is not None}
+    if "password" in values:
+        values["password"] = await hash_password(values["password"])
+
+    try:
+        updated = await USERS.update(db, user_id, values)
+    except IntegrityError as error:
+        raise_if_taken(error)
+        raise
 
-    with db.dict_cursor() as cursor:
-        cursor.execute(query, user.dict() | {"id": user_id})
-        db.commit()
+    if updated is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
 
-        cursor.execute("SELECT * FROM Users WHERE id = %s", (user_id,))
-        return User(**cursor.fetchone())
+    invalidate_user(user_id)
+
+    return updated
+
+
+def raise_if_taken(error: IntegrityError) -> None:
+    """
+    Raises a conflict if an integrity error is a username or email already in use.
+
+    Parameters
+    ----------
+        `error` (`IntegrityError`): the error raised writing a user
+
+    Raises
+    ------
+        `HTTPException`: if the error is a duplicate username or email
+    """
+    if error.errno == errorcode.ER_DUP_ENTRY:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username or email already taken",
+        ) from error
 
 
-async def delete_user(user_id: int) -> None:
+async def delete_user(db: Session, user_id: int) -> None:
     """
     Delete the user specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user_id` (`int`): the ID of the user
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("DELETE FROM Users WHERE id = %s", (user_id,))
-        db.commit()
+    async with db.transaction():
+        user = await db.fetch_one(
+            "SELECT image FROM Users WHERE id = %s FOR UPDATE", (user_id,)
+        )
+        await db.execute("DELETE FROM Users WHERE id = %s", (user_id,))
+
+        if user and user["image"] is not None:
+            await release_image(db, user["image"])
+
+    invalidate_user(user_id)
 
 
-async def get_user_image(user_id: int) -> bytes:
+async def get_user_image(
+    db: Session, user_id: int, if_none_match: str | None = None
+) -> Response:
     """
     Get the profile image of the user specified by the given ID.
 
+    Images are stored once per distinct content, keyed by its SHA-256 hash, which
+    doubles as the ETag so that revalidation never loads the image itself.
+
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user_id` (`int`): the ID of the user
+        `if_none_match` (`str | None`): the `If-None-Match` header of the request
 
     Returns
     -------
-        `StreamingResponse`: the user's profile image
+        `Response`: the user's profile image, or 304 if the client's copy is current
     """
-    with db.dict_cursor() as cursor:
-        cursor.execute("SELECT image FROM Users WHERE id = %s", (user_id,))
+    if not (
+        user := await db.fetch_one("SELECT image FROM Users WHERE id = %s", (user_id,))
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
+
+    if (image_hash := user["image"]) is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Image not found")
 
-        if not (raw_image := cursor.fetchone()):
-            raise HTTPException(status.HTTP_404_NOT_FOUND, detail="User not found")
+    etag = f'"{bytes(image_hash).hex()}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}"}
 
-        image = Image.frombytes("RGB", (IMAGE_SIZE, IMAGE_SIZE), raw_image["image"])
+    if if_none_match is not None and etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-        result = io.BytesIO()
-        image.save(result, "JPEG")
-        result.seek(0)
+    if not (
+        image := await db.fetch_one(
+            "SELECT data FROM Images WHERE hash = %s", (image_hash,)
+        )
+    ):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Image not found")
 
-        return StreamingResponse(result, media_type="image/jpeg")
+    return Response(bytes(image["data"]), media_type="image/jpeg", headers=headers)
 
 
-async def upload_user_image(user_id: int, raw_image: bytes):
+async def upload_user_image(db: Session, user_id: int, upload: UploadFile) -> bool:
     """
     Upload an image for the user specified by the given ID.
 
     Parameters
     ----------
+        `db` (`Session`): the database session
         `user_id` (`int`): the ID of the user
-        `raw_image` (`bytes`): the image to upload
+        `upload` (`UploadFile`): the image to upload
+
+    Returns
+    -------
+        `bool`: whether the user exists
     """
-    image = Image.open(io.BytesIO(raw_image))
-    width, height = image.size
+    data = bytearray()
+    while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+        data += chunk
+        if len(data) > MAX_IMAGE_UPLOAD_SIZE:
+            raise HTTPException(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large"
+            )
+
+    try:
+        image = await process_image(bytes(data))
+    except InvalidImage as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+    image_hash = hashlib.sha256(image).digest()
+
+    async with db.transaction():
+        if not (
+            user := await db.fetch_one(
+                "SELECT image FROM Users WHERE id = %s FOR UPDATE", (user_id,)
+            )
+        ):
+            return False
+
+        # Locks the image's row, so it cannot be released before the user refers to it.
+        await db.execute(
+            "INSERT INTO Images (hash, data) VALUES (%s, %s) ON DUPLICATE KEY UPDATE hash = hash",
+            (image_hash, image),
+        )
+        await db.execute(
+            "UPDATE Users SET image = %s WHERE id = %s", (image_hash, user_id)
+        )
 
-    image = image.reduce(min(width // IMAGE_SIZE, height // IMAGE_SIZE))
-    width, height = image.size
+        if user["image"] is not None and bytes(user["image"]) != image_hash:
+            await release_image(db, user["image"])
 
-    if width >= height:
-        center = width // 2
-        image = image.crop((center - IMAGE_RADIUS, 0, center + IMAGE_RADIUS, height))
-    else:
-        center = height // 2
-        image = image.crop((0, center - IMAGE_RADIUS, width, center + IMAGE_RADIUS))
+    return True
 
-    with db.dict_cursor() as cursor:
-        cursor.execute(
-            "UPDATE Users SET image = %s WHERE id = %s", (image.tobytes(), user_id)
-        )
-        db.commit()
 
-        return cursor.lastrowid is not None
+async def release_image(db: Session, image_hash: bytes) -> None:
+    """
+    Delete the image with the given hash if no user refers to it any more.
+
+    Must be called in the transaction which removed the reference.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `image_hash` (`bytes`): the SHA-256 hash of the image
+    """
+    await db.execute(
+        "DELETE FROM Images WHERE hash = %s AND NOT EXISTS (SELECT 1 FROM Users WHERE image = %s)",
+        (image_hash, image_hash),
+    )
@@ -0,0 +1,70 @@
+from database import Session
+from fastapi import HTTPException, status
+from schemas.votes import VoteType
+from votes import VOTE_BUFFER, VOTE_PARENTS
+
+
+async def get_vote(db: Session, parent: str, parent_id: int, user_id: int) -> VoteType:
+    """
+    Get a user's vote on a post or comment, from the vote buffer if it has not been
+    written yet.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `parent` (`str`): the kind of thing voted on, a key of `VOTE_PARENTS`
+        `parent_id` (`int`): the ID of the post or comment
+        `user_id` (`int`): the ID of the user
+
+    Returns
+    -------
+        `VoteType`: the vote
+    """
+    if (vote := VOTE_BUFFER.get(parent, parent_id, user_id)) is not None:
+        return vote
+
+    column, _, _ = VOTE_PARENTS[parent]
+    if not (
+        vote := await db.fetch_one(
+            f"SELECT type FROM Votes WHERE {column} = %s AND user = %s",
+            (parent_id, user_id),
+        )
+    ):
+        return VoteType.NULL
+
+    return VoteType(vote["type"])
+
+
+async def set_vote(
+    db: Session, parent: str, parent_id: int, type: VoteType, user_id: int
+) -> None:
+    """
+    Set a user's vote on a post or comment.
+
+    The vote is buffered and written behind by `VOTE_BUFFER`, which adjusts the
+    parent's `upvotes`, `downvotes` and `score` counters in the same transaction, so
+    they always agree with the `Votes` table once it is written. Only the first vote
+    buffered by a user on a post or comment checks that it exists.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `parent` (`str`): the kind of thing being voted on, a key of `VOTE_PARENTS`
+        `parent_id` (`int`): the ID of the post or comment
+        `type` (`VoteType`): the type of vote to set
+        `user_id` (`int`): the ID of the user
+
+    Raises
+    ------
+        `HTTPException`: if the post or comment does not exist
+    """
+    if VOTE_BUFFER.get(parent, parent_id, user_id) is None:
+        _, table, _ = VOTE_PARENTS[parent]
+        if not await db.fetch_one(
+            f"SELECT id FROM {table} WHERE id = %s", (parent_id,)
+        ):
+            raise HTTPException(
+                status.HTTP_404_NOT_FOUND, detail=f"{parent.capitalize()} not found"
+            )
+
+    VOTE_BUFFER.set(parent, parent_id, user_id, type)
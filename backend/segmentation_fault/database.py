@@ -1,15 +1,578 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from functools import partial
 from os import getenv
+from typing import Any, AsyncIterator, Callable, Iterator, NamedTuple, TypeVar
 
-from mysql.connector import MySQLConnection, connect
+from metrics import observe_query
+from mysql.connector import Error, connect, errorcode
 from mysql.connector.abstracts import MySQLConnectionAbstract
+from schemas.database import PoolStats
 
-db: MySQLConnection = connect(
+Connection = MySQLConnectionAbstract
+""" A connection to the database. """
+
+DB_POOL_MIN_SIZE = int(getenv("DB_POOL_MIN_SIZE", 2))
+""" The number of connections the pool keeps open at all times. """
+
+DB_POOL_MAX_SIZE = int(getenv("DB_POOL_MAX_SIZE", 10))
+""" The maximum number of connections the pool will open. """
+
+DB_POOL_TIMEOUT = float(getenv("DB_POOL_TIMEOUT", 5))
+""" The number of seconds to wait for a connection before giving up. """
+
+DB_POOL_HEALTH_CHECK_INTERVAL = float(getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+""" The number of seconds a connection may sit idle before it is pinged on checkout. """
+
+DB_PREPARED_STATEMENTS = int(getenv("DB_PREPARED_STATEMENTS", 100))
+""" The maximum number of statements kept prepared on each connection, or 0 to send every statement as text. """
+
+NAMED_PARAMETER = re.compile(r"%\((\w+)\)s")
+""" The pattern of a named parameter, e.g. `%(id)s`. """
+
+LOGGER = logging.getLogger(__name__)
+""" The logger for the database module. """
+
+T = TypeVar("T")
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class PreparedStatements:
+    """
+    The statements prepared on a connection, each with the cursor which executes it.
+
+    A statement is prepared the second time it is executed, and executed by handle
+    thereafter, so MySQL parses and plans each once per connection while statements
+    built per call, such as those with `IN` lists, are sent as text rather than
+    prepared to be used once. Once `max_size` are prepared, those used least recently
+    are closed, so the server's limit cannot be exhausted. Statements MySQL cannot
+    prepare are always sent as text.
+
+    Named parameters are rewritten as positional ones once per statement, and the
+    rewritten statement is passed to the driver as the same object every time, which
+    is how the driver recognises a statement it has already prepared.
+    """
+
+    def __init__(self, connection: Connection, max_size: int):
+        """
+        Parameters
+        ----------
+            `connection` (`Connection`): the connection the statements are prepared on
+            `max_size` (`int`): the maximum number of statements kept prepared
+        """
+        self.connection = connection
+        self.max_size = max_size
+        self._statements: OrderedDict[
+            str, tuple[Any, str, tuple[str, ...]]
+        ] = OrderedDict()
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._unpreparable: set[str] = set()
+
+    def execute(self, query: str, params: Any) -> Any | None:
+        """
+        Executes a statement by handle, if it is prepared or is executed often enough
+        to be.
+
+        Parameters
+        ----------
+            `query` (`str`): the statement to execute
+            `params` (`Any`): the parameters of the statement, by position or name
+
+        Returns
+        -------
+            `Any | None`: the cursor the statement was executed on, whose results must
+            be fetched before the next statement, or `None` if it must be sent as text
+        """
+        if query in self._unpreparable:
+            return None
+
+        if (statement := self._statements.get(query)) is not None:
+            self._statements.move_to_end(query)
+        elif query not in self._seen:
+            self._seen[query] = None
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return None
+        else:
+            del self._seen[query]
+            statement = (
+                self.connection.cursor(prepared=True, dictionary=True),
+                NAMED_PARAMETER.sub("%s", query),
+                tuple(NAMED_PARAMETER.findall(query)),
+            )
+            self._statements[query] = statement
+            if len(self._statements) > self.max_size:
+                self._close(self._statements.popitem(last=False)[1])
+
+        cursor, operation, names = statement
+        if names:
+            params = tuple(params[name] for name in names)
+
+        try:
+            cursor.execute(operation, params)
+        except Error as error:
+            if error.errno != errorcode.ER_UNSUPPORTED_PS:
+                raise
+            self._close(self._statements.pop(query))
+            self._unpreparable.add(query)
+            return None
+
+        return cursor
+
+    def clear(self) -> None:
+        """Forgets every statement, as a connection does when it reconnects."""
+        self._statements.clear()
+        self._seen.clear()
+
+    @staticmethod
+    def _close(statement: tuple[Any, str, tuple[str, ...]]) -> None:
+        try:
+            statement[0].close()
+        except Error:
+            pass
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of connections to the database.
+
+    Connections are opened lazily up to `max_size`, health-checked on checkout if
+    they have been idle for longer than `health_check_interval`, and transparently
+    replaced if they have been dropped by the server.
+    """
+
+    def __init__(
+        self,
+        min_size: int,
+        max_size: int,
+        timeout: float,
+        health_check_interval: float,
+        **connect_args,
+    ):
+        """
+        Parameters
+        ----------
+            `min_size` (`int`): the number of connections to keep open
+            `max_size` (`int`): the maximum number of connections to open
+            `timeout` (`float`): the number of seconds to wait for a connection
+            `health_check_interval` (`float`): the idle time after which a connection is pinged
+            `connect_args`: the arguments to open each connection with
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError(
+                "Pool sizes must satisfy 0 <= min_size <= max_size, 1 <= max_size"
+            )
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connect_args = connect_args
+
+        self._idle: deque[tuple[Connection, float]] = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._waiting = 0
+        self._wait_time = 0.0
+
+    def open(self) -> None:
+        """Opens connections until the pool holds at least `min_size` of them."""
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+
+            self.release(connection)
+
+    def close(self) -> None:
+        """Closes every idle connection in the pool."""
+        with self._condition:
+            while self._idle:
+                connection, _ = self._idle.popleft()
+                self._size -= 1
+                self._discard(connection)
+
+    def acquire(self) -> Connection:
+        """
+        Checks out a connection from the pool.
+
+        Raises
+        ------
+            `PoolTimeout`: if no connection becomes available within `timeout` seconds
+
+        Returns
+        -------
+            `Connection`: a healthy connection
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._condition:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    if (remaining := deadline - time.monotonic()) <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s"
+                        )
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    connection, released = self._idle.pop()
+                else:
+                    connection, released = None, 0.0
+                    self._size += 1
+            finally:
+                self._waiting -= 1
+
+            self._checkouts += 1
+            self._wait_time += time.monotonic() - started
+
+        try:
+            if connection is None:
+                return self._connect()
+
+            if time.monotonic() - released >= self.health_check_interval:
+                self._check(connection)
+
+            return connection
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection: Connection) -> None:
+        """
+        Returns a connection to the pool.
+
+        Any uncommitted transaction is rolled back. Broken connections are closed
+        rather than returned.
+
+        Parameters
+        ----------
+            `connection` (`Connection`): the connection to return
+        """
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            healthy = connection.is_connected()
+        except Error:
+            healthy = False
+
+        with self._condition:
+            if healthy:
+                self._idle.append((connection, time.monotonic()))
+            else:
+                self._size -= 1
+                self._discard(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """Checks out a connection for the duration of a `with` block."""
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self) -> PoolStats:
+        """
+        Returns a snapshot of the pool's utilisation.
+
+        Returns
+        -------
+            `PoolStats`: the pool's statistics
+        """
+        with self._condition:
+            return PoolStats(
+                min_size=self.min_size,
+                max_size=self.max_size,
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                waiting=self._waiting,
+                checkouts=self._checkouts,
+                timeouts=self._timeouts,
+                reconnects=self._reconnects,
+                average_wait=self._wait_time / self._checkouts
+                if self._checkouts
+                else 0.0,
+            )
+
+    def _connect(self) -> Connection:
+        connection = connect(**self.connect_args)
+        if DB_PREPARED_STATEMENTS:
+            connection.statements = PreparedStatements(
+                connection, DB_PREPARED_STATEMENTS
+            )
+        return connection
+
+    def _check(self, connection: Connection) -> None:
+        try:
+            connection.ping(reconnect=False)
+        except Error:
+            LOGGER.info("Reconnecting dropped database connection")
+            connection.reconnect(attempts=3, delay=0)
+            if statements := getattr(connection, "statements", None):
+                statements.clear()
+            with self._condition:
+                self._reconnects += 1
+
+    @staticmethod
+    def _discard(connection: Connection) -> None:
+        try:
+            connection.close()
+        except Error:
+            pass
+
+
+pool = ConnectionPool(
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
     user=getenv("DB_USER"),
     password=getenv("DB_PASSWORD"),
     host=getenv("DB_HOST"),
     database=getenv("DB_NAME"),
-    buffered=True,
 )
+""" The pool of connections to the database. """
+
+
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=DB_POOL_MAX_SIZE, thread_name_prefix="database"
+)
+""" The executor blocking database calls are offloaded to, one thread per connection. """
+
+
+class ExecuteResult(NamedTuple):
+    lastrowid: int | None
+    rowcount: int
+
+
+class Session:
+    """
+    Non-blocking access to a pooled connection.
+
+    Every call runs the blocking driver on `EXECUTOR`, so the event loop is free to
+    serve other requests while a query is in flight. Calls on a single session must
+    be awaited one at a time, as the underlying connection is not thread-safe. The
+    time each statement takes is recorded by `metrics.observe_query`.
+    """
+
+    def __init__(self, connection: Connection):
+        """
+        Parameters
+        ----------
+            `connection` (`Connection`): the connection to wrap
+        """
+        self.connection = connection
+        self._depth = 0
+
+    async def run(self, function: Callable[..., T], *args) -> T:
+        """
+        Runs a blocking function which takes the connection as its first argument.
+
+        Parameters
+        ----------
+            `function` (`Callable[..., T]`): the function to run
+            `args`: any further arguments to the function
+
+        Returns
+        -------
+            `T`: the function's result
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            EXECUTOR, partial(function, self.connection, *args)
+        )
+
+    async def fetch_one(self, query: str, params: Any = ()) -> dict | None:
+        """
+        Executes a query and returns its first row.
+
+        Parameters
+        ----------
+            `query` (`str`): the query to execute
+            `params` (`Any`): the parameters of the query
+
+        Returns
+        -------
+            `dict | None`: the first row, if any
+        """
+        return await self._timed(query, _fetch_one, query, params)
+
+    async def fetch_all(self, query: str, params: Any = ()) -> list[dict]:
+        """
+        Executes a query and returns every row.
+
+        Parameters
+        ----------
+            `query` (`str`): the query to execute
+            `params` (`Any`): the parameters of the query
+
+        Returns
+        -------
+            `list[dict]`: the rows
+        """
+        return await self._timed(query, _fetch_all, query, params)
+
+    async def execute(self, query: str, params: Any = ()) -> ExecuteResult:
+        """
+        Executes a statement.
+
+        Parameters
+        ----------
+            `query` (`str`): the statement to execute
+            `params` (`Any`): the parameters of the statement
+
+        Returns
+        -------
+            `ExecuteResult`: the last inserted ID and the number of affected rows
+        """
+        return await self._timed(query, _execute, query, params)
+
+    async def commit(self) -> None:
+        """Commits the current transaction."""
+        await self._timed("COMMIT", Connection.commit)
+
+    async def rollback(self) -> None:
+        """Rolls back the current transaction."""
+        await self._timed("ROLLBACK", Connection.rollback)
+
+    async def _timed(self, statement: str, function: Callable[..., T], *args) -> T:
+        # Times the wait for a thread as well, as the request waits for both.
+        started = time.perf_counter()
+        try:
+            return await self.run(function, *args)
+        finally:
+            observe_query(statement, time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator["Session"]:
+        """
+        Commits the statements executed in a `with` block, or rolls them back on error.
+
+        Blocks nested in another join its transaction, which is committed or rolled
+        back as a whole by the outermost block.
+        """
+        self._depth += 1
+        try:
+            if self._depth > 1:
+                yield self
+                return
+
+            try:
+                yield self
+            except BaseException:
+                await self.rollback()
+                raise
+            await self.commit()
+        finally:
+            self._depth -= 1
+
+
+def _fetch_one(connection: Connection, query: str, params: Any) -> dict | None:
+    # Prepared statements' results must all be read, so every row is fetched.
+    with _cursor(connection, query, params) as cursor:
+        rows = cursor.fetchall()
+        return rows[0] if rows else None
+
+
+def _fetch_all(connection: Connection, query: str, params: Any) -> list[dict]:
+    with _cursor(connection, query, params) as cursor:
+        return cursor.fetchall()
+
+
+def _execute(connection: Connection, query: str, params: Any) -> ExecuteResult:
+    with _cursor(connection, query, params) as cursor:
+        return ExecuteResult(cursor.lastrowid, cursor.rowcount)
+
+
+@contextmanager
+def _cursor(connection: Connection, query: str, params: Any) -> Iterator[Any]:
+    """Executes a statement prepared if the connection can, and as text otherwise."""
+    if (statements := getattr(connection, "statements", None)) and (
+        cursor := statements.execute(query, params)
+    ) is not None:
+        yield cursor
+        return
+
+    with connection.dict_cursor() as cursor:
+        cursor.execute(query, params)
+        yield cursor
+
+
+@asynccontextmanager
+async def session() -> AsyncIterator[Session]:
+    """
+    Checks out a pooled connection as a `Session` for the duration of a `with` block.
+
+    Checkout waits on the loop's default executor rather than `EXECUTOR`, so that
+    sessions waiting for a connection never starve those holding one of a thread.
+    """
+    loop = asyncio.get_running_loop()
+    connection = await loop.run_in_executor(None, pool.acquire)
+    try:
+        yield Session(connection)
+    finally:
+        await loop.run_in_executor(EXECUTOR, pool.release, connection)
+
+
+async def get_db() -> AsyncIterator[Session]:
+    """
+    Dependency which checks out a session for the duration of a request.
+
+    Returns
+    -------
+        `Session`: a session on a pooled connection
+    """
+    async with session() as db:
+        yield db
+
+
+def placeholders(values) -> str:
+    """
+    Returns a placeholder for each of the given values, for an `IN` list.
+
+    Parameters
+    ----------
+        `values` (`Collection`): the values
+
+    Returns
+    -------
+        `str`: the comma-separated placeholders
+    """
+    return ", ".join(["%s"] * len(values))
+
 
 # Monkey patch the `MySQLConnectionAbstract` class to have a cursor which returns dictionaries.
-MySQLConnectionAbstract.dict_cursor = lambda self: self.cursor(dictionary=True)
+# Connections are unbuffered, as the driver has no buffered prepared cursor, so it is
+# buffered itself.
+MySQLConnectionAbstract.dict_cursor = lambda self: self.cursor(
+    buffered=True, dictionary=True
+)
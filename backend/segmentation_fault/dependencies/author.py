@@ -1,27 +1,35 @@
 from controllers.auth import get_current_user
-from database import db
+from database import Session, get_db
 from fastapi import Depends, HTTPException
 from schemas.users import User
 
 
 class Author:
-    def __call__(
+    """
+    Requires the current user to be the author of the comment or post in the path.
+
+    Instances are the dependency, so routes depend on `Depends(Author())`; depending
+    on the class itself would only construct it.
+    """
+
+    async def __call__(
         self,
-        comment_id: str | None = None,
-        post_id: str | None = None,
+        comment_id: int | None = None,
+        post_id: int | None = None,
         user: User = Depends(get_current_user),
+        db: Session = Depends(get_db),
     ):
-        with db.dict_cursor() as cursor:
-            cursor.execute(
-                "SELECT * FROM %s WHERE id = %s AND user = %s",
+        if (
+            await db.fetch_one(
+                f"SELECT id FROM {'Comments' if comment_id is not None else 'Posts'} WHERE id = %s AND author = %s",
                 (
-                    "Comments" if comment_id is not None else "Posts",
                     comment_id if comment_id is not None else post_id,
                     user.id,
                 ),
             )
-            if cursor.fetchone() is None:
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"You are not the author of this {'comment' if comment_id is not None else 'post'}",
-                )
+            is None
+        ):
+            raise HTTPException(
+                status_code=403,
+                detail=f"You are not the author of this {'comment' if comment_id is not None else 'post'}",
+            )
@@ -0,0 +1,34 @@
+from os import getenv
+from secrets import compare_digest
+
+from fastapi import Header, HTTPException, status
+
+MONITORING_TOKEN = getenv("MONITORING_TOKEN", "")
+""" The bearer token requests for metrics and health statistics must present, or empty to not serve them at all. """
+
+
+async def monitoring_token(authorization: str | None = Header(None)) -> None:
+    """
+    Dependency which only lets requests bearing `MONITORING_TOKEN` through, as the
+    metrics and health statistics of the server describe its internals and traffic.
+
+    Parameters
+    ----------
+        `authorization` (`str | None`): the `Authorization` header of the request
+
+    Raises
+    ------
+        `HTTPException`: if no token is configured, or the request does not bear it
+    """
+    if not MONITORING_TOKEN:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not compare_digest(
+        token.encode(), MONITORING_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid monitoring token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -0,0 +1,101 @@
+import io
+import warnings
+from os import getenv
+
+from PIL import Image, ImageOps
+from workers import WorkerPool
+
+IMAGE_SIZE = 48
+""" The width and height images are cropped and scaled to. """
+
+IMAGE_QUALITY = 85
+""" The JPEG quality images are stored with. """
+
+MAX_IMAGE_UPLOAD_SIZE = int(getenv("MAX_IMAGE_UPLOAD_SIZE", 10 * 1024 * 1024))
+""" The maximum size, in bytes, of an uploaded image. """
+
+MAX_IMAGE_PIXELS = int(getenv("MAX_IMAGE_PIXELS", 40_000_000))
+""" The maximum number of pixels an uploaded image may decode to. """
+
+IMAGE_WORKERS = int(getenv("IMAGE_WORKERS", 1))
+""" The number of processes each server worker processes images on. """
+
+IMAGE_QUEUE_SIZE = int(getenv("IMAGE_QUEUE_SIZE", 16))
+""" The number of images which may wait for a process before uploads are rejected. """
+
+IMAGE_POOL = WorkerPool("images", IMAGE_WORKERS, IMAGE_QUEUE_SIZE)
+""" The pool images are processed on. """
+
+
+class InvalidImage(Exception):
+    """Raised when an uploaded image cannot be decoded or is too large."""
+
+
+async def process_image(data: bytes) -> bytes:
+    """
+    Crops an uploaded image to a centred square, scales it to `IMAGE_SIZE` and
+    encodes it, on `IMAGE_POOL`.
+
+    Parameters
+    ----------
+        `data` (`bytes`): the uploaded image
+
+    Raises
+    ------
+        `InvalidImage`: if the image cannot be decoded or has too many pixels
+
+    Returns
+    -------
+        `bytes`: the encoded image
+    """
+    return await IMAGE_POOL.run(_process, data, MAX_IMAGE_PIXELS)
+
+
+def encode_image(image: Image.Image) -> bytes:
+    """
+    Encodes an image in the format it is stored and served in.
+
+    Parameters
+    ----------
+        `image` (`Image.Image`): the image
+
+    Returns
+    -------
+        `bytes`: the encoded image
+    """
+    result = io.BytesIO()
+    image.convert("RGB").save(result, "JPEG", quality=IMAGE_QUALITY)
+    return result.getvalue()
+
+
+def _process(data: bytes, max_pixels: int) -> bytes:
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+    with warnings.catch_warnings():
+        # Pillow only warns about images between one and two times the limit.
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+        try:
+            image = Image.open(io.BytesIO(data))
+
+            # Let JPEGs decode straight to a reduced scale, no smaller than needed.
+            image.draft("RGB", (IMAGE_SIZE, IMAGE_SIZE))
+
+            image = ImageOps.exif_transpose(image)
+
+            # Crop the centred square and scale it in one pass, scaling up if needed.
+            width, height = image.size
+            side = min(width, height)
+            left, top = (width - side) // 2, (height - side) // 2
+            image = image.resize(
+                (IMAGE_SIZE, IMAGE_SIZE),
+                Image.Resampling.LANCZOS,
+                box=(left, top, left + side, top + side),
+                reducing_gap=2.0,
+            )
+        except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+            raise InvalidImage("Image is too large")
+        except (OSError, SyntaxError, ValueError):
+            raise InvalidImage("Invalid image")
+
+    return encode_image(image)
@@ -0,0 +1,470 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from os import getenv
+from typing import Any, Protocol
+
+from database import Session, session
+from fastapi import WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from schemas.live import LiveStats
+
+LOGGER = logging.getLogger(__name__)
+
+LIVE_TRANSPORT = getenv("LIVE_TRANSPORT", "database")
+""" How events reach every server worker: `database` through `LiveEvents`, or `local` to only reach the worker publishing them. """
+
+LIVE_POLL_INTERVAL = float(getenv("LIVE_POLL_INTERVAL", 0.2))
+""" The number of seconds between each worker's reads of new events, while they keep arriving. """
+
+LIVE_MAX_POLL_INTERVAL = float(getenv("LIVE_MAX_POLL_INTERVAL", 1))
+""" The number of seconds reads of new events back off to while none arrive. """
+
+LIVE_BATCH_SIZE = int(getenv("LIVE_BATCH_SIZE", 500))
+""" The maximum number of events read at once. """
+
+LIVE_RETENTION = int(getenv("LIVE_RETENTION", 60))
+""" The number of seconds events are kept for before they are deleted. """
+
+LIVE_GAP_TIMEOUT = float(getenv("LIVE_GAP_TIMEOUT", 5))
+""" The number of seconds to wait for an event whose ID was skipped, as its transaction may not have committed yet. """
+
+LIVE_QUEUE_SIZE = int(getenv("LIVE_QUEUE_SIZE", 256))
+""" The number of events a subscriber may fall behind by before it is disconnected. """
+
+LIVE_MAX_TOPICS = 50
+""" The maximum number of topics a subscriber may subscribe to. """
+
+TOPIC = re.compile(r"feed|post:[1-9][0-9]{0,9}")
+""" The topics which can be subscribed to: every post, or a single post. """
+
+
+class Subscriber:
+    """A connection subscribed to topics, with the events queued for it."""
+
+    def __init__(self):
+        self.topics: set[str] = set()
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(LIVE_QUEUE_SIZE)
+        self.overflowed = False
+
+
+class LiveHub:
+    """
+    Pushes events to the subscribers connected to this server worker.
+
+    Each event is serialised once, however many subscribers it is pushed to. A
+    subscriber which falls `LIVE_QUEUE_SIZE` events behind is disconnected rather
+    than buffered for without bound, and should reconnect and refetch.
+    """
+
+    def __init__(self):
+        self._topics: dict[str, set[Subscriber]] = {}
+        self._subscribers: set[Subscriber] = set()
+        self._received = 0
+        self._delivered = 0
+        self._overflowed = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self, subscriber: Subscriber, topic: str) -> None:
+        """
+        Subscribes a subscriber to a topic.
+
+        Parameters
+        ----------
+            `subscriber` (`Subscriber`): the subscriber
+            `topic` (`str`): the topic, matching `TOPIC`
+        """
+        subscriber.topics.add(topic)
+        self._topics.setdefault(topic, set()).add(subscriber)
+        self._subscribers.add(subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber, topic: str) -> None:
+        """
+        Unsubscribes a subscriber from a topic.
+
+        Parameters
+        ----------
+            `subscriber` (`Subscriber`): the subscriber
+            `topic` (`str`): the topic
+        """
+        subscriber.topics.discard(topic)
+        if (subscribers := self._topics.get(topic)) is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+
+    def remove(self, subscriber: Subscriber) -> None:
+        """
+        Unsubscribes a subscriber from every topic.
+
+        Parameters
+        ----------
+            `subscriber` (`Subscriber`): the subscriber
+        """
+        for topic in list(subscriber.topics):
+            self.unsubscribe(subscriber, topic)
+        self._subscribers.discard(subscriber)
+
+    def deliver(self, topics: list[str], message: str) -> None:
+        """
+        Queues a serialised event for every subscriber to any of its topics.
+
+        Parameters
+        ----------
+            `topics` (`list[str]`): the topics of the event
+            `message` (`str`): the serialised event
+        """
+        self._received += 1
+        subscribers = set()
+        for topic in topics:
+            subscribers |= self._topics.get(topic, set())
+
+        for subscriber in subscribers:
+            if subscriber.overflowed:
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+                self._delivered += 1
+            except asyncio.QueueFull:
+                # Make room to tell the connection to close once it has caught up.
+                subscriber.overflowed = True
+                self._overflowed += 1
+                subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "subscribers": len(self._subscribers),
+            "topics": len(self._topics),
+            "received": self._received,
+            "delivered": self._delivered,
+            "overflowed": self._overflowed,
+        }
+
+
+Event = tuple[list[str], dict[str, Any]]
+""" The topics of an event, and the event, with an `event` naming its kind. """
+
+
+class Broker(Protocol):
+    async def publish(self, db: Session, events: list[Event]) -> None:
+        ...
+
+    def start(self) -> None:
+        ...
+
+    async def stop(self) -> None:
+        ...
+
+    def stats(self) -> LiveStats:
+        ...
+
+
+class LocalBroker:
+    """
+    Pushes events to the subscribers of the worker publishing them only, as soon as
+    they are published. Suits a single server worker.
+    """
+
+    def __init__(self, hub: LiveHub):
+        """
+        Parameters
+        ----------
+            `hub` (`LiveHub`): the subscribers of this worker
+        """
+        self.hub = hub
+        self._published = 0
+
+    async def publish(self, db: Session, events: list[Event]) -> None:
+        for topics, event in events:
+            self._published += 1
+            self.hub.deliver(topics, json.dumps(jsonable_encoder(event)))
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def stats(self) -> LiveStats:
+        return LiveStats(
+            **self.hub.stats(), published=self._published, polls=0, failures=0
+        )
+
+
+class DatabaseBroker:
+    """
+    Fans events out to every server worker through the `LiveEvents` table.
+
+    Publishing inserts the event in the caller's transaction, so it is pushed if
+    and only if the change it describes commits. Every worker with subscribers reads
+    new events and pushes them to its own, in order of their IDs other than those
+    whose transactions committed late. Reads are `LIVE_POLL_INTERVAL` seconds apart
+    while events arrive, backing off to `LIVE_MAX_POLL_INTERVAL` while none do, so
+    events arrive within about that long of being committed. A worker without
+    subscribers does not read events at all, only pruning them.
+
+    IDs are allocated when an event is inserted rather than when it commits, so a
+    worker which reads past an uncommitted event's ID keeps rereading from it for up
+    to `LIVE_GAP_TIMEOUT` seconds, pushing only the events it has not pushed before.
+    """
+
+    def __init__(self, hub: LiveHub):
+        """
+        Parameters
+        ----------
+            `hub` (`LiveHub`): the subscribers of this worker
+        """
+        self.hub = hub
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._after: int | None = None
+        self._pushed: set[int] = set()
+        self._gap_since: float | None = None
+        self._pruned = 0.0
+        self._published = 0
+        self._polls = 0
+        self._failures = 0
+
+    async def publish(self, db: Session, events: list[Event]) -> None:
+        if not events:
+            return
+
+        async with db.transaction():
+            await db.execute(
+                f"INSERT INTO LiveEvents (topics, payload) VALUES {', '.join(['(%s, %s)'] * len(events))}",
+                tuple(
+                    value
+                    for topics, event in events
+                    for value in (" ".join(topics), json.dumps(jsonable_encoder(event)))
+                ),
+            )
+        self._published += len(events)
+        # Read soon, rather than after backing off, as events are arriving.
+        self._wake.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._stopping.set()
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+
+    def stats(self) -> LiveStats:
+        return LiveStats(
+            **self.hub.stats(),
+            published=self._published,
+            polls=self._polls,
+            failures=self._failures,
+        )
+
+    async def poll(self, db: Session) -> int:
+        """
+        Pushes the events committed since the last poll to this worker's subscribers.
+
+        Parameters
+        ----------
+            `db` (`Session`): the database session
+
+        Returns
+        -------
+            `int`: the number of events pushed
+        """
+        self._polls += 1
+        if self._after is None or not self.hub:
+            # Nobody is listening, so skip to the latest event.
+            latest = await db.fetch_one("SELECT MAX(id) AS id FROM LiveEvents")
+            self._after, self._pushed, self._gap_since = latest["id"] or 0, set(), None
+            return 0
+
+        events = await db.fetch_all(
+            f"SELECT id, topics, payload FROM LiveEvents WHERE id > %s ORDER BY id LIMIT {LIVE_BATCH_SIZE}",
+            (self._after,),
+        )
+        pushed = 0
+        for event in events:
+            if event["id"] not in self._pushed:
+                self._pushed.add(event["id"])
+                self.hub.deliver(event["topics"].split(), event["payload"])
+                pushed += 1
+
+        self._advance()
+        return pushed
+
+    def _advance(self) -> None:
+        # Move past every pushed event which follows the last one without a gap,
+        # and past a gap once its event has had long enough to commit.
+        while True:
+            while self._after + 1 in self._pushed:
+                self._after += 1
+                self._pushed.remove(self._after)
+
+            if not self._pushed:
+                self._gap_since = None
+                return
+
+            now = time.monotonic()
+            if self._gap_since is None:
+                self._gap_since = now
+            if now - self._gap_since < LIVE_GAP_TIMEOUT:
+                return
+
+            self._after = min(self._pushed) - 1
+            self._gap_since = None
+
+    async def _prune(self, db: Session) -> None:
+        async with db.transaction():
+            await db.execute(
+                "DELETE FROM LiveEvents WHERE created < NOW() - INTERVAL %s SECOND LIMIT 10000",
+                (LIVE_RETENTION,),
+            )
+
+    async def _run(self) -> None:
+        interval = LIVE_POLL_INTERVAL
+        while not self._stopping.is_set():
+            listening = bool(self.hub)
+            pruning = time.monotonic() - self._pruned > LIVE_RETENTION
+            pushed = 0
+            if listening or pruning:
+                try:
+                    async with session() as db:
+                        if listening:
+                            pushed = await self.poll(db)
+                        if pruning:
+                            self._pruned = time.monotonic()
+                            await self._prune(db)
+                except Exception:
+                    self._failures += 1
+                    LOGGER.exception("Failed to read live events")
+
+            if not listening:
+                # Once someone listens, read from the latest event rather than
+                # replaying those published meanwhile. Until then, only the hub is
+                # checked, which costs no query.
+                self._after = None
+                interval = LIVE_POLL_INTERVAL
+            elif pushed or self._pushed:
+                interval = LIVE_POLL_INTERVAL
+            else:
+                interval = min(interval * 2, LIVE_MAX_POLL_INTERVAL)
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+                interval = LIVE_POLL_INTERVAL
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+
+async def stream(websocket: WebSocket) -> None:
+    """
+    Pushes events to an accepted WebSocket connection, for as long as it is open.
+
+    The client subscribes and unsubscribes by sending `{"subscribe": topic}` and
+    `{"unsubscribe": topic}`, where a topic is `feed` for every post, or `post:<id>`
+    for a single post and its comments. Events are pushed as JSON objects with an
+    `event` naming their kind.
+
+    Parameters
+    ----------
+        `websocket` (`WebSocket`): the connection
+    """
+    subscriber = Subscriber()
+
+    async def receive() -> None:
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except (json.JSONDecodeError, KeyError):
+                await websocket.send_json({"error": "Invalid message"})
+                continue
+
+            if not isinstance(message, dict) or len(message) != 1:
+                await websocket.send_json({"error": "Invalid message"})
+                continue
+
+            [(action, topic)] = message.items()
+            if action not in ("subscribe", "unsubscribe") or not (
+                isinstance(topic, str) and TOPIC.fullmatch(topic)
+            ):
+                await websocket.send_json({"error": "Invalid message"})
+            elif action == "unsubscribe":
+                LIVE_HUB.unsubscribe(subscriber, topic)
+            elif len(subscriber.topics | {topic}) > LIVE_MAX_TOPICS:
+                await websocket.send_json({"error": "Too many topics"})
+            else:
+                LIVE_HUB.subscribe(subscriber, topic)
+
+    async def send() -> None:
+        while (message := await subscriber.queue.get()) is not None:
+            await websocket.send_text(message)
+
+        await websocket.close(status.WS_1013_TRY_AGAIN_LATER)
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), (WebSocketDisconnect, type(None))):
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        LIVE_HUB.remove(subscriber)
+
+
+async def publish(db: Session, topics: list[str], event: dict[str, Any]) -> None:
+    """
+    Publishes an event to the subscribers to any of its topics. Call it within the
+    transaction of the change the event describes.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `topics` (`list[str]`): the topics of the event
+        `event` (`dict[str, Any]`): the event, with an `event` naming its kind
+    """
+    await LIVE_BROKER.publish(db, [(topics, event)])
+
+
+def broker(hub: LiveHub) -> Broker:
+    """
+    Returns the broker configured by `LIVE_TRANSPORT`.
+
+    Parameters
+    ----------
+        `hub` (`LiveHub`): the subscribers of this worker
+
+    Returns
+    -------
+        `Broker`: the broker
+    """
+    if LIVE_TRANSPORT == "local":
+        return LocalBroker(hub)
+    if LIVE_TRANSPORT == "database":
+        return DatabaseBroker(hub)
+
+    raise ValueError(f"Unsupported live transport {LIVE_TRANSPORT}")
+
+
+LIVE_HUB = LiveHub()
+""" The subscribers connected to this worker. """
+
+LIVE_BROKER = broker(LIVE_HUB)
+""" The broker fanning events out to every worker. """
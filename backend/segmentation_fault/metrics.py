@@ -0,0 +1,332 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getenv
+from typing import Callable, Iterator
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from schemas.cache import CacheStats, ResponseCacheStats
+from schemas.database import PoolStats
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LOGGER = logging.getLogger(__name__)
+
+METRICS_DIR = getenv("PROMETHEUS_MULTIPROC_DIR", "")
+""" The directory the server's workers write their metrics to, so that any of them can serve every worker's metrics, or empty if the server has one worker. """
+
+METRICS_EXPORT_INTERVAL = float(getenv("METRICS_EXPORT_INTERVAL", 5))
+""" The number of seconds between exports of each worker's pool and cache statistics. """
+
+QUERY_OPERATIONS = ("select", "insert", "update", "delete", "commit", "rollback")
+""" The operations database time is broken down by, any other being `other`. """
+
+# Metrics without labels are written to the directory as soon as they are defined.
+if METRICS_DIR:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+REQUESTS = Counter("http_requests", "Requests served.", ["method", "route", "status"])
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time taken to serve a request.",
+    ["method", "route"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being served.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database statements executed while serving a request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds",
+    "Time spent waiting on the database while serving a request.",
+    ["route"],
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Time taken to execute a database statement, including waiting for a thread.",
+    ["operation"],
+)
+TASK_DURATION = Histogram(
+    "background_task_duration_seconds",
+    "Time taken by a background task.",
+    ["task", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Open database connections.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+POOL_WAITING = Gauge(
+    "db_pool_waiting",
+    "Requests waiting for a database connection.",
+    multiprocess_mode="livesum",
+)
+POOL_EVENTS = Counter(
+    "db_pool_events", "Database connection checkouts and failures.", ["event"]
+)
+CACHE_SIZE = Gauge(
+    "cache_size", "Entries held by a cache.", ["cache"], multiprocess_mode="livesum"
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups", "Lookups in a cache, by result.", ["cache", "result"]
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions", "Entries evicted from a cache to make room.", ["cache"]
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups",
+    "Lookups in the response cache, by route and result.",
+    ["route", "result"],
+)
+
+QUERIES: ContextVar["QueryTally | None"] = ContextVar("queries", default=None)
+""" The tally of the statements executed for the request being served, if any. """
+
+
+class QueryTally:
+    """The number of statements executed for a request, and the time they took."""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def observe_query(statement: str, seconds: float) -> None:
+    """
+    Records the time taken to execute a database statement, against the request
+    being served if any.
+
+    Parameters
+    ----------
+        `statement` (`str`): the statement
+        `seconds` (`float`): the time taken to execute it
+    """
+    start = statement.lstrip()[:8].lower()
+    QUERY_DURATION.labels(
+        next((op for op in QUERY_OPERATIONS if start.startswith(op)), "other")
+    ).observe(seconds)
+
+    if (tally := QUERIES.get()) is not None:
+        tally.count += 1
+        tally.seconds += seconds
+
+
+@contextmanager
+def track(task: str) -> Iterator[None]:
+    """
+    Records the duration of a background task run in a `with` block, and whether it
+    raised.
+
+    Parameters
+    ----------
+        `task` (`str`): the name of the task
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        TASK_DURATION.labels(task, outcome).observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """
+    Records the count, status and latency of requests by route, how many are in
+    progress, and the statements each executes.
+
+    Requests are labelled by their route's path, such as `/posts/{post_id}`, rather
+    than the requested path, so each route has one series, and requests matching no
+    route share one.
+    """
+
+    def __init__(self, app: ASGIApp):
+        """
+        Parameters
+        ----------
+            `app` (`ASGIApp`): the application
+        """
+        self.app = app
+        self._routes: dict[object, str] | None = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        tally = QueryTally()
+        token = QUERIES.set(tally)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            duration = time.perf_counter() - started
+            in_progress.dec()
+            QUERIES.reset(token)
+
+            route = self._route(scope)
+            REQUESTS.labels(method, route, status).inc()
+            REQUEST_DURATION.labels(method, route).observe(duration)
+            REQUEST_QUERIES.labels(route).observe(tally.count)
+            REQUEST_DB_TIME.labels(route).observe(tally.seconds)
+
+    def _route(self, scope: Scope) -> str:
+        # Routing leaves the matched route's endpoint in the scope.
+        if self._routes is None:
+            self._routes = {
+                getattr(route, "endpoint", None)
+                or getattr(route, "app", None): route.path
+                for route in scope["app"].routes
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+
+class StatsExporter:
+    """
+    Exports a worker's pool and cache statistics as metrics every
+    `METRICS_EXPORT_INTERVAL` seconds.
+
+    The statistics are kept by each worker, but a scrape is served by just one, so
+    they are copied into metrics, which are aggregated across workers. Gauges are
+    summed over the live workers, and counters advance by how far each worker's
+    totals grew since its last export.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._totals: dict[tuple, int] = {}
+
+    def start(
+        self,
+        pool: Callable[[], PoolStats],
+        caches: Callable[[], dict[str, CacheStats]],
+        responses: Callable[[], dict[str, ResponseCacheStats]],
+    ) -> None:
+        """
+        Starts exporting statistics in the background.
+
+        Parameters
+        ----------
+            `pool` (`Callable[[], PoolStats]`): returns the connection pool's statistics
+            `caches` (`Callable[[], dict[str, CacheStats]]`): returns each cache's
+                statistics, by name
+            `responses` (`Callable[[], dict[str, ResponseCacheStats]]`): returns the
+                response cache's statistics, by route
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(pool, caches, responses))
+
+    async def stop(self) -> None:
+        """Stops exporting statistics."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def export(
+        self,
+        pool: PoolStats,
+        caches: dict[str, CacheStats],
+        responses: dict[str, ResponseCacheStats],
+    ) -> None:
+        """
+        Exports snapshots of the statistics.
+
+        Parameters
+        ----------
+            `pool` (`PoolStats`): the connection pool's statistics
+            `caches` (`dict[str, CacheStats]`): each cache's statistics, by name
+            `responses` (`dict[str, ResponseCacheStats]`): the response cache's
+                statistics, by route
+        """
+        POOL_CONNECTIONS.labels("idle").set(pool.idle)
+        POOL_CONNECTIONS.labels("in_use").set(pool.in_use)
+        POOL_WAITING.set(pool.waiting)
+        for event in ("checkouts", "timeouts", "reconnects"):
+            self._advance(POOL_EVENTS, (event,), getattr(pool, event))
+
+        for name, stats in caches.items():
+            CACHE_SIZE.labels(name).set(stats.size)
+            for result in ("hits", "misses"):
+                self._advance(CACHE_LOOKUPS, (name, result), getattr(stats, result))
+            self._advance(CACHE_EVICTIONS, (name,), stats.evictions)
+
+        for route, stats in responses.items():
+            for result in ("hits", "misses", "errors"):
+                self._advance(
+                    RESPONSE_CACHE_LOOKUPS, (route, result), getattr(stats, result)
+                )
+
+    def _advance(self, counter: Counter, labels: tuple[str, ...], total: int) -> None:
+        # A total lower than last exported was reset, and is not counted back.
+        key = (counter, *labels)
+        increase = total - self._totals.get(key, 0)
+        self._totals[key] = total
+        if increase > 0:
+            counter.labels(*labels).inc(increase)
+
+    async def _run(self, pool, caches, responses) -> None:
+        while True:
+            try:
+                self.export(pool(), caches(), responses())
+            except Exception:
+                LOGGER.exception("Failed to export statistics")
+            await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+
+
+def render() -> bytes:
+    """
+    Returns the metrics of every worker in the Prometheus text format.
+
+    Returns
+    -------
+        `bytes`: the metrics
+    """
+    if not METRICS_DIR:
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, METRICS_DIR)
+    return generate_latest(registry)
+
+
+def mark_worker_stopped() -> None:
+    """Drops the gauges of this worker from those summed across workers."""
+    if METRICS_DIR:
+        multiprocess.mark_process_dead(os.getpid(), METRICS_DIR)
+
+
+STATS_EXPORTER = StatsExporter()
+""" The statistics exporter of this worker. """
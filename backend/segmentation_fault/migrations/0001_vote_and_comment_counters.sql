@@ -0,0 +1,23 @@
+ALTER TABLE Posts
+  ADD COLUMN `upvotes` int NOT NULL DEFAULT '0',
+  ADD COLUMN `downvotes` int NOT NULL DEFAULT '0',
+  ADD COLUMN `score` int NOT NULL DEFAULT '0',
+  ADD COLUMN `comment_count` int NOT NULL DEFAULT '0';
+
+ALTER TABLE Comments
+  ADD COLUMN `upvotes` int NOT NULL DEFAULT '0',
+  ADD COLUMN `downvotes` int NOT NULL DEFAULT '0',
+  ADD COLUMN `score` int NOT NULL DEFAULT '0';
+
+UPDATE Posts SET
+  upvotes = (SELECT COUNT(*) FROM Votes WHERE Votes.parent_post = Posts.id AND Votes.type = 'true'),
+  downvotes = (SELECT COUNT(*) FROM Votes WHERE Votes.parent_post = Posts.id AND Votes.type = 'false'),
+  comment_count = (SELECT COUNT(*) FROM Comments WHERE Comments.post = Posts.id);
+
+UPDATE Posts SET score = upvotes - downvotes;
+
+UPDATE Comments SET
+  upvotes = (SELECT COUNT(*) FROM Votes WHERE Votes.parent_comment = Comments.id AND Votes.type = 'true'),
+  downvotes = (SELECT COUNT(*) FROM Votes WHERE Votes.parent_comment = Comments.id AND Votes.type = 'false');
+
+UPDATE Comments SET score = upvotes - downvotes;
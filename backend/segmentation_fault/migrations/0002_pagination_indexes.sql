@@ -0,0 +1,7 @@
+ALTER TABLE Users ADD KEY IDX_USER_CREATED (created, id);
+
+ALTER TABLE Posts ADD KEY IDX_POST_CREATED (created, id);
+
+ALTER TABLE Comments
+  ADD KEY IDX_COMMENT_CREATED (created, id),
+  ADD KEY IDX_COMMENT_POST_CREATED (post, created, id);
@@ -0,0 +1,56 @@
+import hashlib
+import logging
+
+from database import Connection
+from images import IMAGE_SIZE, encode_image
+from PIL import Image
+
+LOGGER = logging.getLogger(__name__)
+
+JPEG_SIGNATURE = b"\xff\xd8"
+""" The bytes every JPEG starts with. """
+
+
+def upgrade(connection: Connection) -> None:
+    """
+    Moves avatars out of `Users.image` into `Images`, keyed by their hash, encoding
+    those stored as raw RGB pixels as they are moved.
+    """
+    with connection.dict_cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS Images (hash binary(32) NOT NULL, data mediumblob NOT NULL, created datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (hash))"
+        )
+        cursor.execute(
+            "ALTER TABLE Users ADD COLUMN image_hash binary(32) DEFAULT NULL AFTER image"
+        )
+
+        cursor.execute("SELECT id FROM Users WHERE image IS NOT NULL")
+        user_ids = [row["id"] for row in cursor.fetchall()]
+
+        # One at a time, so that only one image is held in memory.
+        for user_id in user_ids:
+            cursor.execute("SELECT image FROM Users WHERE id = %s", (user_id,))
+            image = bytes(cursor.fetchone()["image"])
+
+            if not image.startswith(JPEG_SIGNATURE):
+                try:
+                    image = encode_image(
+                        Image.frombytes("RGB", (IMAGE_SIZE, IMAGE_SIZE), image)
+                    )
+                except ValueError:
+                    LOGGER.warning("Dropping unreadable image of user %d", user_id)
+                    continue
+
+            image_hash = hashlib.sha256(image).digest()
+            cursor.execute(
+                "INSERT IGNORE INTO Images (hash, data) VALUES (%s, %s)",
+                (image_hash, image),
+            )
+            cursor.execute(
+                "UPDATE Users SET image_hash = %s WHERE id = %s", (image_hash, user_id)
+            )
+            connection.commit()
+
+        cursor.execute(
+            "ALTER TABLE Users DROP COLUMN image, RENAME COLUMN image_hash TO image, ADD CONSTRAINT FK_USER_IMAGE FOREIGN KEY (image) REFERENCES Images(hash)"
+        )
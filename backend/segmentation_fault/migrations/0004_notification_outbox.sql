@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS `Notifications` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `created` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `type` int NOT NULL,
+  `user` int NOT NULL,
+  `payload` json NOT NULL,
+  `attempts` int NOT NULL DEFAULT '0',
+  `due` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `claimed` datetime DEFAULT NULL,
+  `failed` tinyint(1) NOT NULL DEFAULT '0',
+  `error` text,
+  PRIMARY KEY (`id`),
+  KEY IDX_NOTIFICATION_DUE (failed, due),
+  KEY IDX_NOTIFICATION_USER (user, type)
+);
@@ -0,0 +1,21 @@
+-- Fails if two users share a username or email, which must be resolved by hand.
+ALTER TABLE Users
+  ADD UNIQUE KEY UQ_USER_USERNAME (username),
+  ADD UNIQUE KEY UQ_USER_EMAIL (email);
+
+-- Tokens are case-sensitive, so they are compared in binary.
+ALTER TABLE Tokens
+  MODIFY `token` varchar(64) CHARACTER SET ascii COLLATE ascii_bin NOT NULL,
+  ADD UNIQUE KEY UQ_TOKEN (token);
+
+-- Keep only the latest vote of each user on each post and comment. Run
+-- `python segmentation_fault reconcile` afterwards if any were removed.
+DELETE older FROM Votes older
+  JOIN Votes newer ON newer.parent_post = older.parent_post AND newer.user = older.user AND newer.id > older.id;
+
+DELETE older FROM Votes older
+  JOIN Votes newer ON newer.parent_comment = older.parent_comment AND newer.user = older.user AND newer.id > older.id;
+
+ALTER TABLE Votes
+  ADD UNIQUE KEY UQ_VOTE_POST_USER (parent_post, user),
+  ADD UNIQUE KEY UQ_VOTE_COMMENT_USER (parent_comment, user);
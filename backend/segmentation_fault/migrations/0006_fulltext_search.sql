@@ -0,0 +1,5 @@
+-- Adding the first FULLTEXT index to a table rebuilds it, to add the document ID
+-- column InnoDB keeps its inverted index by, so run this while writes are quiet.
+ALTER TABLE Posts ADD FULLTEXT KEY FT_POST_TEXT (title, content);
+
+ALTER TABLE Comments ADD FULLTEXT KEY FT_COMMENT_TEXT (content);
@@ -0,0 +1,15 @@
+-- Each comment's path is the IDs of its ancestors and itself, as 8 hex digits
+-- each, so a thread is read in order by one range scan of (post, path).
+ALTER TABLE Comments
+  ADD COLUMN `parent` int DEFAULT NULL,
+  ADD COLUMN `depth` int NOT NULL DEFAULT '0',
+  ADD COLUMN `path` varchar(256) CHARACTER SET ascii COLLATE ascii_bin NOT NULL DEFAULT '',
+  ADD COLUMN `reply_count` int NOT NULL DEFAULT '0',
+  ADD CONSTRAINT FK_COMMENT_PARENT FOREIGN KEY (parent) REFERENCES Comments(id);
+
+UPDATE Comments SET path = LPAD(HEX(id), 8, '0');
+
+ALTER TABLE Comments
+  ADD KEY IDX_COMMENT_POST_PATH (post, path),
+  ADD KEY IDX_COMMENT_POST_DEPTH_CREATED (post, depth, created, id),
+  DROP KEY IDX_COMMENT_POST_CREATED;
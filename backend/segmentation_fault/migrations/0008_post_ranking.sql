@@ -0,0 +1,9 @@
+-- A post's hot rank rises by one for each tenfold increase in its score, and by
+-- one for each 12.5 hours later it was posted, so newer posts overtake older ones
+-- without the ranks of either being decayed. It is scaled to an integer so that
+-- it is compared exactly when paginating, and is recomputed by MySQL whenever the
+-- score changes.
+ALTER TABLE Posts
+  ADD COLUMN `hot` bigint AS (ROUND((SIGN(score) * LOG10(GREATEST(ABS(score), 1)) + TIMESTAMPDIFF(SECOND, '2023-01-01 00:00:00', created) / 45000) * 1000000)) STORED,
+  ADD KEY IDX_POST_HOT (hot, id),
+  ADD KEY IDX_POST_SCORE (score, id);
@@ -0,0 +1,10 @@
+-- Events are kept for each server worker to read and push to its own subscribers,
+-- and deleted by any worker once older than `LIVE_RETENTION` seconds.
+CREATE TABLE IF NOT EXISTS `LiveEvents` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `created` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `topics` varchar(255) CHARACTER SET ascii NOT NULL,
+  `payload` json NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY IDX_LIVE_EVENT_CREATED (created)
+);
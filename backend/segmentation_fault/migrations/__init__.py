@@ -0,0 +1,145 @@
+import importlib.util
+import logging
+import re
+from pathlib import Path
+from typing import NamedTuple
+
+from database import Connection
+
+LOGGER = logging.getLogger(__name__)
+
+MIGRATIONS_DIRECTORY = Path(__file__).parent
+""" The directory migrations are read from. """
+
+MIGRATION_FILE = re.compile(r"(?P<version>\d{4})_(?P<name>\w+)\.(?P<kind>sql|py)")
+""" The pattern of migration file names, e.g. `0001_vote_and_comment_counters.sql`. """
+
+MIGRATION_LOCK = "segmentation_fault.migrations"
+""" The name of the lock held while migrating, so that only one process migrates. """
+
+MIGRATION_LOCK_TIMEOUT = 60
+""" The number of seconds to wait for another process to finish migrating. """
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: Path
+
+
+def discover() -> list[Migration]:
+    """
+    Returns every migration, in the order they are applied.
+
+    A migration is either a `.sql` file of `;`-separated statements, or a `.py`
+    file defining `upgrade(connection: Connection) -> None`. The schema starts as
+    `segmentation_fault.sql` creates it, and each migration evolves it from the one
+    before.
+
+    Returns
+    -------
+        `list[Migration]`: the migrations, by version
+    """
+    migrations = []
+    for path in MIGRATIONS_DIRECTORY.iterdir():
+        if match := MIGRATION_FILE.fullmatch(path.name):
+            migrations.append(
+                Migration(
+                    int(match["version"]), match["name"], MIGRATIONS_DIRECTORY / path
+                )
+            )
+
+    return sorted(migrations)
+
+
+def pending(connection: Connection) -> list[Migration]:
+    """
+    Returns the migrations which have not been applied to the database.
+
+    Parameters
+    ----------
+        `connection` (`Connection`): the connection to the database
+
+    Returns
+    -------
+        `list[Migration]`: the pending migrations, by version
+    """
+    with connection.dict_cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS Migrations (version int NOT NULL, name varchar(100) NOT NULL, applied datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (version))"
+        )
+        cursor.execute("SELECT version FROM Migrations")
+        applied = {row["version"] for row in cursor.fetchall()}
+
+    return [migration for migration in discover() if migration.version not in applied]
+
+
+def migrate(connection: Connection) -> list[Migration]:
+    """
+    Applies every pending migration, in order.
+
+    MySQL commits schema changes implicitly, so a migration which fails part way
+    is not rolled back, and must be fixed by hand before migrating again.
+
+    Parameters
+    ----------
+        `connection` (`Connection`): the connection to the database
+
+    Raises
+    ------
+        `TimeoutError`: if another process does not finish migrating in time
+
+    Returns
+    -------
+        `list[Migration]`: the migrations applied
+    """
+    with connection.dict_cursor() as cursor:
+        cursor.execute(
+            "SELECT GET_LOCK(%s, %s) AS locked",
+            (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT),
+        )
+        if not cursor.fetchone()["locked"]:
+            raise TimeoutError("Another process is migrating the database")
+
+    try:
+        # Read after taking the lock, so migrations applied meanwhile are skipped.
+        migrations = pending(connection)
+        for migration in migrations:
+            LOGGER.info("Applying migration %04d_%s", migration.version, migration.name)
+            apply(connection, migration)
+    finally:
+        with connection.dict_cursor() as cursor:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchall()
+
+    return migrations
+
+
+def apply(connection: Connection, migration: Migration) -> None:
+    """
+    Applies a migration, and records it as applied.
+
+    Parameters
+    ----------
+        `connection` (`Connection`): the connection to the database
+        `migration` (`Migration`): the migration
+    """
+    if migration.path.suffix == ".sql":
+        with connection.dict_cursor() as cursor:
+            for statement in migration.path.read_text().split(";"):
+                if statement.strip():
+                    cursor.execute(statement)
+    else:
+        spec = importlib.util.spec_from_file_location(
+            f"migrations.{migration.path.stem}", migration.path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.upgrade(connection)
+
+    with connection.dict_cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO Migrations (version, name) VALUES (%s, %s)",
+            (migration.version, migration.name),
+        )
+    connection.commit()
@@ -0,0 +1,445 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from os import getenv
+
+from controllers.communications import (
+    DeliveryError,
+    Email,
+    TextMessage,
+    comment_digest_email,
+    comment_email,
+    password_reset_email,
+    send_email,
+    send_text_message,
+    welcome_email,
+)
+from controllers.users import USER_COLUMNS
+from database import Session, placeholders, session
+from metrics import track
+from repository import from_row
+from schemas.notifications import NotificationStats, NotificationType
+from schemas.users import User
+
+LOGGER = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = int(getenv("NOTIFICATION_BATCH_SIZE", 50))
+""" The maximum number of notifications claimed and sent together. """
+
+NOTIFICATION_POLL_INTERVAL = float(getenv("NOTIFICATION_POLL_INTERVAL", 1))
+""" The number of seconds to wait before checking an empty outbox again. """
+
+NOTIFICATION_LEASE = int(getenv("NOTIFICATION_LEASE", 300))
+""" The number of seconds a claimed notification is hidden from other workers for. """
+
+NOTIFICATION_MAX_ATTEMPTS = int(getenv("NOTIFICATION_MAX_ATTEMPTS", 8))
+""" The number of times a notification is tried before it is marked as failed. """
+
+NOTIFICATION_RETRY_DELAY = float(getenv("NOTIFICATION_RETRY_DELAY", 30))
+""" The number of seconds before a failed notification is first retried, doubling each time. """
+
+NOTIFICATION_MAX_RETRY_DELAY = float(getenv("NOTIFICATION_MAX_RETRY_DELAY", 3600))
+""" The maximum number of seconds between retries of a notification. """
+
+NOTIFICATION_DIGEST_WINDOW = int(getenv("NOTIFICATION_DIGEST_WINDOW", 300))
+""" The number of seconds notifications of a `COALESCED_TYPES` type wait to be joined by others. """
+
+NOTIFICATION_DIGEST_SIZE = int(getenv("NOTIFICATION_DIGEST_SIZE", 500))
+""" The maximum number of notifications joining those due in a batch's digests. """
+
+COALESCED_TYPES = (NotificationType.COMMENT,)
+""" The types of notification sent to a user together as a digest. """
+
+UNCLAIMED = "(claimed IS NULL OR claimed < NOW() - INTERVAL %s SECOND)"
+""" The condition selecting notifications not being sent by a worker, with a placeholder for the lease. """
+
+
+async def enqueue_notification(
+    db: Session, type: NotificationType, user_id: int, payload: dict
+) -> None:
+    """
+    Adds a notification to the outbox. Call it within the transaction of the change
+    the notification is about, so that it is sent if and only if the change commits.
+
+    Notifications of a type in `COALESCED_TYPES` are held for
+    `NOTIFICATION_DIGEST_WINDOW` seconds, and sent with any others of that type to
+    the same user as one digest.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+        `type` (`NotificationType`): the type of the notification
+        `user_id` (`int`): the ID of the user to notify
+        `payload` (`dict`): the details the notification is rendered from
+    """
+    await db.execute(
+        "INSERT INTO Notifications (type, user, payload, due) VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)",
+        (
+            type.value,
+            user_id,
+            json.dumps(payload),
+            NOTIFICATION_DIGEST_WINDOW if type in COALESCED_TYPES else 0,
+        ),
+    )
+
+
+class NotificationWorker:
+    """
+    Delivers notifications from the outbox in the background of a server worker.
+
+    Every server worker runs one, claiming batches with `SKIP LOCKED` so they never
+    send the same notification concurrently. A claimed notification is hidden for
+    `NOTIFICATION_LEASE` seconds and deleted once sent, so one claimed by a worker
+    which dies is sent again by another: delivery is at least once.
+
+    Statistics count messages, so a digest counts once however many notifications
+    it coalesced.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+        self._batches = 0
+        self._coalesced = 0
+        self._sent = 0
+        self._retried = 0
+        self._failed = 0
+        self._latency = 0.0
+        self._max_latency = 0.0
+
+    def start(self) -> None:
+        """Starts delivering notifications."""
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Stops delivering notifications once the current batch is sent.
+
+        Parameters
+        ----------
+            `timeout` (`float`): the number of seconds to wait for the current batch
+        """
+        if self._task is None:
+            return
+
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+
+    async def deliver(self) -> int:
+        """
+        Claims a batch of due notifications and sends them, coalescing those to the
+        same user which can be.
+
+        The claim is committed and the connection returned to the pool before
+        sending, which can take seconds, and the outcomes are recorded on another.
+
+        Returns
+        -------
+            `int`: the number of notifications claimed
+        """
+        async with session() as db:
+            if not (notifications := await self._claim(db)):
+                return 0
+
+            groups = group(notifications)
+            messages = await self._render(db, groups)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._send(message) for message in messages))
+        self._batches += 1
+        self._coalesced += len(notifications) - len(groups)
+
+        async with session() as db:
+            await self._record(db, groups, results)
+
+        LOGGER.debug(
+            "Delivered %d notifications as %d messages in %.3fs",
+            len(notifications),
+            len(groups),
+            time.perf_counter() - started,
+        )
+        return len(notifications)
+
+    def stats(self) -> NotificationStats:
+        """
+        Returns a snapshot of the worker's deliveries.
+
+        Returns
+        -------
+            `NotificationStats`: the worker's statistics
+        """
+        attempts = self._sent + self._retried + self._failed
+        return NotificationStats(
+            batches=self._batches,
+            coalesced=self._coalesced,
+            sent=self._sent,
+            retried=self._retried,
+            failed=self._failed,
+            average_latency=self._latency / attempts if attempts else 0.0,
+            max_latency=self._max_latency,
+        )
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                with track("notification_batch"):
+                    claimed = await self.deliver()
+            except Exception:
+                LOGGER.exception("Failed to deliver notifications")
+                claimed = 0
+
+            if claimed < NOTIFICATION_BATCH_SIZE:
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), NOTIFICATION_POLL_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self, db: Session) -> list[dict]:
+        async with db.transaction():
+            notifications = await db.fetch_all(
+                f"SELECT id, type, user, payload, attempts FROM Notifications WHERE failed = FALSE AND due <= NOW() AND {UNCLAIMED} ORDER BY due LIMIT %s FOR UPDATE SKIP LOCKED",
+                (NOTIFICATION_LEASE, NOTIFICATION_BATCH_SIZE),
+            )
+
+            # Once a user's digest is due, it takes every pending notification it
+            # can coalesce, however recently they were added.
+            if recipients := {
+                n["user"]
+                for n in notifications
+                if NotificationType(n["type"]) in COALESCED_TYPES
+            }:
+                ids = [notification["id"] for notification in notifications]
+                notifications += await db.fetch_all(
+                    f"SELECT id, type, user, payload, attempts FROM Notifications WHERE type IN ({placeholders(COALESCED_TYPES)}) AND user IN ({placeholders(recipients)}) AND id NOT IN ({placeholders(ids)}) AND failed = FALSE AND {UNCLAIMED} LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (
+                        *(type.value for type in COALESCED_TYPES),
+                        *recipients,
+                        *ids,
+                        NOTIFICATION_LEASE,
+                        NOTIFICATION_DIGEST_SIZE,
+                    ),
+                )
+
+            if notifications:
+                ids = [notification["id"] for notification in notifications]
+                await db.execute(
+                    f"UPDATE Notifications SET claimed = NOW() WHERE id IN ({placeholders(ids)})",
+                    tuple(ids),
+                )
+
+        for notification in notifications:
+            notification["type"] = NotificationType(notification["type"])
+            notification["payload"] = json.loads(notification["payload"])
+
+        return notifications
+
+    async def _render(
+        self, db: Session, groups: list[list[dict]]
+    ) -> list[Email | TextMessage | None]:
+        # Resolve everyone involved in the batch at once, rather than per notification.
+        notifications = [notification for group in groups for notification in group]
+        user_ids = {n["user"] for n in notifications} | {
+            n["payload"]["author"]
+            for n in notifications
+            if n["type"] is NotificationType.COMMENT
+        }
+        post_ids = {
+            n["payload"]["post"]
+            for n in notifications
+            if n["type"] is NotificationType.COMMENT
+        }
+
+        users = {
+            user["id"]: from_row(User, user)
+            for user in await db.fetch_all(
+                f"SELECT {USER_COLUMNS} FROM Users WHERE id IN ({placeholders(user_ids)})",
+                tuple(user_ids),
+            )
+        }
+        posts = (
+            {
+                post["id"]: post
+                for post in await db.fetch_all(
+                    f"SELECT id, title FROM Posts WHERE id IN ({placeholders(post_ids)})",
+                    tuple(post_ids),
+                )
+            }
+            if post_ids
+            else {}
+        )
+
+        return [render(group, users, posts) for group in groups]
+
+    async def _send(self, message: Email | TextMessage | None) -> DeliveryError | None:
+        if message is None:
+            return DeliveryError("The notification's subject no longer exists", False)
+
+        started = time.perf_counter()
+        try:
+            if isinstance(message, Email):
+                with track("email"):
+                    await send_email(message)
+            else:
+                with track("text_message"):
+                    await send_text_message(message)
+        except DeliveryError as error:
+            return error
+        except Exception as error:
+            # An unexpected error must not fail the batch and leave it claimed.
+            LOGGER.exception("Failed to send a notification")
+            return DeliveryError(f"{type(error).__name__}: {error}", True)
+        finally:
+            latency = time.perf_counter() - started
+            self._latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+    async def _record(
+        self,
+        db: Session,
+        groups: list[list[dict]],
+        results: list[DeliveryError | None],
+    ) -> None:
+        sent = [
+            n["id"] for g, error in zip(groups, results) if error is None for n in g
+        ]
+
+        async with db.transaction():
+            if sent:
+                await db.execute(
+                    f"DELETE FROM Notifications WHERE id IN ({placeholders(sent)})",
+                    tuple(sent),
+                )
+
+            for group, error in zip(groups, results):
+                if error is None:
+                    self._sent += 1
+                    continue
+
+                retrying = False
+                for notification in group:
+                    attempts = notification["attempts"] + 1
+                    failed = not error.retry or attempts >= NOTIFICATION_MAX_ATTEMPTS
+                    await db.execute(
+                        "UPDATE Notifications SET attempts = %s, failed = %s, error = %s, claimed = NULL, due = NOW() + INTERVAL %s SECOND WHERE id = %s",
+                        (
+                            attempts,
+                            failed,
+                            str(error),
+                            retry_delay(attempts),
+                            notification["id"],
+                        ),
+                    )
+
+                    if failed:
+                        LOGGER.warning(
+                            "Notification %d failed: %s", notification["id"], error
+                        )
+                    retrying = retrying or not failed
+
+                if retrying:
+                    self._retried += 1
+                else:
+                    self._failed += 1
+
+
+def group(notifications: list[dict]) -> list[list[dict]]:
+    """
+    Groups notifications into those sent as one message: every notification of a
+    type in `COALESCED_TYPES` to the same user, and every other notification alone.
+
+    Parameters
+    ----------
+        `notifications` (`list[dict]`): the notifications
+
+    Returns
+    -------
+        `list[list[dict]]`: the groups, in the order of their first notification
+    """
+    groups: list[list[dict]] = []
+    coalesced: dict[tuple[NotificationType, int], list[dict]] = {}
+
+    for notification in notifications:
+        if notification["type"] not in COALESCED_TYPES:
+            groups.append([notification])
+        elif (key := (notification["type"], notification["user"])) in coalesced:
+            coalesced[key].append(notification)
+        else:
+            coalesced[key] = [notification]
+            groups.append(coalesced[key])
+
+    return groups
+
+
+def render(
+    group: list[dict], users: dict[int, User], posts: dict[int, dict]
+) -> Email | TextMessage | None:
+    """
+    Renders a group of notifications into the message which is sent for them.
+
+    Parameters
+    ----------
+        `group` (`list[dict]`): the notifications, all of one type and to one user
+        `users` (`dict[int, User]`): the users involved in the notifications, by ID
+        `posts` (`dict[int, dict]`): the posts involved in the notifications, by ID
+
+    Returns
+    -------
+        `Email | TextMessage | None`: the message, or `None` if the users or posts
+        involved no longer exist
+    """
+    type, payload = group[0]["type"], group[0]["payload"]
+    if (user := users.get(group[0]["user"])) is None:
+        return None
+
+    if type is NotificationType.WELCOME:
+        return welcome_email(user, payload["token"])
+
+    if type is NotificationType.PASSWORD_RESET:
+        return password_reset_email(user, payload["token"])
+
+    if type is NotificationType.COMMENT:
+        comments = [
+            (author, post)
+            for notification in group
+            if (author := users.get(notification["payload"]["author"]))
+            and (post := posts.get(notification["payload"]["post"]))
+        ]
+        if len(comments) == 1:
+            return comment_email(user, *comments[0])
+        if comments:
+            return comment_digest_email(user, comments)
+
+    return None
+
+
+def retry_delay(attempts: int) -> int:
+    """
+    Returns the number of seconds to wait before trying a notification again, with
+    jitter so that notifications which failed together are not retried together.
+
+    Parameters
+    ----------
+        `attempts` (`int`): the number of times the notification has been tried
+
+    Returns
+    -------
+        `int`: the delay
+    """
+    delay = min(
+        NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1), NOTIFICATION_MAX_RETRY_DELAY
+    )
+    return round(delay * random.uniform(0.5, 1))
+
+
+NOTIFICATION_WORKER = NotificationWorker()
+""" The worker delivering notifications for this server worker. """
@@ -0,0 +1,427 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Query, Response, status
+from schemas.posts import PostSort, TopWindow
+
+PAGE_SIZE = 50
+""" The number of items returned by a list endpoint when no limit is given. """
+
+MAX_PAGE_SIZE = 100
+""" The maximum number of items a list endpoint will return. """
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+""" The response header carrying the cursor of the next page, if there is one. """
+
+TOP_WINDOWS = {
+    TopWindow.DAY: timedelta(days=1),
+    TopWindow.WEEK: timedelta(weeks=1),
+    TopWindow.MONTH: timedelta(days=30),
+    TopWindow.YEAR: timedelta(days=365),
+}
+""" How far back the posts of each window of the top posts were posted. """
+
+SORT_COLUMNS = {
+    PostSort.HOT: "hot",
+    PostSort.TOP: "score",
+}
+""" The indexed column of `Posts` each ranked order is taken by. """
+
+
+class Pagination:
+    def __init__(
+        self,
+        response: Response,
+        cursor: str | None = None,
+        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        """
+        Keyset pagination over rows ordered by `created` then `id`, newest first.
+        This is a dependency class, use it like:
+
+        @app.get("/posts")
+        async def get_posts(pagination: Pagination = Depends()):
+            return pagination.page(await db.fetch_all(
+                f"SELECT * FROM Posts WHERE {pagination.condition('Posts')} "
+                f"ORDER BY {pagination.order('Posts')} LIMIT {pagination.fetch}",
+                pagination.params,
+            ))
+
+        Each page costs the same regardless of its depth, as it is an index range scan
+        starting from the last row of the previous page.
+
+        Parameters
+        ----------
+            `response` (`Response`): the response to set the next cursor on
+            `cursor` (`str | None`): the opaque cursor of the page to return
+            `limit` (`int`): the maximum number of items to return
+        """
+        self.response = response
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor is not None else None
+
+    @property
+    def fetch(self) -> int:
+        """The number of rows to fetch, one more than the limit to detect a next page."""
+        return self.limit + 1
+
+    @property
+    def key(self) -> str:
+        """The limit and cursor of the page, which identify it among pages of the same rows."""
+        if self.after is None:
+            return str(self.limit)
+
+        return f"{self.limit}:{encode_cursor(*self.after)}"
+
+    @property
+    def params(self) -> tuple:
+        """The parameters of `condition`."""
+        if self.after is None:
+            return ()
+
+        created, id = self.after
+        return (created, created, id)
+
+    def condition(self, table: str) -> str:
+        """
+        Returns the `WHERE` condition selecting rows after the cursor.
+
+        Parameters
+        ----------
+            `table` (`str`): the table being paginated
+
+        Returns
+        -------
+            `str`: the condition, with placeholders for `params`
+        """
+        if self.after is None:
+            return "TRUE"
+
+        return f"({table}.created < %s OR ({table}.created = %s AND {table}.id < %s))"
+
+    @staticmethod
+    def order(table: str) -> str:
+        """
+        Returns the `ORDER BY` expression pages are taken in.
+
+        Parameters
+        ----------
+            `table` (`str`): the table being paginated
+
+        Returns
+        -------
+            `str`: the ordering
+        """
+        return f"{table}.created DESC, {table}.id DESC"
+
+    def page(self, rows: list[dict]) -> list[dict]:
+        """
+        Trims the fetched rows to a page and sets the cursor of the next page, if any.
+
+        Parameters
+        ----------
+            `rows` (`list[dict]`): the `fetch` rows returned by the query
+
+        Returns
+        -------
+            `list[dict]`: at most `limit` rows
+        """
+        if len(rows) > self.limit:
+            rows = rows[: self.limit]
+            self.response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                rows[-1]["created"], rows[-1]["id"]
+            )
+
+        return rows
+
+
+class RankedPagination:
+    def __init__(
+        self,
+        response: Response,
+        cursor: str | None = None,
+        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        """
+        Keyset pagination over rows ordered by a computed `relevance` then `id`, most
+        relevant first. This is a dependency class, used like `Pagination` with the
+        relevance and ID expressions given to `condition` and `order`.
+
+        Parameters
+        ----------
+            `response` (`Response`): the response to set the next cursor on
+            `cursor` (`str | None`): the opaque cursor of the page to return
+            `limit` (`int`): the maximum number of items to return
+        """
+        self.response = response
+        self.limit = limit
+        self.after = decode_ranked_cursor(cursor) if cursor is not None else None
+
+    @property
+    def fetch(self) -> int:
+        """The number of rows to fetch, one more than the limit to detect a next page."""
+        return self.limit + 1
+
+    @property
+    def key(self) -> str:
+        """The limit and cursor of the page, which identify it among pages of the same rows."""
+        if self.after is None:
+            return str(self.limit)
+
+        return f"{self.limit}:{encode_ranked_cursor(*self.after)}"
+
+    @property
+    def params(self) -> tuple:
+        """The parameters of `condition`."""
+        if self.after is None:
+            return ()
+
+        relevance, id = self.after
+        return (relevance, relevance, id)
+
+    def condition(self, relevance: str, id: str) -> str:
+        """
+        Returns the condition selecting rows after the cursor.
+
+        Parameters
+        ----------
+            `relevance` (`str`): the relevance expression
+            `id` (`str`): the ID expression
+
+        Returns
+        -------
+            `str`: the condition, with placeholders for `params`
+        """
+        if self.after is None:
+            return "TRUE"
+
+        return f"({relevance} < %s OR ({relevance} = %s AND {id} < %s))"
+
+    @staticmethod
+    def order(relevance: str, id: str) -> str:
+        """
+        Returns the `ORDER BY` expression pages are taken in.
+
+        Parameters
+        ----------
+            `relevance` (`str`): the relevance expression
+            `id` (`str`): the ID expression
+
+        Returns
+        -------
+            `str`: the ordering
+        """
+        return f"{relevance} DESC, {id} DESC"
+
+    def page(self, rows: list[dict], rank: str = "relevance") -> list[dict]:
+        """
+        Trims the fetched rows to a page and sets the cursor of the next page, if any.
+
+        Parameters
+        ----------
+            `rows` (`list[dict]`): the `fetch` rows returned by the query, each with
+                its relevance and `id`
+            `rank` (`str`): the key of the relevance in each row
+
+        Returns
+        -------
+            `list[dict]`: at most `limit` rows
+        """
+        if len(rows) > self.limit:
+            rows = rows[: self.limit]
+            self.response.headers[NEXT_CURSOR_HEADER] = encode_ranked_cursor(
+                rows[-1][rank], rows[-1]["id"]
+            )
+
+        return rows
+
+
+class PostOrder:
+    def __init__(
+        self,
+        response: Response,
+        sort: PostSort = PostSort.NEW,
+        window: TopWindow = TopWindow.ALL,
+        cursor: str | None = None,
+        limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        """
+        The order and page of a listing of posts: newest first, hottest first, or
+        highest scoring first among those posted within a window. This is a
+        dependency class, use it like `Pagination`, without giving the table.
+
+        Every order is by an indexed column then `id`, so each page is an index
+        range scan starting from the last post of the previous page, other than top
+        posts within a window, which are the posts in the window sorted by score.
+
+        Parameters
+        ----------
+            `response` (`Response`): the response to set the next cursor on
+            `sort` (`PostSort`): the order
+            `window` (`TopWindow`): how far back to take top posts from
+            `cursor` (`str | None`): the opaque cursor of the page to return
+            `limit` (`int`): the maximum number of items to return
+        """
+        self.sort = sort
+        self.window = window if sort == PostSort.TOP else TopWindow.ALL
+        self.since = (
+            datetime.now().replace(microsecond=0) - TOP_WINDOWS[self.window]
+            if self.window in TOP_WINDOWS
+            else None
+        )
+        self.pagination = (
+            Pagination(response, cursor, limit)
+            if sort == PostSort.NEW
+            else RankedPagination(response, cursor, limit)
+        )
+
+    @property
+    def fetch(self) -> int:
+        """The number of rows to fetch, one more than the limit to detect a next page."""
+        return self.pagination.fetch
+
+    @property
+    def key(self) -> str:
+        """The order and page, which identify it among listings of posts."""
+        return f"{self.sort.value}:{self.window.value}:{self.pagination.key}"
+
+    @property
+    def params(self) -> tuple:
+        """The parameters of `condition`."""
+        return ((self.since,) if self.since else ()) + self.pagination.params
+
+    def condition(self) -> str:
+        """
+        Returns the `WHERE` condition selecting posts after the cursor.
+
+        Returns
+        -------
+            `str`: the condition, with placeholders for `params`
+        """
+        if self.sort == PostSort.NEW:
+            return self.pagination.condition("Posts")
+
+        condition = self.pagination.condition(
+            f"Posts.{SORT_COLUMNS[self.sort]}", "Posts.id"
+        )
+        return f"Posts.created >= %s AND {condition}" if self.since else condition
+
+    def order(self) -> str:
+        """
+        Returns the `ORDER BY` expression pages are taken in.
+
+        Returns
+        -------
+            `str`: the ordering
+        """
+        if self.sort == PostSort.NEW:
+            return self.pagination.order("Posts")
+
+        return self.pagination.order(f"Posts.{SORT_COLUMNS[self.sort]}", "Posts.id")
+
+    def page(self, rows: list[dict]) -> list[dict]:
+        """
+        Trims the fetched rows to a page and sets the cursor of the next page, if any.
+
+        Parameters
+        ----------
+            `rows` (`list[dict]`): the `fetch` rows returned by the query, each with
+                every column of `Posts`
+
+        Returns
+        -------
+            `list[dict]`: at most `limit` rows
+        """
+        if self.sort == PostSort.NEW:
+            return self.pagination.page(rows)
+
+        return self.pagination.page(rows, SORT_COLUMNS[self.sort])
+
+
+def encode_cursor(created: datetime, id: int) -> str:
+    """
+    Returns the opaque cursor pointing after the given row.
+
+    Parameters
+    ----------
+        `created` (`datetime`): the creation time of the row
+        `id` (`int`): the ID of the row
+
+    Returns
+    -------
+        `str`: the cursor
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps([created.isoformat(), id]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Returns the row an opaque cursor points after.
+
+    Parameters
+    ----------
+        `cursor` (`str`): the cursor
+
+    Raises
+    ------
+        `HTTPException`: if the cursor is malformed
+
+    Returns
+    -------
+        `tuple[datetime, int]`: the creation time and ID of the row
+    """
+    try:
+        created, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created), int(id)
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+def encode_ranked_cursor(relevance: float, id: int) -> str:
+    """
+    Returns the opaque cursor pointing after the given ranked row.
+
+    Parameters
+    ----------
+        `relevance` (`float`): the relevance of the row
+        `id` (`int`): the ID of the row
+
+    Returns
+    -------
+        `str`: the cursor
+    """
+    # The relevance is written exactly, so the row compares equal to it again.
+    return base64.urlsafe_b64encode(json.dumps([relevance, id]).encode()).decode()
+
+
+def decode_ranked_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Returns the ranked row an opaque cursor points after.
+
+    Parameters
+    ----------
+        `cursor` (`str`): the cursor
+
+    Raises
+    ------
+        `HTTPException`: if the cursor is malformed
+
+    Returns
+    -------
+        `tuple[float, int]`: the relevance and ID of the row
+    """
+    try:
+        relevance, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(relevance), int(id)
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
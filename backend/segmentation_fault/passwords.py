@@ -0,0 +1,73 @@
+from os import getenv
+
+import bcrypt
+from workers import WorkerPool
+
+BCRYPT_ROUNDS = int(getenv("BCRYPT_ROUNDS", 12))
+""" The bcrypt work factor new password hashes are created with. """
+
+PASSWORD_WORKERS = int(getenv("PASSWORD_WORKERS", 2))
+""" The number of processes each server worker hashes passwords on. """
+
+PASSWORD_QUEUE_SIZE = int(getenv("PASSWORD_QUEUE_SIZE", 64))
+""" The number of hashes which may wait for a process before requests are rejected. """
+
+PASSWORD_POOL = WorkerPool("passwords", PASSWORD_WORKERS, PASSWORD_QUEUE_SIZE)
+""" The pool passwords are hashed and checked on. """
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hashes a password with the configured work factor.
+
+    Parameters
+    ----------
+        `password` (`str`): the password
+
+    Returns
+    -------
+        `str`: the hash
+    """
+    return await PASSWORD_POOL.run(_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """
+    Checks a password against a hash.
+
+    Parameters
+    ----------
+        `password` (`str`): the password
+        `hashed` (`str`): the hash
+
+    Returns
+    -------
+        `bool`: whether the password matches
+    """
+    return await PASSWORD_POOL.run(_check, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """
+    Returns whether a hash was created with a different work factor than is configured.
+
+    Parameters
+    ----------
+        `hashed` (`str`): the hash, in modular crypt format (`$2b$<rounds>$...`)
+
+    Returns
+    -------
+        `bool`: whether the password should be hashed again
+    """
+    try:
+        return int(hashed.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _check(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode(), hashed.encode())
@@ -0,0 +1,246 @@
+from datetime import datetime
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Callable, Generic, Mapping, TypeVar
+
+from database import Session
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class Repository(Generic[M]):
+    """
+    Reads and writes the rows of a table as models, without reading back what it
+    writes.
+
+    Inserts build the returned model from the values written, the generated key and
+    a `created` timestamp read from the database's clock and written explicitly
+    rather than defaulted by MySQL, so that the two agree. Updates lock and read the
+    row, with the database's time for `updated`, before writing it, so the model is
+    built from the row and the values written, and a missing row is found without
+    writing. Neither reads the row after writing it.
+
+    Statements are cached per table and set of columns, so controllers writing the
+    same columns share one statement string rather than building it per call. Writes
+    join the session's transaction if one is open, so related writes in a controller
+    commit together.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        model: type[M],
+        key: str = "id",
+        generated: bool = True,
+        defaults: dict[str, Any] | None = None,
+    ):
+        """
+        Parameters
+        ----------
+            `table` (`str`): the table
+            `model` (`type[M]`): the model of a row, whose fields are all columns
+            `key` (`str`): the primary key column
+            `generated` (`bool`): whether the key is generated by `AUTO_INCREMENT`
+            `defaults` (`dict[str, Any] | None`): the defaults of columns of the model
+                which are not inserted, other than the key and timestamps
+        """
+        self.table = table
+        self.model = model
+        self.key = key
+        self.generated = generated
+        self.defaults = defaults or {}
+        self.columns = ", ".join(f"{table}.{field}" for field in model.__fields__)
+        self.timestamped = "created" in model.__fields__
+
+    async def get(self, db: Session, key: Any, lock: bool = False) -> M | None:
+        """
+        Reads the row with the given key.
+
+        Parameters
+        ----------
+            `db` (`Session`): the database session
+            `key` (`Any`): the key of the row
+            `lock` (`bool`): whether to lock the row until the transaction ends
+
+        Returns
+        -------
+            `M | None`: the row, if it exists
+        """
+        row = await db.fetch_one(
+            select_statement(self.table, self.columns, self.key, lock), (key,)
+        )
+        return from_row(self.model, row) if row else None
+
+    async def insert(self, db: Session, values: dict[str, Any]) -> M:
+        """
+        Inserts a row.
+
+        Parameters
+        ----------
+            `db` (`Session`): the database session
+            `values` (`dict[str, Any]`): the columns to insert, which may include
+                some which are not fields of the model
+
+        Returns
+        -------
+            `M`: the inserted row
+        """
+        async with db.transaction():
+            if self.timestamped:
+                values = values | {"created": await now(db)}
+
+            result = await db.execute(
+                insert_statement(self.table, tuple(values)), values
+            )
+
+        row = self.defaults | values
+        if self.generated:
+            row[self.key] = result.lastrowid
+
+        return from_row(
+            self.model, {field: row.get(field) for field in self.model.__fields__}
+        )
+
+    async def update(self, db: Session, key: Any, values: dict[str, Any]) -> M | None:
+        """
+        Updates the row with the given key, if any values differ from its own.
+
+        Parameters
+        ----------
+            `db` (`Session`): the database session
+            `key` (`Any`): the key of the row
+            `values` (`dict[str, Any]`): the columns to update, which may include
+                some which are not fields of the model
+
+        Returns
+        -------
+            `M | None`: the updated row, if it exists
+        """
+        async with db.transaction():
+            if not (
+                current := await db.fetch_one(
+                    select_statement(
+                        self.table, f"{self.columns}, NOW() AS now", self.key, True
+                    ),
+                    (key,),
+                )
+            ):
+                return None
+
+            model = from_row(self.model, current)
+            row = model.dict()
+            if all(
+                column in row and row[column] == value
+                for column, value in values.items()
+            ):
+                return model
+
+            if self.timestamped:
+                values = values | {"updated": current["now"]}
+
+            await db.execute(
+                update_statement(self.table, tuple(values), self.key),
+                values | {"key": key},
+            )
+
+        return from_row(
+            self.model, row | {field: values[field] for field in values if field in row}
+        )
+
+    async def delete(self, db: Session, key: Any) -> bool:
+        """
+        Deletes the row with the given key.
+
+        Parameters
+        ----------
+            `db` (`Session`): the database session
+            `key` (`Any`): the key of the row
+
+        Returns
+        -------
+            `bool`: whether the row existed
+        """
+        async with db.transaction():
+            result = await db.execute(
+                f"DELETE FROM {self.table} WHERE {self.key} = %s", (key,)
+            )
+
+        return bool(result.rowcount)
+
+
+def from_row(model: type[M], row: Mapping[str, Any]) -> M:
+    """
+    Builds a model from a row read from, or written to, the database, without
+    validating it.
+
+    The row is trusted to hold a value of the right type for each field, as its
+    columns' types match the model's, except for `tinyint(1)` columns read as `int`
+    and enumerations read as their values, which are converted. Columns which are not
+    fields of the model are left out, and fields missing from the row take their
+    defaults.
+
+    Parameters
+    ----------
+        `model` (`type[M]`): the model
+        `row` (`Mapping[str, Any]`): the row
+
+    Returns
+    -------
+        `M`: the model of the row
+    """
+    values = {field: row[field] for field in model.__fields__ if field in row}
+    for field, convert in converters(model):
+        if values.get(field) is not None:
+            values[field] = convert(values[field])
+
+    return model.construct(**values)
+
+
+@lru_cache(maxsize=None)
+def converters(model: type[BaseModel]) -> tuple[tuple[str, Callable[[Any], Any]], ...]:
+    """Returns the conversion of each field of a model whose column is read as another type."""
+    return tuple(
+        (name, field.type_)
+        for name, field in model.__fields__.items()
+        if field.shape == SHAPE_SINGLETON
+        and isinstance(field.type_, type)
+        and (field.type_ is bool or issubclass(field.type_, Enum))
+    )
+
+
+async def now(db: Session) -> datetime:
+    """
+    Returns the current time of the database, as `NOW()` writes it to a `datetime`
+    column, rather than of the application, whose clock and time zone may differ.
+
+    Parameters
+    ----------
+        `db` (`Session`): the database session
+
+    Returns
+    -------
+        `datetime`: the current time
+    """
+    return (await db.fetch_one("SELECT NOW() AS now"))["now"]
+
+
+@lru_cache(maxsize=None)
+def select_statement(table: str, columns: str, key: str, lock: bool) -> str:
+    """Returns the statement reading the row of a table with a given key."""
+    return f"SELECT {columns} FROM {table} WHERE {key} = %s" + (
+        " FOR UPDATE" if lock else ""
+    )
+
+
+@lru_cache(maxsize=None)
+def insert_statement(table: str, columns: tuple[str, ...]) -> str:
+    """Returns the statement inserting the given columns of a row of a table."""
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(f'%({column})s' for column in columns)})"
+
+
+@lru_cache(maxsize=None)
+def update_statement(table: str, columns: tuple[str, ...], key: str) -> str:
+    """Returns the statement updating the given columns of the row of a table with a given key."""
+    return f"UPDATE {table} SET {', '.join(f'{column} = %({column})s' for column in columns)} WHERE {key} = %(key)s"
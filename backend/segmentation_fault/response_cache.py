@@ -0,0 +1,391 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from os import getenv
+from typing import Any, AsyncIterator, Awaitable, Callable, Protocol
+from urllib.parse import urlparse
+
+from cache import LRUCache
+from fastapi import Response
+from pagination import NEXT_CURSOR_HEADER
+from responses import ModelJSONResponse
+from schemas.cache import ResponseCacheStats
+
+LOGGER = logging.getLogger(__name__)
+
+RESPONSE_CACHE_URL = getenv("RESPONSE_CACHE_URL", "")
+""" The `memcached://host:port` URL of a cache shared by every worker, or empty to cache in each worker. """
+
+RESPONSE_CACHE_SIZE = int(getenv("RESPONSE_CACHE_SIZE", 4096))
+""" The maximum number of responses cached by each worker, when not shared. """
+
+RESPONSE_CACHE_TTL = float(getenv("RESPONSE_CACHE_TTL", 5))
+""" The number of seconds a cached response may be served for. """
+
+RESPONSE_CACHE_CONNECTIONS = int(getenv("RESPONSE_CACHE_CONNECTIONS", 10))
+""" The maximum number of connections each worker keeps open to a shared cache. """
+
+RESPONSE_CACHE_TIMEOUT = float(getenv("RESPONSE_CACHE_TIMEOUT", 0.1))
+""" The number of seconds after which a shared cache is treated as unavailable. """
+
+CACHED_HEADERS = (NEXT_CURSOR_HEADER,)
+""" The headers set by routes which are cached along with their responses. """
+
+
+class CacheUnavailable(Exception):
+    """Raised when a shared cache cannot be reached or answers unexpectedly."""
+
+
+class CacheBackend(Protocol):
+    async def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        ...
+
+    async def set(self, key: str, value: bytes) -> None:
+        ...
+
+    async def add(self, key: str, value: bytes) -> bool:
+        ...
+
+    async def incr(self, key: str) -> int | None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class LocalBackend:
+    """
+    Caches in the worker's memory. Invalidations only reach the worker making them,
+    so other workers may serve a stale response for up to its TTL.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        Parameters
+        ----------
+            `max_size` (`int`): the maximum number of responses
+            `ttl` (`float`): the number of seconds a response may be served for
+        """
+        self._entries: LRUCache[str, bytes] = LRUCache("responses", max_size, ttl)
+        self._counters: LRUCache[str, int] = LRUCache(
+            "response generations", max_size, math.inf
+        )
+
+    async def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        values = {}
+        for key in keys:
+            if (value := self._entries.get(key)) is not None:
+                values[key] = value
+            elif (counter := self._counters.get(key)) is not None:
+                values[key] = str(counter).encode()
+        return values
+
+    async def set(self, key: str, value: bytes) -> None:
+        self._entries.set(key, value)
+
+    async def add(self, key: str, value: bytes) -> bool:
+        if self._counters.get(key) is not None:
+            return False
+        self._counters.set(key, int(value))
+        return True
+
+    async def incr(self, key: str) -> int | None:
+        if (counter := self._counters.get(key)) is None:
+            return None
+        self._counters.set(key, counter + 1)
+        return counter + 1
+
+    async def close(self) -> None:
+        pass
+
+
+class MemcachedBackend:
+    """
+    Caches in a memcached server shared by every worker, speaking its text protocol
+    over a pool of kept-alive connections.
+    """
+
+    def __init__(
+        self, host: str, port: int, connections: int, timeout: float, ttl: float
+    ):
+        """
+        Parameters
+        ----------
+            `host` (`str`): the host of the server
+            `port` (`int`): the port of the server
+            `connections` (`int`): the maximum number of connections to keep open
+            `timeout` (`float`): the number of seconds to wait for each command
+            `ttl` (`float`): the number of seconds a response may be served for
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.ttl = max(1, math.ceil(ttl))
+
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(connections)
+
+    async def get_many(self, keys: list[str]) -> dict[str, bytes]:
+        async def read(reader: asyncio.StreamReader) -> dict[str, bytes]:
+            values = {}
+            while (line := await reader.readline()) != b"END\r\n":
+                if not line.startswith(b"VALUE "):
+                    raise CacheUnavailable(f"Unexpected reply {line!r}")
+                _, key, _, size = line.split()
+                values[key.decode()] = (await reader.readexactly(int(size) + 2))[:-2]
+            return values
+
+        return await self._command(f"get {' '.join(keys)}\r\n".encode(), read)
+
+    async def set(self, key: str, value: bytes) -> None:
+        await self._store(b"set", key, value, self.ttl)
+
+    async def add(self, key: str, value: bytes) -> bool:
+        return await self._store(b"add", key, value, 0)
+
+    async def incr(self, key: str) -> int | None:
+        async def read(reader: asyncio.StreamReader) -> int | None:
+            line = await reader.readline()
+            if line == b"NOT_FOUND\r\n":
+                return None
+            if not line.rstrip().isdigit():
+                raise CacheUnavailable(f"Unexpected reply {line!r}")
+            return int(line)
+
+        return await self._command(f"incr {key} 1\r\n".encode(), read)
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+    async def _store(self, command: bytes, key: str, value: bytes, ttl: int) -> bool:
+        async def read(reader: asyncio.StreamReader) -> bool:
+            line = await reader.readline()
+            if line not in (b"STORED\r\n", b"NOT_STORED\r\n"):
+                raise CacheUnavailable(f"Unexpected reply {line!r}")
+            return line == b"STORED\r\n"
+
+        request = b"%s %s 0 %d %d\r\n%s\r\n" % (
+            command,
+            key.encode(),
+            ttl,
+            len(value),
+            value,
+        )
+        return await self._command(request, read)
+
+    async def _command(
+        self, request: bytes, read: Callable[[asyncio.StreamReader], Awaitable[Any]]
+    ) -> Any:
+        async def run() -> Any:
+            async with self._connection() as (reader, writer):
+                writer.write(request)
+                await writer.drain()
+                return await read(reader)
+
+        try:
+            return await asyncio.wait_for(run(), self.timeout)
+        except (OSError, ValueError, asyncio.TimeoutError) as error:
+            raise CacheUnavailable(str(error) or type(error).__name__) from error
+        except asyncio.IncompleteReadError as error:
+            raise CacheUnavailable("Connection closed") from error
+
+    @asynccontextmanager
+    async def _connection(
+        self,
+    ) -> AsyncIterator[tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+        async with self._slots:
+            if self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = await asyncio.open_connection(self.host, self.port)
+
+            try:
+                yield connection
+            except BaseException:
+                # A command interrupted part way leaves its reply unread.
+                connection[1].close()
+                raise
+
+            self._idle.append(connection)
+
+
+class ResponseCache:
+    """
+    Caches the serialised JSON of responses, so a hit costs neither a query nor
+    validating and serialising models.
+
+    Every cached response depends on one or more namespaces, such as `post:1` for a
+    post or `posts` for every page of posts. Writers invalidate the namespaces they
+    change, which bumps a generation counter kept in the backend. Each response is
+    stored with the generations of its namespaces when it was looked up, and is only
+    served while they are unchanged, so a response read from the database before a
+    write commits is never served after it. A lookup reads the response and its
+    generations in one round trip.
+
+    A generation missing from the backend is started from the current time rather
+    than zero, so responses cached against an evicted generation never match it
+    again. An unavailable backend is treated as a miss.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        """
+        Parameters
+        ----------
+            `backend` (`CacheBackend`): where responses and generations are kept
+        """
+        self.backend = backend
+        self._stats: dict[str, list[int]] = {}
+
+    async def respond(
+        self,
+        route: str,
+        key: str,
+        namespaces: list[str],
+        produce: Callable[[], Awaitable[Any]],
+        response: Response | None = None,
+    ) -> Response:
+        """
+        Returns a cached response, or produces, caches and returns one.
+
+        Produced content is serialised as it is, rather than validated against the
+        route's response model, so it must be built from trusted rows.
+
+        Parameters
+        ----------
+            `route` (`str`): the name of the route, which statistics are kept under
+            `key` (`str`): the parameters of the response, unique within the route
+            `namespaces` (`list[str]`): the namespaces the response depends on
+            `produce` (`Callable[[], Awaitable[Any]]`): returns the response content
+            `response` (`Response | None`): the response the route sets headers on
+
+        Returns
+        -------
+            `Response`: the response
+        """
+        stats = self._stats.setdefault(route, [0, 0, 0])
+        # Keys are hashed, as memcached refuses long keys and those with spaces.
+        entry_key = f"response:{hashlib.blake2b(f'{route}:{key}'.encode(), digest_size=16).hexdigest()}"
+        generation_keys = [f"generation:{namespace}" for namespace in namespaces]
+
+        generations = None
+        try:
+            found = await self.backend.get_many([entry_key, *generation_keys])
+            generations = await self._generations(generation_keys, found)
+        except CacheUnavailable as error:
+            stats[2] += 1
+            LOGGER.warning("Response cache unavailable: %s", error)
+            found = {}
+
+        if generations is not None and (entry := found.get(entry_key)) is not None:
+            meta, body = entry.split(b"\n", 1)
+            meta = json.loads(meta)
+            if meta["generations"] == generations:
+                stats[0] += 1
+                return Response(
+                    body, media_type="application/json", headers=meta["headers"]
+                )
+
+        stats[1] += 1
+        content = await produce()
+        headers = {
+            header: response.headers[header]
+            for header in CACHED_HEADERS
+            if response is not None and header in response.headers
+        }
+        fresh = ModelJSONResponse(content, headers=headers)
+
+        if generations is not None:
+            meta = json.dumps({"generations": generations, "headers": headers})
+            try:
+                await self.backend.set(entry_key, meta.encode() + b"\n" + fresh.body)
+            except CacheUnavailable as error:
+                stats[2] += 1
+                LOGGER.warning("Response cache unavailable: %s", error)
+
+        return fresh
+
+    async def invalidate(self, *namespaces: str) -> None:
+        """
+        Invalidates every response depending on the given namespaces. Call it after
+        the change to them is committed.
+
+        Parameters
+        ----------
+            `namespaces` (`str`): the namespaces
+        """
+        for namespace in namespaces:
+            try:
+                await self.backend.incr(f"generation:{namespace}")
+            except CacheUnavailable as error:
+                LOGGER.warning(
+                    "Response cache unavailable, %s not invalidated: %s",
+                    namespace,
+                    error,
+                )
+
+    def stats(self) -> dict[str, ResponseCacheStats]:
+        """
+        Returns a snapshot of the cache's effectiveness for each route.
+
+        Returns
+        -------
+            `dict[str, ResponseCacheStats]`: the statistics, by route
+        """
+        return {
+            route: ResponseCacheStats(
+                hits=hits,
+                misses=misses,
+                errors=errors,
+                hit_ratio=hits / (hits + misses) if hits + misses else 0.0,
+            )
+            for route, (hits, misses, errors) in self._stats.items()
+        }
+
+    async def close(self) -> None:
+        """Closes any connections to the backend."""
+        await self.backend.close()
+
+    async def _generations(
+        self, keys: list[str], found: dict[str, bytes]
+    ) -> list[int] | None:
+        # Start any missing generation, and skip caching until it is known.
+        if missing := [key for key in keys if key not in found]:
+            for key in missing:
+                await self.backend.add(key, str(time.time_ns()).encode())
+            return None
+
+        return [int(found[key]) for key in keys]
+
+
+def backend() -> CacheBackend:
+    """
+    Returns the backend configured by `RESPONSE_CACHE_URL`.
+
+    Returns
+    -------
+        `CacheBackend`: the backend
+    """
+    if not RESPONSE_CACHE_URL:
+        return LocalBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+    url = urlparse(RESPONSE_CACHE_URL)
+    if url.scheme != "memcached":
+        raise ValueError(f"Unsupported response cache {RESPONSE_CACHE_URL}")
+
+    return MemcachedBackend(
+        url.hostname,
+        url.port or 11211,
+        RESPONSE_CACHE_CONNECTIONS,
+        RESPONSE_CACHE_TIMEOUT,
+        RESPONSE_CACHE_TTL,
+    )
+
+
+RESPONSE_CACHE = ResponseCache(backend())
+""" The response cache of this worker. """
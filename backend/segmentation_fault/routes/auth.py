@@ -1,5 +1,6 @@
 import controllers.auth as controller
-from fastapi import APIRouter, BackgroundTasks, Depends, status
+from database import Session, get_db
+from fastapi import APIRouter, Depends, status
 from schemas.auth import AuthToken, ForgotPassword, LoginForm, ResetPassword
 from schemas.users import User, UserCreate
 
@@ -7,35 +8,40 @@ router = APIRouter()
 
 
 @router.post("/login", response_model=AuthToken, status_code=status.HTTP_200_OK)
-async def login(form_data: LoginForm = Depends()):
-    return await controller.login(form_data)
+async def login(form_data: LoginForm = Depends(), db: Session = Depends(get_db)):
+    return await controller.login(db, form_data)
 
 
 @router.post("/sign-up", response_model=User, status_code=status.HTTP_201_CREATED)
-async def sign_up(user: UserCreate, background_tasks: BackgroundTasks):
-    return await controller.sign_up(user, background_tasks)
+async def sign_up(
+    user: UserCreate,
+    db: Session = Depends(get_db),
+):
+    return await controller.sign_up(db, user)
 
 
 @router.post("/verify-email", status_code=status.HTTP_200_OK)
-async def verify_email(token: str):
-    return await controller.verify_email(token)
+async def verify_email(token: str, db: Session = Depends(get_db)):
+    return await controller.verify_email(db, token)
 
 
 @router.post("/forgot-password", status_code=status.HTTP_201_CREATED)
-async def forgot_password(form_data: ForgotPassword, background_tasks: BackgroundTasks):
-    return await controller.forgot_password(form_data, background_tasks)
+async def forgot_password(
+    form_data: ForgotPassword,
+    db: Session = Depends(get_db),
+):
+    return await controller.forgot_password(db, form_data)
 
 
 @router.post("/reset-password", status_code=status.HTTP_200_OK)
-async def reset_password(form_data: ResetPassword):
-    return await controller.reset_password(form_data)
+async def reset_password(form_data: ResetPassword, db: Session = Depends(get_db)):
+    return await controller.reset_password(db, form_data)
 
 
 @router.get(
     "/",
     response_model=User,
-    response_model_exclude={"password"},
     status_code=status.HTTP_200_OK,
 )
-async def get_current_user(token: str = Depends(controller.OAUTH2_SCHEME)):
-    return await controller.get_current_user(token)
+async def get_current_user(user: User = Depends(controller.get_current_user)):
+    return user
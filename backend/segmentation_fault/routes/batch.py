@@ -0,0 +1,19 @@
+from controllers.auth import OAUTH2_SCHEME, authenticate
+from controllers.batch import run_batch
+from database import session
+from fastapi import APIRouter, Depends, Request
+from schemas.batch import BatchItem, BatchResult
+
+router = APIRouter()
+
+
+@router.post("", response_model=list[BatchResult])
+async def batch(
+    items: list[BatchItem], request: Request, token: str = Depends(OAUTH2_SCHEME)
+):
+    # Authenticated on a session of its own, rather than one from `get_db`, so that
+    # the batch does not hold a database connection while its requests run.
+    async with session() as db:
+        user = await authenticate(db, token)
+
+    return await run_batch(request.app, request.scope, items, user)
@@ -1,8 +1,12 @@
 import controllers.comments as controller
 from controllers.auth import get_current_user
+from database import Session, get_db
 from dependencies.author import Author
-from fastapi import APIRouter, BackgroundTasks, Depends, status
-from schemas.comments import Comment, CommentCreate, CommentUpdate
+from fastapi import APIRouter, Depends, Query, status
+from pagination import Pagination
+from response_cache import RESPONSE_CACHE
+from responses import render
+from schemas.comments import Comment, CommentCreate, CommentUpdate, ThreadComment
 from schemas.users import User
 from schemas.votes import VoteType
 
@@ -10,46 +14,83 @@ router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/", response_model=list[Comment])
-async def get_comments():
-    return await controller.get_comments()
+async def get_comments(
+    pagination: Pagination = Depends(), db: Session = Depends(get_db)
+):
+    return await RESPONSE_CACHE.respond(
+        "comments",
+        pagination.key,
+        ["comments"],
+        lambda: controller.get_comments(db, pagination),
+        pagination.response,
+    )
 
 
 @router.get("/{comment_id}", response_model=Comment)
-async def get_comment(comment_id: int):
-    return await controller.get_comment(comment_id)
+async def get_comment(comment_id: int, db: Session = Depends(get_db)):
+    return await RESPONSE_CACHE.respond(
+        "comment",
+        str(comment_id),
+        [f"comment:{comment_id}"],
+        lambda: controller.get_comment(db, comment_id),
+    )
+
+
+@router.get("/{comment_id}/thread", response_model=list[ThreadComment])
+async def get_comment_thread(
+    comment_id: int,
+    depth: int | None = Query(None, ge=1, le=controller.COMMENT_MAX_DEPTH),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return render(await controller.get_comment_thread(db, comment_id, user.id, depth))
 
 
 @router.post("/", response_model=Comment, status_code=status.HTTP_201_CREATED)
 async def create_comment(
     comment: CommentCreate,
-    background_tasks: BackgroundTasks,
     user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
-    return await controller.create_comment(comment, background_tasks, user.id)
+    return await controller.create_comment(db, comment, user.id)
 
 
-@router.put("/{comment_id}", dependencies=[Depends(Author)], response_model=Comment)
-async def update_comment(comment_id: int, comment: CommentUpdate):
-    return await controller.update_comment(comment_id, comment)
+@router.put("/{comment_id}", dependencies=[Depends(Author())], response_model=Comment)
+async def update_comment(
+    comment_id: int, comment: CommentUpdate, db: Session = Depends(get_db)
+):
+    return await controller.update_comment(db, comment_id, comment)
 
 
-@router.delete("/{comment_id}", dependencies=[Depends(Author)])
-async def delete_comment(comment_id: int):
-    return await controller.delete_comment(comment_id)
+@router.delete("/{comment_id}", dependencies=[Depends(Author())])
+async def delete_comment(comment_id: int, db: Session = Depends(get_db)):
+    return await controller.delete_comment(db, comment_id)
 
 
 @router.get("/{comment_id}/votes", response_model=int)
-async def get_comment_votes(comment_id: int):
-    return await controller.get_comment_votes(comment_id)
+async def get_comment_votes(comment_id: int, db: Session = Depends(get_db)):
+    return await RESPONSE_CACHE.respond(
+        "comment votes",
+        str(comment_id),
+        [f"comment:{comment_id}:votes"],
+        lambda: controller.get_comment_votes(db, comment_id),
+    )
 
 
 @router.get("/{comment_id}/vote")
-async def get_comment_vote(comment_id: int, user: User = Depends(get_current_user)):
-    return await controller.get_comment_vote(comment_id, user.id)
+async def get_comment_vote(
+    comment_id: int,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return await controller.get_comment_vote(db, comment_id, user.id)
 
 
 @router.post("/{comment_id}/vote", status_code=status.HTTP_201_CREATED)
 async def create_comment_vote(
-    comment_id: int, type: VoteType, user: User = Depends(get_current_user)
+    comment_id: int,
+    type: VoteType,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
-    return await controller.create_comment_vote(comment_id, type, user.id)
+    return await controller.create_comment_vote(db, comment_id, type, user.id)
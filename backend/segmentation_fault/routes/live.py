@@ -0,0 +1,22 @@
+from controllers.auth import authenticate
+from database import session
+from fastapi import APIRouter, HTTPException, WebSocket, status
+from jose import JWTError
+from live import stream
+
+router = APIRouter()
+
+
+@router.websocket("/")
+async def live(websocket: WebSocket, token: str):
+    # Authenticated on a session of its own, rather than one from `get_db`, so that
+    # an open connection does not hold a database connection.
+    try:
+        async with session() as db:
+            await authenticate(db, token)
+    except (HTTPException, JWTError):
+        await websocket.close(status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await stream(websocket)
@@ -1,56 +1,134 @@
 import controllers.posts as controller
 from controllers.auth import get_current_user
-from fastapi import APIRouter, Depends, status
-from schemas.comments import Comment
-from schemas.posts import Post, PostCreate, PostUpdate
+from controllers.comments import COMMENT_MAX_DEPTH, get_post_thread
+from database import Session, get_db
+from dependencies.author import Author
+from fastapi import APIRouter, Depends, Query, status
+from pagination import Pagination, PostOrder, RankedPagination
+from response_cache import RESPONSE_CACHE
+from responses import render
+from schemas.comments import Comment, ThreadComment
+from schemas.posts import FeedPost, Post, PostCreate, PostSort, PostUpdate, SearchResult
 from schemas.users import User
 from schemas.votes import VoteType
+from search import SEARCH_MAX_QUERY_LENGTH
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/", response_model=list[Post])
-async def get_posts():
-    return await controller.get_posts()
+async def get_posts(order: PostOrder = Depends(), db: Session = Depends(get_db)):
+    return await RESPONSE_CACHE.respond(
+        "posts",
+        order.key,
+        ["posts"] if order.sort == PostSort.NEW else ["posts", "posts:ranked"],
+        lambda: controller.get_posts(db, order),
+        order.pagination.response,
+    )
+
+
+@router.get("/feed", response_model=list[FeedPost])
+async def get_feed(
+    order: PostOrder = Depends(),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return render(
+        await controller.get_feed(db, order, user.id), order.pagination.response
+    )
+
+
+@router.get("/search", response_model=list[SearchResult])
+async def search_posts(
+    q: str = Query(min_length=1, max_length=SEARCH_MAX_QUERY_LENGTH),
+    pagination: RankedPagination = Depends(),
+    db: Session = Depends(get_db),
+):
+    return await RESPONSE_CACHE.respond(
+        "post search",
+        f"{q}:{pagination.key}",
+        ["posts", "comments"],
+        lambda: controller.search_posts(db, q, pagination),
+        pagination.response,
+    )
 
 
 @router.get("/{post_id}", response_model=Post)
-async def get_post(post_id: int):
-    return await controller.get_post(post_id)
+async def get_post(post_id: int, db: Session = Depends(get_db)):
+    return await RESPONSE_CACHE.respond(
+        "post",
+        str(post_id),
+        [f"post:{post_id}"],
+        lambda: controller.get_post(db, post_id),
+    )
 
 
 @router.get("/{post_id}/comments", response_model=list[Comment])
-async def get_post_comments(post_id: int):
-    return await controller.get_post_comments(post_id)
+async def get_post_comments(
+    post_id: int, pagination: Pagination = Depends(), db: Session = Depends(get_db)
+):
+    return await RESPONSE_CACHE.respond(
+        "post comments",
+        f"{post_id}:{pagination.key}",
+        [f"post:{post_id}:comments"],
+        lambda: controller.get_post_comments(db, post_id, pagination),
+        pagination.response,
+    )
+
+
+@router.get("/{post_id}/thread", response_model=list[ThreadComment])
+async def get_thread(
+    post_id: int,
+    depth: int | None = Query(None, ge=1, le=COMMENT_MAX_DEPTH),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return render(await get_post_thread(db, post_id, user.id, depth))
 
 
 @router.post("/", response_model=Post, status_code=status.HTTP_201_CREATED)
-async def create_post(post: PostCreate, user: User = Depends(get_current_user)):
-    return await controller.create_post(post, user.id)
+async def create_post(
+    post: PostCreate,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return await controller.create_post(db, post, user.id)
 
 
-@router.put("/{post_id}", response_model=Post)
-async def update_post(post_id: int, post: PostUpdate):
-    return await controller.update_post(post_id, post)
+@router.put("/{post_id}", dependencies=[Depends(Author())], response_model=Post)
+async def update_post(post_id: int, post: PostUpdate, db: Session = Depends(get_db)):
+    return await controller.update_post(db, post_id, post)
 
 
-@router.delete("/{post_id}")
-async def delete_post(post_id: int):
-    return await controller.delete_post(post_id)
+@router.delete("/{post_id}", dependencies=[Depends(Author())])
+async def delete_post(post_id: int, db: Session = Depends(get_db)):
+    return await controller.delete_post(db, post_id)
 
 
 @router.get("/{post_id}/votes", response_model=int)
-async def get_post_votes(post_id: int):
-    return await controller.get_post_votes(post_id)
+async def get_post_votes(post_id: int, db: Session = Depends(get_db)):
+    return await RESPONSE_CACHE.respond(
+        "post votes",
+        str(post_id),
+        [f"post:{post_id}:votes"],
+        lambda: controller.get_post_votes(db, post_id),
+    )
 
 
 @router.get("/{post_id}/vote")
-async def get_post_vote(post_id: int, user: User = Depends(get_current_user)):
-    return await controller.get_post_vote(post_id, user.id)
+async def get_post_vote(
+    post_id: int,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return await controller.get_post_vote(db, post_id, user.id)
 
 
 @router.post("/{post_id}/vote", status_code=status.HTTP_201_CREATED)
 async def create_post_vote(
-    post_id: int, type: VoteType, user: User = Depends(get_current_user)
+    post_id: int,
+    type: VoteType,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
-    return await controller.create_post_vote(post_id, type, user.id)
+    return await controller.create_post_vote(db, post_id, type, user.id)
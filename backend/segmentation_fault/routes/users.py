@@ -1,7 +1,12 @@
 import controllers.users as controller
 from controllers.auth import get_current_user
-from fastapi import APIRouter, Depends, File, status
+from database import Session, get_db
+from fastapi import APIRouter, Depends, File, Header, UploadFile, status
+from images import MAX_IMAGE_UPLOAD_SIZE
+from pagination import Pagination
+from responses import render
 from schemas.users import User, UserCreate, UserUpdate
+from uploads import limited_route
 
 router = APIRouter()
 
@@ -9,53 +14,63 @@ router = APIRouter()
 @router.get(
     "/",
     response_model=list[User],
-    response_model_exclude={"password"},
     dependencies=[Depends(get_current_user)],
 )
-async def get_users():
-    return await controller.get_users()
+async def get_users(pagination: Pagination = Depends(), db: Session = Depends(get_db)):
+    return render(await controller.get_users(db, pagination), pagination.response)
 
 
 @router.get(
     "/{user_id}",
     response_model=User,
-    response_model_exclude={"password"},
     dependencies=[Depends(get_current_user)],
 )
-async def get_user(user_id: int):
-    return await controller.get_user(user_id)
+async def get_user(user_id: int, db: Session = Depends(get_db)):
+    return await controller.get_user(db, user_id)
 
 
 @router.post(
     "/",
     response_model=User,
     status_code=status.HTTP_201_CREATED,
-    response_model_exclude={"password"},
 )
-async def create_user(user: UserCreate):
-    return await controller.create_user(user)
+async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+    return await controller.create_user(db, user)
 
 
 @router.put(
     "/{user_id}",
     response_model=User,
-    response_model_exclude={"password"},
     dependencies=[Depends(get_current_user)],
 )
-async def update_user(user_id: int, user: UserUpdate):
-    return await controller.update_user(user_id, user)
+async def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
+    return await controller.update_user(db, user_id, user)
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_user)])
-async def delete_user(user_id: int):
-    return await controller.delete_user(user_id)
+async def delete_user(user_id: int, db: Session = Depends(get_db)):
+    return await controller.delete_user(db, user_id)
 
 
 @router.get("/{user_id}/image")
-async def get_user_image(user_id: int):
-    return await controller.get_user_image(user_id)
+async def get_user_image(
+    user_id: int,
+    if_none_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    return await controller.get_user_image(db, user_id, if_none_match)
 
 
-@router.post("/{user_id}/image", dependencies=[Depends(get_current_user)])
-async def upload_user_image(user_id: int, image: bytes = File()):
-    return await controller.upload_user_image(user_id, image)
+async def upload_user_image(
+    user_id: int, image: UploadFile = File(), db: Session = Depends(get_db)
+):
+    return await controller.upload_user_image(db, user_id, image)
+
+
+router.add_api_route(
+    "/{user_id}/image",
+    upload_user_image,
+    methods=["POST"],
+    dependencies=[Depends(get_current_user)],
+    route_class_override=limited_route(MAX_IMAGE_UPLOAD_SIZE),
+)
@@ -0,0 +1,23 @@
+from enum import Enum
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class BatchMethod(Enum):
+    GET = "GET"
+    POST = "POST"
+    PUT = "PUT"
+    DELETE = "DELETE"
+
+
+class BatchItem(BaseModel):
+    method: BatchMethod = BatchMethod.GET
+    path: str
+    body: Any = None
+
+
+class BatchResult(BaseModel):
+    status: int
+    headers: dict[str, str]
+    body: Any
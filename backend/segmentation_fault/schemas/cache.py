@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
+
+
+class ResponseCacheStats(BaseModel):
+    hits: int
+    misses: int
+    errors: int
+    hit_ratio: float
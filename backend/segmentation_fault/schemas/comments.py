@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Optional
 
 from pydantic import BaseModel
+from schemas.votes import VoteType
 
 
 class Comment(BaseModel):
@@ -11,11 +12,25 @@ class Comment(BaseModel):
     author: int
     content: str
     post: int
+    parent: Optional[int]
+
+
+class ThreadComment(Comment):
+    upvotes: int
+    downvotes: int
+    score: int
+    reply_count: int
+    vote: VoteType
+    replies: list["ThreadComment"] = []
+
+
+ThreadComment.update_forward_refs()
 
 
 class CommentCreate(BaseModel):
     content: str
     post: int
+    parent: Optional[int] = None
 
 
 class CommentUpdate(BaseModel):
@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+
+
+class PoolStats(BaseModel):
+    min_size: int
+    max_size: int
+    size: int
+    idle: int
+    in_use: int
+    waiting: int
+    checkouts: int
+    timeouts: int
+    reconnects: int
+    average_wait: float
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class LiveStats(BaseModel):
+    subscribers: int
+    topics: int
+    published: int
+    received: int
+    delivered: int
+    overflowed: int
+    polls: int
+    failures: int
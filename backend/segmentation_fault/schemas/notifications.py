@@ -0,0 +1,19 @@
+from enum import Enum
+
+from pydantic import BaseModel
+
+
+class NotificationType(Enum):
+    WELCOME = 0
+    PASSWORD_RESET = 1
+    COMMENT = 2
+
+
+class NotificationStats(BaseModel):
+    batches: int
+    coalesced: int
+    sent: int
+    retried: int
+    failed: int
+    average_latency: float
+    max_latency: float
@@ -1,7 +1,9 @@
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 from pydantic import BaseModel
+from schemas.votes import VoteType
 
 
 class Post(BaseModel):
@@ -13,6 +15,28 @@ class Post(BaseModel):
     content: str
 
 
+class FeedPost(Post):
+    upvotes: int
+    downvotes: int
+    score: int
+    comments: int
+    vote: VoteType
+
+
+class PostSort(Enum):
+    HOT = "hot"
+    TOP = "top"
+    NEW = "new"
+
+
+class TopWindow(Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    YEAR = "year"
+    ALL = "all"
+
+
 class PostCreate(BaseModel):
     title: str
     content: str
@@ -21,3 +45,10 @@ class PostCreate(BaseModel):
 class PostUpdate(BaseModel):
     title: str
     content: str
+
+
+class SearchResult(Post):
+    relevance: float
+    snippet: str
+    highlights: list[tuple[int, int]]
+    comment: Optional[int]
@@ -10,7 +10,6 @@ class User(BaseModel):
     updated: Optional[datetime]
     username: str
     email: str
-    password: str
     super: bool
     first_name: str
     last_name: str
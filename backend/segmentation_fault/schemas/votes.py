@@ -21,3 +21,14 @@ class VoteCreate(BaseModel):
     type: VoteType
     parent_comment: int
     parent_post: int
+
+
+class VoteBufferStats(BaseModel):
+    pending: int
+    buffered: int
+    coalesced: int
+    flushes: int
+    written: int
+    dropped: int
+    failures: int
+    average_flush_time: float
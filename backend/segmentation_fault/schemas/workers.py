@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+
+class WorkerPoolStats(BaseModel):
+    max_workers: int
+    max_queue: int
+    running: int
+    queued: int
+    completed: int
+    rejected: int
+    average_latency: float
+    max_latency: float
@@ -0,0 +1,130 @@
+import bisect
+import re
+from functools import lru_cache
+
+SEARCH_MAX_QUERY_LENGTH = 200
+""" The maximum number of characters in a search query. """
+
+SEARCH_COMMENT_WEIGHT = 0.5
+""" The weight of a post's best matching comment in its relevance, relative to the post itself. """
+
+SNIPPET_LENGTH = 160
+""" The approximate number of characters in a search result's snippet. """
+
+ELLIPSIS = "…"
+""" Marks where a snippet was cut from a longer text. """
+
+
+def against(column: str) -> str:
+    """
+    Returns the expression of the relevance of a `FULLTEXT` indexed column, or
+    columns, to the search query given as its parameter.
+
+    Relevance is InnoDB's ranking, which weighs each term's frequency in the row by
+    how rare it is across the table, and is 0 for rows matching no term.
+
+    Parameters
+    ----------
+        `column` (`str`): the indexed column, or comma-separated columns
+
+    Returns
+    -------
+        `str`: the expression, with one placeholder for the query
+    """
+    return f"MATCH({column}) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+
+
+@lru_cache(maxsize=256)
+def highlighter(query: str) -> re.Pattern | None:
+    """
+    Returns the pattern matching the terms of a search query as whole words, as
+    MySQL splits them, or `None` if it has no terms.
+
+    Parameters
+    ----------
+        `query` (`str`): the search query
+
+    Returns
+    -------
+        `re.Pattern | None`: the pattern
+    """
+    terms = sorted(set(re.findall(r"\w+", query.lower())), key=len, reverse=True)
+    if not terms:
+        return None
+
+    return re.compile(
+        rf"\b(?:{'|'.join(re.escape(term) for term in terms)})\b", re.IGNORECASE
+    )
+
+
+def snippet(
+    text: str, query: str, length: int = SNIPPET_LENGTH
+) -> tuple[str, list[tuple[int, int]]] | None:
+    """
+    Returns the part of a text around its densest cluster of search terms, and
+    where the terms are in it.
+
+    Highlights are given as offsets rather than markup, so a client can render them
+    without escaping the text.
+
+    Parameters
+    ----------
+        `text` (`str`): the text
+        `query` (`str`): the search query
+        `length` (`int`): the approximate number of characters in the snippet
+
+    Returns
+    -------
+        `tuple[str, list[tuple[int, int]]] | None`: the snippet and the start and end
+            offsets of each term in it, or `None` if no term is in the text
+    """
+    if (pattern := highlighter(query)) is None:
+        return None
+
+    text = " ".join(text.split())
+    if not (matches := [match.span() for match in pattern.finditer(text)]):
+        return None
+
+    # Start shortly before whichever match begins the most matches within the length.
+    ends = [end for _, end in matches]
+    best = max(
+        range(len(matches)),
+        key=lambda i: bisect.bisect_right(ends, matches[i][0] + length) - i,
+    )
+    start = max(0, matches[best][0] - length // 4)
+    if start and (space := text.rfind(" ", 0, start)) != -1:
+        start = space + 1
+    end = min(len(text), start + length)
+    if end < len(text) and (space := text.rfind(" ", start, end)) > start:
+        end = space
+
+    prefix = ELLIPSIS if start else ""
+    suffix = ELLIPSIS if end < len(text) else ""
+    highlights = [
+        (match_start - start + len(prefix), match_end - start + len(prefix))
+        for match_start, match_end in matches
+        if match_start >= start and match_end <= end
+    ]
+
+    return prefix + text[start:end] + suffix, highlights
+
+
+def excerpt(text: str, length: int = SNIPPET_LENGTH) -> str:
+    """
+    Returns the start of a text, for a search result whose text holds no terms.
+
+    Parameters
+    ----------
+        `text` (`str`): the text
+        `length` (`int`): the approximate number of characters in the excerpt
+
+    Returns
+    -------
+        `str`: the excerpt
+    """
+    text = " ".join(text.split())
+    if len(text) <= length:
+        return text
+
+    end = text.rfind(" ", 0, length)
+    return text[: end if end > 0 else length] + ELLIPSIS
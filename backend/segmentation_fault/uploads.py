@@ -0,0 +1,69 @@
+from typing import Callable, Coroutine
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from starlette.types import Message
+
+FORM_OVERHEAD = 64 * 1024
+""" The number of bytes an upload's body may hold beyond its file, for the multipart boundaries, part headers and any other fields. """
+
+
+def limited_route(max_size: int) -> type[APIRoute]:
+    """
+    Returns a route class which rejects requests whose body is larger than a file of
+    the given size, before the form is parsed.
+
+    FastAPI parses a form, spooling its files to disk, before the route or any of its
+    dependencies run, so a size checked there is only checked once the whole body has
+    been received. Requests declaring a larger `Content-Length` are rejected before
+    any of the body is read, and those sent without one are rejected once they have
+    sent too much.
+
+    Parameters
+    ----------
+        `max_size` (`int`): the maximum size, in bytes, of an uploaded file
+
+    Returns
+    -------
+        `type[APIRoute]`: the route class
+    """
+    limit = max_size + FORM_OVERHEAD
+
+    class LimitedRoute(APIRoute):
+        def get_route_handler(self) -> Callable[[Request], Coroutine]:
+            handler = super().get_route_handler()
+
+            async def limited(request: Request) -> Response:
+                length = request.headers.get("content-length")
+                if length is not None and (not length.isdigit() or int(length) > limit):
+                    raise too_large()
+
+                received = 0
+
+                async def receive() -> Message:
+                    nonlocal received
+                    message = await request.receive()
+                    if message["type"] == "http.request":
+                        received += len(message.get("body", b""))
+                        if received > limit:
+                            raise too_large()
+                    return message
+
+                return await handler(Request(request.scope, receive))
+
+            return limited
+
+    return LimitedRoute
+
+
+def too_large() -> HTTPException:
+    """
+    Returns the error a request whose body is too large is rejected with.
+
+    Returns
+    -------
+        `HTTPException`: the error
+    """
+    return HTTPException(
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload is too large"
+    )
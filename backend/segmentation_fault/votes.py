@@ -0,0 +1,409 @@
+import asyncio
+import logging
+import time
+from os import getenv
+
+from database import Session, placeholders, session
+from live import LIVE_BROKER
+from metrics import track
+from mysql.connector import DataError, IntegrityError
+from response_cache import RESPONSE_CACHE
+from schemas.votes import VoteBufferStats, VoteType
+
+LOGGER = logging.getLogger(__name__)
+
+VOTE_FLUSH_INTERVAL = float(getenv("VOTE_FLUSH_INTERVAL", 0.25))
+""" The maximum number of seconds a vote is buffered for before it is written. """
+
+VOTE_BUFFER_SIZE = int(getenv("VOTE_BUFFER_SIZE", 500))
+""" The number of buffered votes at which they are written without waiting for the interval. """
+
+VOTE_MAX_ATTEMPTS = int(getenv("VOTE_MAX_ATTEMPTS", 5))
+""" The number of failed writes after which a buffered vote is dropped. """
+
+VOTE_ERRORS = (DataError, IntegrityError)
+""" The errors raised by a vote which cannot be written, rather than by the database failing. """
+
+VOTE_PARENTS = {
+    "post": ("parent_post", "Posts", "id"),
+    "comment": ("parent_comment", "Comments", "post"),
+}
+""" The `Votes` column, table and column of the post of each kind of thing that can be voted on. """
+
+VoteKey = tuple[str, int, int]
+""" A vote's parent kind, a key of `VOTE_PARENTS`, parent ID and user ID. """
+
+
+class VoteBuffer:
+    """
+    Buffers votes in a server worker, and writes them behind in batches.
+
+    Only the latest vote of each user on each post or comment is kept, so a user
+    toggling their vote repeatedly costs one write, or none if they end where they
+    started. Votes are written every `VOTE_FLUSH_INTERVAL` seconds, or as soon as
+    `VOTE_BUFFER_SIZE` are buffered, with a handful of multi-row statements per kind
+    of parent in one transaction.
+
+    A user's vote is read from the buffer until it is written, but only by the worker
+    buffering it, and the parent's counters lag behind by up to the interval. Votes
+    buffered when a worker dies are lost, as are those which fail to be written
+    `VOTE_MAX_ATTEMPTS` times, or which cannot be written at all.
+    """
+
+    def __init__(self):
+        self._pending: dict[VoteKey, VoteType] = {}
+        self._flushing: dict[VoteKey, VoteType] = {}
+        self._attempts: dict[VoteKey, int] = {}
+        self._task: asyncio.Task | None = None
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._buffered = 0
+        self._coalesced = 0
+        self._flushes = 0
+        self._written = 0
+        self._dropped = 0
+        self._failures = 0
+        self._flush_time = 0.0
+
+    def start(self) -> None:
+        """Starts writing buffered votes in the background."""
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Stops writing in the background, once every buffered vote is written.
+
+        Parameters
+        ----------
+            `timeout` (`float`): the number of seconds to wait for the final write
+        """
+        if self._task is None:
+            return
+
+        self._stopping.set()
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            LOGGER.warning("Lost %d buffered votes", len(self._pending))
+        self._task = None
+
+    def set(self, parent: str, parent_id: int, user_id: int, type: VoteType) -> None:
+        """
+        Buffers a user's vote on a post or comment, replacing any buffered before.
+
+        Parameters
+        ----------
+            `parent` (`str`): the kind of thing being voted on, a key of `VOTE_PARENTS`
+            `parent_id` (`int`): the ID of the post or comment
+            `user_id` (`int`): the ID of the user
+            `type` (`VoteType`): the vote
+        """
+        key = (parent, parent_id, user_id)
+        self._buffered += 1
+        self._coalesced += key in self._pending
+        self._pending[key] = type
+
+        if len(self._pending) >= VOTE_BUFFER_SIZE:
+            self._wake.set()
+
+    def get(self, parent: str, parent_id: int, user_id: int) -> VoteType | None:
+        """
+        Returns a user's buffered vote on a post or comment.
+
+        Parameters
+        ----------
+            `parent` (`str`): the kind of thing voted on, a key of `VOTE_PARENTS`
+            `parent_id` (`int`): the ID of the post or comment
+            `user_id` (`int`): the ID of the user
+
+        Returns
+        -------
+            `VoteType | None`: the vote, or `None` if none is buffered
+        """
+        key = (parent, parent_id, user_id)
+        return self._pending.get(key, self._flushing.get(key))
+
+    async def flush(self, db: Session) -> int:
+        """
+        Writes every buffered vote, adjusts the counters of their parents, and
+        publishes the changes to them. Once written, invalidates the cached scores
+        of those whose scores changed, and the cached rankings of posts if any
+        post's did.
+
+        If a vote cannot be written, the batch is split and its halves written apart
+        until the vote is found and dropped. If the database fails, the votes not
+        yet written are buffered again unless newer ones replaced them meanwhile, or
+        dropped once they have failed `VOTE_MAX_ATTEMPTS` times, and the error is
+        raised once those written are invalidated.
+
+        Parameters
+        ----------
+            `db` (`Session`): the database session
+
+        Returns
+        -------
+            `int`: the number of votes written
+        """
+        async with self._lock:
+            if not self._pending:
+                return 0
+
+            self._flushing, self._pending = self._pending, {}
+            started = time.perf_counter()
+            batches = [dict(self._flushing)]
+            written, rescored, ranked, error = 0, [], False, None
+            try:
+                while batches:
+                    votes = batches.pop()
+                    try:
+                        with track("vote_flush"):
+                            batch_written, batch_rescored = await self._write_batch(
+                                db, votes
+                            )
+                    except Exception as exception:
+                        self._failures += 1
+                        if isinstance(exception, VOTE_ERRORS) and len(votes) > 1:
+                            items = list(votes.items())
+                            batches += [
+                                dict(items[: len(items) // 2]),
+                                dict(items[len(items) // 2 :]),
+                            ]
+                        elif isinstance(exception, VOTE_ERRORS):
+                            self._drop(votes, exception)
+                        else:
+                            for batch in (votes, *batches):
+                                self._retry(batch, exception)
+                            batches, error = [], exception
+                        continue
+
+                    for key in votes:
+                        self._attempts.pop(key, None)
+                    written += batch_written
+                    rescored += batch_rescored
+                    ranked = ranked or any(
+                        key.startswith("post:") for key in batch_rescored
+                    )
+            finally:
+                self._flushing = {}
+
+            self._flushes += 1
+            self._written += written
+            self._flush_time += time.perf_counter() - started
+
+        if rescored:
+            await RESPONSE_CACHE.invalidate(
+                *rescored, *(["posts:ranked"] if ranked else [])
+            )
+
+        if error is not None:
+            raise error
+
+        return written
+
+    def stats(self) -> VoteBufferStats:
+        """
+        Returns a snapshot of the buffer and the writes made from it.
+
+        Returns
+        -------
+            `VoteBufferStats`: the buffer's statistics
+        """
+        return VoteBufferStats(
+            pending=len(self._pending),
+            buffered=self._buffered,
+            coalesced=self._coalesced,
+            flushes=self._flushes,
+            written=self._written,
+            dropped=self._dropped,
+            failures=self._failures,
+            average_flush_time=self._flush_time / self._flushes
+            if self._flushes
+            else 0.0,
+        )
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), VOTE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            # Checked before flushing, so that votes buffered while stopping are
+            # written by one last flush.
+            stopping = self._stopping.is_set()
+            try:
+                async with session() as db:
+                    await self.flush(db)
+            except Exception:
+                LOGGER.exception("Failed to write buffered votes")
+
+    async def _write_batch(
+        self, db: Session, votes: dict[VoteKey, VoteType]
+    ) -> tuple[int, list[str]]:
+        async with db.transaction():
+            written, rescored, events = 0, [], []
+            for parent in VOTE_PARENTS:
+                parent_written, changes = await self._write(db, parent, votes)
+                written += parent_written
+                for id, (post, upvotes, downvotes) in changes.items():
+                    events.append(vote_event(parent, id, post, upvotes, downvotes))
+                    if upvotes != downvotes:
+                        rescored.append(f"{parent}:{id}:votes")
+            await LIVE_BROKER.publish(db, events)
+
+        return written, rescored
+
+    def _retry(self, votes: dict[VoteKey, VoteType], error: Exception) -> None:
+        retried, dropped = {}, 0
+        for key, type in votes.items():
+            if key in self._pending:
+                # Replaced by a newer vote, which is written afresh instead.
+                self._attempts.pop(key, None)
+                continue
+
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts >= VOTE_MAX_ATTEMPTS:
+                self._attempts.pop(key, None)
+                dropped += 1
+            else:
+                self._attempts[key] = attempts
+                retried[key] = type
+
+        self._pending = retried | self._pending
+        if dropped:
+            self._dropped += dropped
+            LOGGER.warning(
+                "Dropped %d votes which failed to be written %d times: %s",
+                dropped,
+                VOTE_MAX_ATTEMPTS,
+                error,
+            )
+
+    def _drop(self, votes: dict[VoteKey, VoteType], error: Exception) -> None:
+        for key in votes:
+            self._attempts.pop(key, None)
+        self._dropped += len(votes)
+        LOGGER.warning("Dropped votes %s which cannot be written: %s", votes, error)
+
+    async def _write(
+        self, db: Session, parent: str, batch: dict[VoteKey, VoteType]
+    ) -> tuple[int, dict[int, tuple[int, int, int]]]:
+        column, table, post = VOTE_PARENTS[parent]
+        votes = {
+            (parent_id, user_id): type
+            for (kind, parent_id, user_id), type in batch.items()
+            if kind == parent
+        }
+        if not votes:
+            return 0, {}
+
+        # Lock the parents in ID order, so that workers writing votes on the same
+        # posts or comments take turns rather than deadlock, and drop votes on those
+        # deleted since.
+        parent_ids = sorted({parent_id for parent_id, _ in votes})
+        existing = {
+            row["id"]: row["post"]
+            for row in await db.fetch_all(
+                f"SELECT id, {post} AS post FROM {table} WHERE id IN ({placeholders(parent_ids)}) ORDER BY id FOR UPDATE",
+                tuple(parent_ids),
+            )
+        }
+        if dropped := [key for key in votes if key[0] not in existing]:
+            self._dropped += len(dropped)
+            for key in dropped:
+                del votes[key]
+            if not votes:
+                return 0, {}
+
+        keys = [value for key in votes for value in key]
+        previous = {
+            (row["parent"], row["user"]): VoteType(row["type"])
+            for row in await db.fetch_all(
+                f"SELECT {column} AS parent, user, type FROM Votes WHERE ({column}, user) IN ({', '.join(['(%s, %s)'] * len(votes))}) FOR UPDATE",
+                tuple(keys),
+            )
+        }
+
+        upserts, deletes, deltas = [], [], {}
+        for (parent_id, user_id), type in votes.items():
+            was = previous.get((parent_id, user_id), VoteType.NULL)
+            if was == type:
+                continue
+
+            if type == VoteType.NULL:
+                deletes += (parent_id, user_id)
+            else:
+                upserts += (parent_id, user_id, type.value)
+
+            upvotes, downvotes = deltas.get(parent_id, (0, 0))
+            deltas[parent_id] = (
+                upvotes + (type == VoteType.UP) - (was == VoteType.UP),
+                downvotes + (type == VoteType.DOWN) - (was == VoteType.DOWN),
+            )
+
+        if upserts:
+            await db.execute(
+                f"INSERT INTO Votes ({column}, user, type) VALUES {', '.join(['(%s, %s, %s)'] * (len(upserts) // 3))} AS new ON DUPLICATE KEY UPDATE type = new.type",
+                tuple(upserts),
+            )
+        if deletes:
+            await db.execute(
+                f"DELETE FROM Votes WHERE ({column}, user) IN ({', '.join(['(%s, %s)'] * (len(deletes) // 2))})",
+                tuple(deletes),
+            )
+
+        if deltas := {id: delta for id, delta in deltas.items() if delta != (0, 0)}:
+            await db.execute(
+                f"UPDATE {table} JOIN ({' UNION ALL '.join(['SELECT %s AS id, %s AS upvotes, %s AS downvotes'] * len(deltas))}) AS delta ON delta.id = {table}.id SET {table}.upvotes = {table}.upvotes + delta.upvotes, {table}.downvotes = {table}.downvotes + delta.downvotes, {table}.score = {table}.score + delta.upvotes - delta.downvotes",
+                tuple(value for id, delta in deltas.items() for value in (id, *delta)),
+            )
+
+        return (len(upserts) // 3) + (len(deletes) // 2), {
+            id: (existing[id], *delta) for id, delta in deltas.items()
+        }
+
+
+def vote_event(
+    parent: str, id: int, post: int, upvotes: int, downvotes: int
+) -> tuple[list[str], dict]:
+    """
+    Returns the live event of a change to the vote counters of a post or comment.
+
+    Parameters
+    ----------
+        `parent` (`str`): the kind of thing voted on, a key of `VOTE_PARENTS`
+        `id` (`int`): the ID of the post or comment
+        `post` (`int`): the ID of the post, or of the post of the comment
+        `upvotes` (`int`): the change in its upvotes
+        `downvotes` (`int`): the change in its downvotes
+
+    Returns
+    -------
+        `tuple[list[str], dict]`: the topics of the event and the event
+    """
+    if parent == "post":
+        return ["feed", f"post:{id}"], {
+            "event": "post.voted",
+            "post": id,
+            "upvotes": upvotes,
+            "downvotes": downvotes,
+        }
+
+    return [f"post:{post}"], {
+        "event": "comment.voted",
+        "comment": id,
+        "post": post,
+        "upvotes": upvotes,
+        "downvotes": downvotes,
+    }
+
+
+VOTE_BUFFER = VoteBuffer()
+""" The vote buffer of this worker. """
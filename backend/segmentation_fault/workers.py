@@ -0,0 +1,114 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, TypeVar
+
+from schemas.workers import WorkerPoolStats
+
+T = TypeVar("T")
+
+WORKER_POOLS: dict[str, "WorkerPool"] = {}
+""" Every worker pool in this process, by name. """
+
+
+class WorkerPoolFull(Exception):
+    """Raised when a worker pool's queue is full."""
+
+
+class WorkerPool:
+    """
+    A bounded pool of processes for CPU-bound work, so that it neither blocks the
+    event loop nor contends for the GIL with request handling.
+
+    Processes are spawned rather than forked, as forking a process running
+    threads is unsafe, and are only started on first use. Submitted functions must
+    be importable at module level.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        """
+        Parameters
+        ----------
+            `name` (`str`): the name to report the pool's statistics under
+            `max_workers` (`int`): the number of processes
+            `max_queue` (`int`): the number of calls which may wait for a process
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latency = 0.0
+        self._max_latency = 0.0
+
+        WORKER_POOLS[name] = self
+
+    async def run(self, function: Callable[..., T], *args) -> T:
+        """
+        Runs a function in one of the pool's processes.
+
+        Parameters
+        ----------
+            `function` (`Callable[..., T]`): the function to run
+            `args`: the arguments to the function
+
+        Raises
+        ------
+            `WorkerPoolFull`: if `max_queue` calls are already waiting for a process
+
+        Returns
+        -------
+            `T`: the function's result
+        """
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            raise WorkerPoolFull(f"The {self.name} worker pool is full")
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(function, *args)
+            )
+        finally:
+            latency = time.perf_counter() - started
+            self._in_flight -= 1
+            self._completed += 1
+            self._latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+    def close(self) -> None:
+        """Stops the pool's processes once their current work is done."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> WorkerPoolStats:
+        """
+        Returns a snapshot of the pool's load.
+
+        Returns
+        -------
+            `WorkerPoolStats`: the pool's statistics
+        """
+        return WorkerPoolStats(
+            max_workers=self.max_workers,
+            max_queue=self.max_queue,
+            running=min(self._in_flight, self.max_workers),
+            queued=max(self._in_flight - self.max_workers, 0),
+            completed=self._completed,
+            rejected=self._rejected,
+            average_latency=self._latency / self._completed if self._completed else 0.0,
+            max_latency=self._max_latency,
+        )
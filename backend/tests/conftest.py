@@ -0,0 +1,64 @@
+"""
+Runs the tests against the server's modules, and those needing a database against
+one of their own.
+
+Set `TEST_DB_NAME` to a database the tests may drop and recreate, on the server of
+`DB_HOST`, as a `DB_USER` allowed to create it. Tests needing a database are
+skipped without it.
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import mysql.connector
+import pytest
+from dotenv import load_dotenv
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+SCHEMA = BACKEND.parent / "segmentation_fault.sql"
+""" The schema migrations start from. """
+
+load_dotenv(BACKEND / ".env")
+if os.getenv("TEST_DB_NAME"):
+    # Before the pool is created with it.
+    os.environ["DB_NAME"] = os.environ["TEST_DB_NAME"]
+
+sys.path.insert(0, str(BACKEND / "segmentation_fault"))
+sys.path.insert(0, str(BACKEND / "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def database() -> Iterator[str]:
+    """Creates an empty test database with the schema before any migration."""
+    if not (name := os.getenv("TEST_DB_NAME")):
+        pytest.skip("TEST_DB_NAME is not set")
+
+    try:
+        connection = mysql.connector.connect(
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+        )
+    except mysql.connector.Error as error:
+        pytest.skip(f"The database server is unavailable: {error}")
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+        cursor.execute(f"CREATE DATABASE `{name}`")
+        cursor.execute(f"USE `{name}`")
+        for statement in SCHEMA.read_text().split(";"):
+            if statement.strip():
+                cursor.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+    yield name
+
+    from database import pool
+
+    pool.close()
@@ -0,0 +1,93 @@
+"""
+Checks that the current user is served from a valid access token, on its own and
+within a batch.
+"""
+
+import contextlib
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+SECRET_KEY = "test-secret"
+""" The key access tokens are signed with in the tests. """
+
+USER = {
+    "id": 1,
+    "created": datetime.datetime(2023, 1, 1),
+    "updated": None,
+    "username": "tester",
+    "email": "tester@example.com",
+    "super": False,
+    "first_name": "Test",
+    "last_name": "User",
+    "verified": True,
+}
+""" The user the access token is issued to. """
+
+
+@pytest.fixture
+def client(monkeypatch) -> TestClient:
+    import app
+    import controllers.auth as auth
+    import routes.batch as batch
+    from database import get_db
+    from repository import from_row
+    from schemas.users import User
+
+    async def get_user_by_username(db, username: str) -> User | None:
+        return from_row(User, USER) if username == USER["username"] else None
+
+    @contextlib.asynccontextmanager
+    async def session():
+        yield None
+
+    async def db():
+        yield None
+
+    monkeypatch.setattr(auth, "SECRET_KEY", SECRET_KEY)
+    monkeypatch.setattr(auth, "ALGORITHM", "HS256")
+    monkeypatch.setattr(auth, "get_user_by_username", get_user_by_username)
+    monkeypatch.setattr(batch, "session", session)
+    monkeypatch.setitem(app.app.dependency_overrides, get_db, db)
+
+    # Not entered as a context manager, so the startup handlers, which need a
+    # database, do not run.
+    return TestClient(app.app)
+
+
+@pytest.fixture
+def headers() -> dict[str, str]:
+    from jose import jwt
+
+    token = jwt.encode(
+        {
+            "sub": USER["username"],
+            "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=5),
+        },
+        SECRET_KEY,
+        algorithm="HS256",
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_get_current_user(client, headers):
+    response = client.get("/auth/", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["username"] == USER["username"]
+
+
+def test_get_current_user_without_token(client):
+    assert client.get("/auth/").status_code == 401
+
+
+def test_get_current_user_in_batch(client, headers):
+    response = client.post(
+        "/batch", json=[{"method": "GET", "path": "/auth/"}], headers=headers
+    )
+
+    assert response.status_code == 200
+    [result] = response.json()
+    assert result["status"] == 200
+    assert result["body"]["username"] == USER["username"]
@@ -0,0 +1,46 @@
+"""
+Checks that no statement the controllers execute scans a whole table, as
+`python segmentation_fault explain` reports, against a seeded dataset.
+"""
+
+import argparse
+import asyncio
+
+import pytest
+
+DATASET = argparse.Namespace(
+    users=500, posts=2000, comments=8000, votes=20000, days=30, seed=0, reset=False
+)
+""" The dataset seeded, large enough that the optimizer prefers indexes to scans. """
+
+
+@pytest.fixture(scope="module")
+def plans(database) -> list[tuple[str, list[dict]]]:
+    import load
+    from commands.explain import explain_statements
+    from passwords import PASSWORD_POOL
+
+    load.seed(DATASET)
+    try:
+        return asyncio.run(explain_statements())
+    finally:
+        PASSWORD_POOL.close()
+
+
+def test_statements_are_explained(plans):
+    statements = " ".join(statement for statement, _ in plans)
+    for table in ("Users", "Posts", "Comments", "Votes", "Tokens", "Notifications"):
+        assert table in statements
+
+
+def test_no_statement_scans_a_whole_table(plans):
+    from commands.explain import full_scans
+
+    scans = {
+        " ".join(statement.split()): scanned
+        for statement, plan in plans
+        if (scanned := full_scans(plan))
+    }
+    assert not scans, "\n".join(
+        f"{', '.join(tables)}: {statement}" for statement, tables in scans.items()
+    )
@@ -2,6 +2,7 @@ import { internaliseDate } from ".";
 import { getCurrentUser } from "../auth";
 import { getPostVote, getPostVotes } from "../posts";
 import {
+    FeedPostExternal,
     Post,
     PostCreate,
     PostCreateExternal,
@@ -23,6 +24,19 @@ export async function internalisePost(post: PostExternal): Promise<Post> {
     };
 }
 
+export function internaliseFeedPost(post: FeedPostExternal): Post {
+    return {
+        id: post.id,
+        created: new Date(post.created),
+        updated: internaliseDate(post.updated),
+        author: post.author,
+        title: post.title,
+        content: post.content,
+        votes: post.score,
+        vote: JSON.parse(post.vote),
+    };
+}
+
 export function externalisePostCreate(postCreate: PostCreate): PostCreateExternal {
     return {
         title: postCreate.title,
@@ -1,14 +1,27 @@
 import { get, httpDelete, post as httpPost, put } from ".";
-import { externalisePostUpdate, internaliseComment, internalisePost } from "./conversions";
-import { Comment, CommentExternal, Post, PostCreate, PostExternal, PostUpdate } from "./schemas";
+import {
+    externalisePostUpdate,
+    internaliseComment,
+    internaliseFeedPost,
+    internalisePost,
+} from "./conversions";
+import {
+    Comment,
+    CommentExternal,
+    FeedPostExternal,
+    Post,
+    PostCreate,
+    PostExternal,
+    PostUpdate,
+} from "./schemas";
 
 const ROUTE_PREFIX = "/posts";
 
 export async function getPosts(): Promise<Post[]> {
-    const [status, posts] = await get<PostExternal[]>(`${ROUTE_PREFIX}/`);
+    const [status, posts] = await get<FeedPostExternal[]>(`${ROUTE_PREFIX}/feed`);
 
     if (status === 200) {
-        return await Promise.all(posts.map(internalisePost));
+        return posts.map(internaliseFeedPost);
     } else {
         throw new Error("Unknown error");
     }
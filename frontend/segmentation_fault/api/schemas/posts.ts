@@ -28,6 +28,14 @@ export interface PostExternal {
     content: string;
 }
 
+export interface FeedPostExternal extends PostExternal {
+    upvotes: number;
+    downvotes: number;
+    score: number;
+    comments: number;
+    vote: string;
+}
+
 export interface PostUpdate {
     title: string;
     content: string;